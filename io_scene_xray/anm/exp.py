@@ -1,12 +1,15 @@
 import io
+import os
+
 import bpy
 from ..xray_io import ChunkedWriter, PackedWriter
 from .fmt import Chunks
-from ..xray_envelope import export_envelope, EPSILON
-from ..utils import smooth_euler, AppError
+from ..xray_envelope import export_envelope, export_envelope_samples, EPSILON
+from ..xray_math import decompose_matrices
+from ..bake import ObjectEvaluator
 
 
-def _export(bpy_obj, chunked_writer):
+def _export(bpy_obj, chunked_writer, baked=None):
     packed_writer = PackedWriter()
     bpy_act = bpy_obj.animation_data.action
     packed_writer.puts('')
@@ -15,47 +18,75 @@ def _export(bpy_obj, chunked_writer):
     fps = bpy_act.xray.fps
     packed_writer.putf('fH', fps, 5)
     if bpy_act.xray.autobake_effective(bpy_obj):
-        baked_action = bpy.data.actions.new('')
-        try:
-            _bake_to_action(bpy_obj, baked_action, frange)
-            _export_action_data(packed_writer, bpy_act.xray, baked_action.fcurves)
-        finally:
-            bpy.data.actions.remove(baked_action, do_unlink=True)
+        if baked is None:
+            baked = _bake_matrices((bpy_obj, ))[0]
+        _export_baked_data(packed_writer, bpy_act.xray, int(frange[0]), baked)
     else:
         assert bpy_obj.rotation_mode == 'YXZ', 'Animation: rotation mode must be \'YXZ\''
         _export_action_data(packed_writer, bpy_act.xray, bpy_act.fcurves)
     chunked_writer.put(Chunks.MAIN, packed_writer)
 
 
-def _bake_to_action(bobject, action, frange):
-    old_frame = bpy.context.scene.frame_current
-    try:
-        group_name = 'LocRot'
-        fc_trn = [
-            action.fcurves.new('location', 0, group_name),
-            action.fcurves.new('location', 1, group_name),
-            action.fcurves.new('location', 2, group_name),
-        ]
-        fc_rot = [
-            action.fcurves.new('rotation_euler', 0, group_name),
-            action.fcurves.new('rotation_euler', 1, group_name),
-            action.fcurves.new('rotation_euler', 2, group_name)
-        ]
-        prev_rot = None
-        for frm in range(int(frange[0]), int(frange[1]) + 1):
-            bpy.context.scene.frame_set(frm)
-            bpy.context.scene.update()
-            mat = bobject.matrix_world
-            trn = mat.to_translation()
-            rot = mat.to_euler('YXZ')
-            if prev_rot:
-                smooth_euler(rot, prev_rot)
-            prev_rot = rot
-            for i in range(3):
-                fc_trn[i].keyframe_points.insert(frm, trn[i]).interpolation = 'LINEAR'
-                fc_rot[i].keyframe_points.insert(frm, rot[i]).interpolation = 'LINEAR'
-    finally:
-        bpy.context.scene.frame_set(old_frame)
+def _bake_matrices(bpy_objs):
+    """
+    Samples `matrix_world` of the objects over their actions frame ranges.
+    Returns a flat (frames x 16) list of matrices per object.
+    The self-contained animations are evaluated analytically, the rest ones
+    are sampled in a single pass over the timeline.
+    """
+    result = []
+    scene_sampled = []
+    for bpy_obj in bpy_objs:
+        action = bpy_obj.animation_data.action
+        frange = action.frame_range
+        frames = range(int(frange[0]), int(frange[1]) + 1)
+        data = []
+        result.append(data)
+        evaluator = ObjectEvaluator.create(bpy_obj, action)
+        if evaluator is None:
+            scene_sampled.append((bpy_obj, frames, data))
+            continue
+        for frm in frames:
+            _put_matrix(data, evaluator.evaluate(frm))
+
+    if scene_sampled:
+        scene = bpy.context.scene
+        old_frame = scene.frame_current
+        first = min(frames[0] for _, frames, _ in scene_sampled)
+        last = max(frames[-1] for _, frames, _ in scene_sampled)
+        try:
+            for frm in range(first, last + 1):
+                scene.frame_set(frm)
+                scene.update()
+                for bpy_obj, frames, data in scene_sampled:
+                    if frames[0] <= frm <= frames[-1]:
+                        _put_matrix(data, bpy_obj.matrix_world)
+        finally:
+            scene.frame_set(old_frame)
+    return result
+
+
+def _put_matrix(data, mat):
+    for row in mat:
+        data.extend(row)
+
+
+def _export_baked_data(pkw, xray, frame_start, matrices):
+    locations, rotations = decompose_matrices(matrices, 'YXZ')
+    curves = (
+        locations[0],
+        locations[2],
+        locations[1],
+        [-value for value in rotations[2]],
+        [-value for value in rotations[0]],
+        [-value for value in rotations[1]],
+    )
+    times = [(frame_start + frm) / xray.fps for frm in range(len(matrices) // 16)]
+    for i, curve in enumerate(curves):
+        epsilon = EPSILON
+        if xray.autobake_custom_refine:
+            epsilon = xray.autobake_refine_location if i < 3 else xray.autobake_refine_rotation
+        export_envelope_samples(pkw, times, curve, epsilon=epsilon)
 
 
 def _export_action_data(pkw, xray, fcurves):
@@ -77,3 +108,20 @@ def export_file(bpy_obj, fpath):
         writer = ChunkedWriter()
         _export(bpy_obj, writer)
         file.write(writer.data)
+
+
+def export_files(bpy_objs, directory):
+    """Exports each object to '<directory>/<object name>.anm', baking them in one pass"""
+    baked_objs = [
+        bpy_obj for bpy_obj in bpy_objs
+        if bpy_obj.animation_data.action.xray.autobake_effective(bpy_obj)
+    ]
+    baked = dict(zip(baked_objs, _bake_matrices(baked_objs)))
+    for bpy_obj in bpy_objs:
+        name = bpy_obj.name
+        if not name.lower().endswith('.anm'):
+            name += '.anm'
+        with io.open(os.path.join(directory, name), 'wb') as file:
+            writer = ChunkedWriter()
+            _export(bpy_obj, writer, baked.get(bpy_obj))
+            file.write(writer.data)
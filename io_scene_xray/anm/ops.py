@@ -63,3 +63,40 @@ class OpExportAnm(bpy.types.Operator, FilenameExtHelper):
             self.report({'ERROR'}, 'Object \'{}\' has no animation data'.format(obj.name))
             return {'CANCELLED'}
         export_file(obj, self.filepath)
+
+
+@registry.module_thing
+class OpExportAnms(bpy.types.Operator):
+    bl_idname = 'xray_export.anms'
+    bl_label = 'Export selected .anm-s'
+    bl_description = 'Exports X-Ray animations of the selected objects'
+
+    objects = bpy.props.StringProperty(options={'HIDDEN'})
+
+    directory = bpy.props.StringProperty(subtype='DIR_PATH')
+
+    @execute_with_logger
+    @set_cursor_state
+    def execute(self, context):
+        from .exp import export_files
+
+        objs = []
+        for name in self.objects.split(','):
+            obj = context.scene.objects[name]
+            if not (obj.animation_data and obj.animation_data.action):
+                raise AppError('Object \'{}\' has no animation data'.format(obj.name))
+            objs.append(obj)
+        export_files(objs, self.directory)
+        return {'FINISHED'}
+
+    def invoke(self, context, _event):
+        objs = [
+            obj for obj in context.selected_objects
+            if obj.animation_data and obj.animation_data.action
+        ]
+        if not objs:
+            self.report({'ERROR'}, 'No animated objects selected')
+            return {'CANCELLED'}
+        self.objects = ','.join(obj.name for obj in objs)
+        context.window_manager.fileselect_add(self)
+        return {'RUNNING_MODAL'}
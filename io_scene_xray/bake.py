@@ -0,0 +1,317 @@
+import re
+
+from mathutils import Matrix, Euler, Quaternion
+
+
+_POSE_PATH = re.compile(
+    r'^pose\.bones\["(.+)"\]\.(location|rotation_euler|rotation_quaternion|scale)$'
+)
+_OBJECT_PATHS = ('location', 'rotation_euler', 'rotation_quaternion', 'scale')
+
+
+def _is_animated(bpy_obj):
+    anim = bpy_obj.animation_data
+    if anim is None:
+        return False
+    return bool(anim.action or anim.drivers or anim.nla_tracks)
+
+
+def _is_static_object(bpy_obj):
+    while bpy_obj is not None:
+        if _is_animated(bpy_obj) or bpy_obj.constraints:
+            return False
+        bpy_obj = bpy_obj.parent
+    return True
+
+
+def _has_static_parents(bpy_obj):
+    return (bpy_obj.parent is None) or _is_static_object(bpy_obj.parent)
+
+
+def _has_extra_animation(bpy_obj):
+    anim = bpy_obj.animation_data
+    if anim is None:
+        return False
+    if anim.drivers:
+        return True
+    for track in anim.nla_tracks:
+        if not track.mute:
+            return True
+    return False
+
+
+def _loc_rot_scale(loc, rot, scale):
+    return Matrix.Translation(loc) * rot.to_matrix().to_4x4() \
+        * Matrix.Scale(scale[0], 4, (1, 0, 0)) \
+        * Matrix.Scale(scale[1], 4, (0, 1, 0)) \
+        * Matrix.Scale(scale[2], 4, (0, 0, 1))
+
+
+def _is_supported_constraint(con):
+    if con.type not in ('COPY_ROTATION', 'COPY_LOCATION', 'CHILD_OF'):
+        return con.mute
+    if con.mute:
+        return True
+    if (not con.is_valid) or (con.influence != 1.0) or (con.target is None):
+        return False
+    if (con.owner_space != 'WORLD') or (con.target_space != 'WORLD'):
+        return False
+    if con.type == 'COPY_ROTATION':
+        return con.use_x and con.use_y and con.use_z \
+            and not (con.invert_x or con.invert_y or con.invert_z or con.use_offset)
+    if con.type == 'COPY_LOCATION':
+        return con.use_x and con.use_y and con.use_z and (con.head_tail == 0) \
+            and not (con.invert_x or con.invert_y or con.invert_z or con.use_offset)
+    if con.type == 'CHILD_OF':
+        return con.use_location_x and con.use_location_y and con.use_location_z \
+            and con.use_rotation_x and con.use_rotation_y and con.use_rotation_z \
+            and con.use_scale_x and con.use_scale_y and con.use_scale_z
+    return False
+
+
+def _solve_constraint(con, matrix, target):
+    if con.type == 'COPY_ROTATION':
+        loc, _, scale = matrix.decompose()
+        return _loc_rot_scale(loc, target.to_quaternion(), scale)
+    if con.type == 'COPY_LOCATION':
+        result = matrix.copy()
+        result.translation = target.translation
+        return result
+    # CHILD_OF
+    return target * con.inverse_matrix * matrix
+
+
+def _channels_matrix(loc, rot, scale, rotmode, use_location=True):
+    if rotmode == 'QUATERNION':
+        mat = Quaternion(rot).normalized().to_matrix().to_4x4()
+    else:
+        mat = Euler(rot, rotmode).to_matrix().to_4x4()
+    mat = mat * Matrix.Scale(scale[0], 4, (1, 0, 0)) \
+        * Matrix.Scale(scale[1], 4, (0, 1, 0)) \
+        * Matrix.Scale(scale[2], 4, (0, 0, 1))
+    if use_location:
+        mat.translation = loc
+    return mat
+
+
+class _Channels:
+    __slots__ = 'loc', 'rot', 'scale', 'rotmode', 'fcurves'
+
+    def __init__(self, holder):
+        self.rotmode = holder.rotation_mode
+        self.loc = list(holder.location)
+        if self.rotmode == 'QUATERNION':
+            self.rot = list(holder.rotation_quaternion)
+        else:
+            self.rot = list(holder.rotation_euler)
+        self.scale = list(holder.scale)
+        self.fcurves = []
+
+    def bind(self, prop, fcurve):
+        values = None
+        if prop == 'location':
+            values = self.loc
+        elif prop == 'scale':
+            values = self.scale
+        elif prop == 'rotation_quaternion':
+            if self.rotmode == 'QUATERNION':
+                values = self.rot
+        elif self.rotmode != 'QUATERNION':
+            values = self.rot
+        if values is not None:
+            self.fcurves.append((values, fcurve.array_index, fcurve))
+
+    def matrix(self, frame, use_location=True):
+        for values, index, fcurve in self.fcurves:
+            values[index] = fcurve.evaluate(frame)
+        return _channels_matrix(self.loc, self.rot, self.scale, self.rotmode, use_location)
+
+
+class PoseEvaluator:
+    """
+    Evaluates the pose of an armature for the given action without the scene
+    update. `create` returns None when the armature uses something that can be
+    evaluated by the scene only (drivers, IK, unsupported constraints, etc).
+    """
+
+    def __init__(self, bpy_armature, bones, channels):
+        self._bones = bones
+        self._offsets = {pbone.name: (rest, offset) for pbone, rest, offset in bones}
+        self._channels = channels
+        self._world = bpy_armature.matrix_world.copy()
+        self._world_inverted = self._world.inverted()
+
+    @staticmethod
+    def create(bpy_armature, bpy_action):
+        if bpy_armature.data.pose_position != 'POSE':
+            return None
+        if _has_extra_animation(bpy_armature):
+            return None
+        channels = {}
+        for fcurve in bpy_action.fcurves:
+            match = _POSE_PATH.match(fcurve.data_path)
+            if match is None:
+                return None
+            pbone = bpy_armature.pose.bones.get(match.group(1), None)
+            if pbone is None:
+                continue
+            if pbone.rotation_mode == 'AXIS_ANGLE':
+                return None
+            chs = channels.get(pbone.name, None)
+            if chs is None:
+                channels[pbone.name] = chs = _Channels(pbone)
+            chs.bind(match.group(2), fcurve)
+
+        static_armature = _has_static_parents(bpy_armature) and not bpy_armature.constraints
+        for pbone in bpy_armature.pose.bones:
+            if pbone.rotation_mode == 'AXIS_ANGLE':
+                return None
+            bone = pbone.bone
+            inherits = bone.use_inherit_rotation and bone.use_inherit_scale
+            if not (inherits and bone.use_local_location):
+                return None
+            if pbone.constraints and not static_armature:
+                return None
+            for con in pbone.constraints:
+                if not _is_supported_constraint(con):
+                    return None
+                if con.mute or con.subtarget:
+                    continue
+                if not _is_static_object(con.target):
+                    return None
+            if pbone.name not in channels:
+                channels[pbone.name] = _Channels(pbone)
+        bones = _sort_bones(bpy_armature)
+        if bones is None:
+            return None
+        return PoseEvaluator(bpy_armature, bones, channels)
+
+    def evaluate(self, frame):
+        """Returns a dict of the pose (armature space) matrices of all bones"""
+        pose = {}
+        for pbone, rest, offset in self._bones:
+            bone = pbone.bone
+            basis = self._channels[pbone.name].matrix(frame, not bone.use_connect)
+            if bone.parent:
+                mat = pose[bone.parent.name] * offset * basis
+            else:
+                mat = rest * basis
+            if pbone.constraints:
+                mat = self._solve_constraints(pbone, mat, pose)
+            pose[pbone.name] = mat
+        return pose
+
+    def _solve_constraints(self, pbone, mat, pose):
+        world = self._world * mat
+        for con in pbone.constraints:
+            if con.mute:
+                continue
+            if con.subtarget:
+                target = self._world * pose[con.subtarget]
+            else:
+                target = con.target.matrix_world
+            world = _solve_constraint(con, world, target)
+        return self._world_inverted * world
+
+    def local_matrix(self, pbone, pose):
+        """The same as `convert_space(pbone, pose_matrix, 'POSE', 'LOCAL')`"""
+        rest, offset = self._offsets[pbone.name]
+        if offset is not None:
+            rest = pose[pbone.parent.name] * offset
+        return rest.inverted() * pose[pbone.name]
+
+
+def _sort_bones(bpy_armature):
+    pbones = bpy_armature.pose.bones
+    order = []
+    state = {}
+
+    def visit(pbone):
+        mark = state.get(pbone.name)
+        if mark == 1:
+            return True
+        if mark == 0:
+            return False  # cyclic dependency
+        state[pbone.name] = 0
+        deps = []
+        if pbone.parent:
+            deps.append(pbone.parent)
+        for con in pbone.constraints:
+            if con.mute or not con.subtarget:
+                continue
+            if con.target != bpy_armature:
+                return False
+            target = pbones.get(con.subtarget, None)
+            if target is None:
+                return False
+            deps.append(target)
+        for dep in deps:
+            if not visit(dep):
+                return False
+        state[pbone.name] = 1
+        order.append(pbone)
+        return True
+
+    for pbone in pbones:
+        if not visit(pbone):
+            return None
+
+    result = []
+    for pbone in order:
+        bone = pbone.bone
+        offset = None
+        if bone.parent:
+            offset = bone.parent.matrix_local.inverted() * bone.matrix_local
+        result.append((pbone, bone.matrix_local.copy(), offset))
+    return result
+
+
+class ObjectEvaluator:
+    """
+    Evaluates `matrix_world` of an object with a self-contained animation
+    (static parent, supported constraints with static targets only).
+    """
+
+    def __init__(self, bpy_obj, channels):
+        self._obj = bpy_obj
+        self._channels = channels
+        parent = bpy_obj.parent
+        self._parent = None
+        if parent is not None:
+            self._parent = parent.matrix_world * bpy_obj.matrix_parent_inverse
+
+    @staticmethod
+    def create(bpy_obj, bpy_action):
+        if _has_extra_animation(bpy_obj) or not _has_static_parents(bpy_obj):
+            return None
+        if bpy_obj.parent_type != 'OBJECT':
+            return None
+        if bpy_obj.rotation_mode == 'AXIS_ANGLE':
+            return None
+        if tuple(bpy_obj.delta_location) != (0, 0, 0) or tuple(bpy_obj.delta_scale) != (1, 1, 1):
+            return None
+        if tuple(bpy_obj.delta_rotation_euler) != (0, 0, 0) \
+            or tuple(bpy_obj.delta_rotation_quaternion) != (1, 0, 0, 0):
+            return None
+        for con in bpy_obj.constraints:
+            if not _is_supported_constraint(con):
+                return None
+            if con.mute:
+                continue
+            if con.subtarget or not _is_static_object(con.target):
+                return None
+        channels = _Channels(bpy_obj)
+        for fcurve in bpy_action.fcurves:
+            if fcurve.data_path not in _OBJECT_PATHS:
+                return None
+            channels.bind(fcurve.data_path, fcurve)
+        return ObjectEvaluator(bpy_obj, channels)
+
+    def evaluate(self, frame):
+        mat = self._channels.matrix(frame)
+        if self._parent is not None:
+            mat = self._parent * mat
+        for con in self._obj.constraints:
+            if not con.mute:
+                mat = _solve_constraint(con, mat, con.target.matrix_world)
+        return mat
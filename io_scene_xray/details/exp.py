@@ -1,6 +1,6 @@
 import io
 
-from .. import xray_io
+from .. import xray_io, utils
 from . import write, convert
 
 
@@ -24,7 +24,7 @@ def _export(bpy_obj, chunked_writer, context):
 
 
 def export_file(bpy_obj, fpath, context):
-    with io.open(fpath, 'wb') as file:
+    with io.open(fpath, 'wb') as file, utils.using_mesh_cache(context):
         chunked_writer = xray_io.ChunkedWriter()
         _export(bpy_obj, chunked_writer, context)
         file.write(chunked_writer.data)
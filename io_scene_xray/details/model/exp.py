@@ -1,11 +1,11 @@
 import io
 
-import bpy
-import bmesh
 import mathutils
 
 from ... import utils
 from ... import xray_io
+from ... import xray_geometry
+from ... import log
 from . import validate
 from . import fmt
 
@@ -20,19 +20,9 @@ def export(bpy_obj, packed_writer, context, mode='DM'):
     packed_writer.putf('<I', int(det_model.no_waving))
     packed_writer.putf('<ff', det_model.min_scale, det_model.max_scale)
 
-    if mode == 'DM':
-        b_mesh = utils.convert_object_to_space_bmesh(
-            bpy_obj, mathutils.Matrix.Identity(4)
-            )
-
-    else:
-        b_mesh = utils.convert_object_to_space_bmesh(
-            bpy_obj, mathutils.Matrix.Identity(4), local=True
-            )
-
-    bmesh.ops.triangulate(b_mesh, faces=b_mesh.faces)
-    bpy_data = bpy.data.meshes.new('.export-dm')
-    b_mesh.to_mesh(bpy_data)
+    b_mesh = context.mesh_cache.bmesh(
+        bpy_obj, mathutils.Matrix.Identity(4), local=(mode != 'DM'), triangulate=True
+        )
     bml_uv = b_mesh.loops.layers.uv.active
     vertices = []
     indices = []
@@ -64,6 +54,18 @@ def export(bpy_obj, packed_writer, context, mode='DM'):
                 _.append(vi)
             indices.append(_)
 
+    if context.optimize_vertex_cache:
+        flat_indices = [vi for tris in indices for vi in tris]
+        flat_indices, order, acmr_before, acmr_after = xray_geometry.optimize_indices(
+            flat_indices, len(vertices)
+            )
+        vertices = [vertices[vi] for vi in order]
+        indices = [flat_indices[i:i + 3] for i in range(0, len(flat_indices), 3)]
+        log.info(
+            'vertex cache is optimized',
+            mesh=bpy_obj.data.name, acmr='%.3f -> %.3f' % (acmr_before, acmr_after)
+            )
+
     vertices_count = len(vertices)
     if vertices_count > fmt.VERTICES_COUNT_LIMIT:
         raise utils.AppError(
@@ -84,11 +86,9 @@ def export(bpy_obj, packed_writer, context, mode='DM'):
     for tris in indices:
         packed_writer.putf('<3H', tris[0], tris[2], tris[1])
 
-    bpy.data.meshes.remove(bpy_data)
-
 
 def export_file(bpy_obj, fpath, context):
-    with io.open(fpath, 'wb') as file:
+    with io.open(fpath, 'wb') as file, utils.using_mesh_cache(context):
         packed_writer = xray_io.PackedWriter()
         export(bpy_obj, packed_writer, context)
         file.write(packed_writer.data)
@@ -132,6 +132,9 @@ class OpExportDMs(bpy.types.Operator):
     texture_name_from_image_path = \
         plugin_prefs.PropObjectTextureNamesFromPath()
 
+    optimize_vertex_cache = plugin_prefs.PropOptimizeVertexCache()
+
+    @utils.execute_with_logger
     @utils.set_cursor_state
     def execute(self, context):
         try:
@@ -142,7 +145,8 @@ class OpExportDMs(bpy.types.Operator):
                 path = self.directory
 
                 export_context = plugin.mk_export_context(
-                    self.texture_name_from_image_path
+                    self.texture_name_from_image_path,
+                    optimize_vertex_cache=self.optimize_vertex_cache
                     )
 
                 model_exp.export_file(
@@ -191,6 +195,9 @@ class OpExportDM(bpy.types.Operator, bpy_extras.io_utils.ExportHelper):
     texture_name_from_image_path = \
         plugin_prefs.PropObjectTextureNamesFromPath()
 
+    optimize_vertex_cache = plugin_prefs.PropOptimizeVertexCache()
+
+    @utils.execute_with_logger
     @utils.set_cursor_state
     def execute(self, context):
         try:
@@ -202,7 +209,8 @@ class OpExportDM(bpy.types.Operator, bpy_extras.io_utils.ExportHelper):
 
     def exp(self, bpy_obj, context):
         export_context = plugin.mk_export_context(
-            self.texture_name_from_image_path
+            self.texture_name_from_image_path,
+            optimize_vertex_cache=self.optimize_vertex_cache
             )
 
         model_exp.export_file(bpy_obj, self.filepath, export_context)
@@ -4,7 +4,7 @@ import bpy
 import bmesh
 import mathutils
 
-from io_scene_xray import registry, utils
+from io_scene_xray import registry, utils, xray_geometry
 from .base_bone import AbstractBoneEditHelper
 from ..xray_motions import MATRIX_BONE_INVERTED
 
@@ -228,8 +228,9 @@ class _FitShape(bpy.types.Operator):
                 vcenter = (vmax + vmin) / 2
                 radius = 0
                 if xsh.type == '2':  # sphere
-                    for vtx in vertices:
-                        radius = max(radius, (vtx - vcenter).length)
+                    vcenter, radius = xray_geometry.calculate_bounding_sphere(
+                        [coord for vtx in vertices for coord in vtx]
+                    )
                     hobj.matrix_local = matrix * mathutils.Matrix.Translation(vcenter) \
                         * _v2ms((radius, radius, radius))
                 elif xsh.type == '3':  # cylinder
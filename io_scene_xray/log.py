@@ -30,6 +30,9 @@ __logger__ = [None]
 def warn(message, **kwargs):
     __logger__[0].warn(message, props(**kwargs))
 
+def info(message, **kwargs):
+    __logger__[0].info(message, props(**kwargs))
+
 def debug(message, **kwargs):
     print('debug: %s: %s' % (message, kwargs))
 
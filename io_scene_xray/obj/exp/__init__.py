@@ -1,6 +1,6 @@
 import io
 
-from ... import xray_io
+from ... import xray_io, utils
 from .. import fmt
 from . import main
 
@@ -11,13 +11,20 @@ class ExportContext:
             textures_folder,
             export_motions,
             soc_sgroups,
-            texname_from_path
+            texname_from_path,
+            optimize_vertex_cache=False,
+            progressive_lods=0,
+            max_bone_influences=0
         ):
 
         self.textures_folder = textures_folder
         self.export_motions = export_motions
         self.soc_sgroups = soc_sgroups
         self.texname_from_path = texname_from_path
+        self.optimize_vertex_cache = optimize_vertex_cache
+        self.progressive_lods = progressive_lods
+        self.max_bone_influences = max_bone_influences
+        self.mesh_cache = None
 
 
 def _export(bpy_obj, chunked_writer, context):
@@ -27,7 +34,7 @@ def _export(bpy_obj, chunked_writer, context):
 
 
 def export_file(bpy_obj, fpath, context):
-    with io.open(fpath, 'wb') as file:
+    with io.open(fpath, 'wb') as file, utils.using_mesh_cache(context):
         writer = xray_io.ChunkedWriter()
         _export(bpy_obj, writer, context)
         file.write(writer.data)
@@ -1,20 +1,16 @@
-from ... import xray_io, log, utils, xray_motions
+from ... import xray_io, log
 from .. import fmt
 from . import main
 
 
-def export_bone(bpy_arm_obj, bpy_root, bpy_bone, writers, bonemap, context):
-    real_parent = utils.find_bone_exportable_parent(bpy_bone)
-    if real_parent:
-        if bonemap.get(real_parent) is None:
-            export_bone(
-                bpy_arm_obj, bpy_root, real_parent, writers, bonemap, context
-            )
+def export_bone(bpy_arm_obj, bpy_root, bone, writers, context):
+    """Writes the `ExportableBone` of the armature, its parent must be already written"""
+    bpy_bone = bone.bone
+    real_parent = bone.parent
 
     xray = bpy_bone.xray
     writer = xray_io.ChunkedWriter()
     writers.append(writer)
-    bonemap[bpy_bone] = writer
     writer.put(
         fmt.Chunks.Bone.VERSION, xray_io.PackedWriter().putf('H', 0x02)
     )
@@ -22,11 +18,9 @@ def export_bone(bpy_arm_obj, bpy_root, bpy_bone, writers, bonemap, context):
                .puts(bpy_bone.name)
                .puts(real_parent.name if real_parent else '')
                .puts(bpy_bone.name))  # vmap
-    xmat = bpy_root.matrix_world.inverted() * bpy_arm_obj.matrix_world
-    mat = xmat * bpy_bone.matrix_local * xray_motions.MATRIX_BONE_INVERTED
-    if real_parent:
-        mat = (xmat * real_parent.matrix_local * \
-            xray_motions.MATRIX_BONE_INVERTED).inverted() * mat
+    mat = bone.xmat
+    if not real_parent:
+        mat = bpy_root.matrix_world.inverted() * bpy_arm_obj.matrix_world * mat
     eul = mat.to_euler('YXZ')
     writer.put(fmt.Chunks.Bone.BIND_POSE, xray_io.PackedWriter()
                .putf('fff', *main.pw_v3f(mat.to_translation()))
@@ -63,12 +63,9 @@ def export_meshes(chunked_writer, bpy_obj, context):
 
     bone_writers = []
     for bpy_arm_obj in armatures:
-        bonemap = {}
-        for bone_ in bpy_arm_obj.data.bones:
-            if not utils.is_exportable_bone(bone_):
-                continue
+        for bone_ in xray_motions.ExportBonesTable(bpy_arm_obj).bones:
             bone.export_bone(
-                bpy_arm_obj, bpy_root, bone_, bone_writers, bonemap, context
+                bpy_arm_obj, bpy_root, bone_, bone_writers, context
             )
 
     msw = xray_io.ChunkedWriter()
@@ -1,6 +1,6 @@
 import bmesh
 
-from ... import xray_io, utils, log
+from ... import xray_io, utils, log, xray_geometry
 from .. import fmt
 from . import main
 
@@ -139,13 +139,83 @@ def export_faces(cw, bm):
     return uvs, vtx, fcs
 
 
+def _armature_bones(bpy_obj):
+    for modifier in bpy_obj.modifiers:
+        if (modifier.type == 'ARMATURE') and modifier.object:
+            return modifier.object.data.bones
+    return None
+
+
+def limit_bone_weights(counts, groups, weights, is_bone, max_influences):
+    """
+    Keeps the `max_influences` heaviest bone influences of each vertex, the
+    weights of the other vertex groups are kept as is.
+    Returns the sparse arrays like `utils.read_deform_weights`.
+    """
+    bone_skin = ([], [], [])
+    other_skin = ([], [], [])
+    offset = 0
+    for count in counts:
+        bone_count = 0
+        for group, weight in zip(groups[offset:offset + count], weights[offset:offset + count]):
+            skin = bone_skin if is_bone[group] else other_skin
+            skin[1].append(group)
+            skin[2].append(weight)
+            bone_count += is_bone[group]
+        bone_skin[0].append(bone_count)
+        other_skin[0].append(count - bone_count)
+        offset += count
+
+    bone_counts, bone_groups, bone_weights, clamped = xray_geometry.limit_weights(
+        *bone_skin, max_influences=max_influences
+    )
+    if clamped:
+        log.warn(
+            'too many bone influences, the weakest ones are dropped',
+            vertices=clamped, limit=max_influences
+        )
+
+    result = ([], [], [])
+    offset = 0
+    for vidx, (bone_count, other_count) in enumerate(zip(bone_counts, other_skin[0])):
+        skin = vidx * max_influences
+        result[0].append(bone_count + other_count)
+        result[1].extend(bone_groups[skin:skin + bone_count])
+        result[1].extend(other_skin[1][offset:offset + other_count])
+        result[2].extend(bone_weights[skin:skin + bone_count])
+        result[2].extend(other_skin[2][offset:offset + other_count])
+        offset += other_count
+    return result
+
+
+def optimize_faces_order(bm):
+    bm.verts.index_update()
+    utils.fix_ensure_lookup_table(bm.faces)
+    triangles = [vertex.index for face in bm.faces for vertex in face.verts]
+    optimized = xray_geometry.optimize_vertex_cache(triangles, len(bm.verts))
+    acmr_before = xray_geometry.calculate_acmr(triangles)
+    acmr_after = xray_geometry.calculate_acmr(optimized)
+    if acmr_after >= acmr_before:
+        return acmr_before, acmr_before
+    tri_faces = {}
+    for face in reversed(bm.faces):
+        tri_faces.setdefault(tuple(vertex.index for vertex in face.verts), []).append(face)
+    rank = {}
+    for i in range(0, len(optimized), 3):
+        rank[tri_faces[tuple(optimized[i:i + 3])].pop()] = i // 3
+    bm.faces.sort(key=lambda face: rank[face])
+    bm.faces.index_update()
+    return acmr_before, acmr_after
+
+
 @log.with_context('export-mesh')
 def export_mesh(bpy_obj, bpy_root, cw, context):
     log.update(mesh=bpy_obj.data.name)
     export_version(cw)
     export_mesh_name(cw, bpy_obj, bpy_root)
 
-    bm = utils.convert_object_to_space_bmesh(bpy_obj, bpy_root.matrix_world)
+    # the geometry is changed below
+    bm = context.mesh_cache.bmesh(bpy_obj, bpy_root.matrix_world).copy()
     bml = bm.verts.layers.deform.verify()
 
     bad_vgroups = remove_bad_geometry(bm, bml, bpy_obj)
@@ -154,6 +224,11 @@ def export_mesh(bpy_obj, bpy_root, cw, context):
     export_flags(cw, bpy_obj)
 
     bmesh.ops.triangulate(bm, faces=bm.faces)
+    if context.optimize_vertex_cache:
+        log.info(
+            'vertex cache is optimized',
+            mesh=bpy_obj.data.name, acmr='%.3f -> %.3f' % optimize_faces_order(bm)
+        )
 
     export_vertices(cw, bm)
 
@@ -165,20 +240,33 @@ def export_mesh(bpy_obj, bpy_root, cw, context):
         if bad:
             wmaps.append(None)
             continue
-        wmaps.append(([], wmaps_cnt))
+        wmaps.append(([], [], wmaps_cnt))
         wmaps_cnt += 1
 
+    counts, groups, weights = utils.read_deform_weights(bm, bml)
+    bones = _armature_bones(bpy_obj)
+    if (bones is not None) and context.max_bone_influences:
+        is_bone = [
+            (wmap is not None) and (vertex_group.name in bones)
+            for vertex_group, wmap in zip(bpy_obj.vertex_groups, wmaps)
+        ]
+        counts, groups, weights = limit_bone_weights(
+            counts, groups, weights, is_bone, context.max_bone_influences
+        )
+
     wrefs = []
-    for vidx, vertex in enumerate(bm.verts):
+    offset = 0
+    for vidx, count in enumerate(counts):
         wr = []
         wrefs.append(wr)
-        vw = vertex[bml]
-        for vgi in vw.keys():
+        for vgi, weight in zip(groups[offset:offset + count], weights[offset:offset + count]):
             wmap = wmaps[vgi]
             if wmap is None:
                 continue
-            wr.append((1 + wmap[1], len(wmap[0])))
+            wr.append((1 + wmap[2], len(wmap[0])))
             wmap[0].append(vidx)
+            wmap[1].append(weight)
+        offset += count
 
     writer = xray_io.PackedWriter()
     writer.putf('I', len(uvs))
@@ -243,12 +331,11 @@ def export_mesh(bpy_obj, bpy_root, cw, context):
         wmap = wmaps[vgi]
         if wmap is None:
             continue
-        vtx = wmap[0]
+        vtx, vtx_weights = wmap[0], wmap[1]
         writer.puts(vertex_group.name)
         writer.putf('B', 1).putf('B', 0).putf('B', 1)
         writer.putf('I', len(vtx))
-        for vidx in vtx:
-            writer.putf('f', bm.verts[vidx][bml][vgi])
+        writer.putf(str(len(vtx)) + 'f', *vtx_weights)
         writer.putf(str(len(vtx)) + 'I', *vtx)
     cw.put(fmt.Chunks.Mesh.VMAPS2, writer)
     return used_material_names
@@ -32,6 +32,12 @@ def find_objects_for_export(context):
 
 class _WithExportMotions:
     export_motions = plugin_prefs.PropObjectMotionsExport()
+    optimize_vertex_cache = plugin_prefs.PropOptimizeVertexCache()
+    max_bone_influences = bpy.props.IntProperty(
+        name='Max Bone Influences',
+        description='Keep only the heaviest bone weights of each vertex (0 keeps all)',
+        min=0, max=4, default=0
+    )
 
 
 @registry.module_thing
@@ -60,13 +66,17 @@ class OpExportObjects(ops.BaseOperator, _WithExportMotions):
         layout.prop(self, 'use_export_paths')
         layout.prop(self, 'export_motions')
         layout.prop(self, 'texture_name_from_image_path')
+        layout.prop(self, 'optimize_vertex_cache')
+        layout.prop(self, 'max_bone_influences')
 
     @utils.execute_with_logger
     @utils.set_cursor_state
     def execute(self, context):
         export_context = utils.mk_export_context(
             self.texture_name_from_image_path,
-            self.fmt_version, self.export_motions
+            self.fmt_version, self.export_motions,
+            self.optimize_vertex_cache,
+            max_bone_influences=self.max_bone_influences
         )
         try:
             for name in self.objects.split(','):
@@ -135,6 +145,8 @@ class OpExportObject(
 
         layout.prop(self, 'export_motions')
         layout.prop(self, 'texture_name_from_image_path')
+        layout.prop(self, 'optimize_vertex_cache')
+        layout.prop(self, 'max_bone_influences')
 
     @utils.execute_with_logger
     @utils.set_cursor_state
@@ -142,7 +154,9 @@ class OpExportObject(
         export_context = utils.mk_export_context(
             self.texture_name_from_image_path,
             self.fmt_version,
-            self.export_motions
+            self.export_motions,
+            self.optimize_vertex_cache,
+            max_bone_influences=self.max_bone_influences
         )
         try:
             exp.export_file(
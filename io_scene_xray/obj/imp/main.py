@@ -264,6 +264,7 @@ def import_main(fpath, context, creader):
             if not context.import_motions:
                 continue
             reader = xray_io.PackedReader(data)
+            xray_motions.invalidate_bones_tables((bpy_arm_obj.data, ))
             xray_motions.import_motions(reader, bpy_arm_obj)
         elif cid == fmt.Chunks.Object.LIB_VERSION:
             pass  # skip obsolete chunk
@@ -1,33 +1,32 @@
+from array import array
+import collections
 import io
+import math
+import multiprocessing
+import os
+import time
 
-from bmesh.ops import triangulate
-import bpy
 import mathutils
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 from ..xray_io import ChunkedWriter, PackedWriter
-from .fmt import Chunks, ModelType, VertexFormat
+from .fmt import Chunks, ModelType, VertexFormat, VERTICES_COUNT_LIMIT, \
+    SWI_COUNT_LIMIT
 from ..utils import is_exportable_bone, find_bone_exportable_parent, AppError, \
-    fix_ensure_lookup_table, convert_object_to_space_bmesh, \
-    calculate_mesh_bbox, gen_texture_name
+    mkstruct, create_process_pool, using_mesh_cache, read_deform_weights, calculate_mesh_bbox, \
+    gen_texture_name
 from ..utils import is_helper_object
-from ..xray_motions import MATRIX_BONE_INVERTED
-
+from ..xray_motions import MATRIX_BONE_INVERTED, ExportBonesTable
+from ..xray_geometry import weld_rows, optimize_indices, optimize_vertex_cache, calculate_acmr, \
+    partition_triangles, simplify_progressive, calculate_bounding_sphere, limit_weights
+from .. import log
 
-def calculate_mesh_bsphere(bbox, vertices):
-    center = (bbox[0] + bbox[1]) / 2
-    _delta = bbox[1] - bbox[0]
-    max_radius = max(abs(_delta.x), abs(_delta.y), abs(_delta.z)) / 2
-    for vtx in vertices:
-        relative = vtx.co - center
-        radius = relative.length
-        if radius > max_radius:
-            offset = center - relative.normalized() * max_radius
-            center = (vtx.co + offset) / 2
-            max_radius = (center - offset).length
-    return center, max_radius
 
-
-def calculate_bbox_and_bsphere(bpy_obj):
+def calculate_bbox_and_bsphere(bpy_obj, mesh_cache):
     def scan_meshes(bpy_obj, meshes):
         if is_helper_object(bpy_obj):
             return
@@ -40,9 +39,9 @@ def calculate_bbox_and_bsphere(bpy_obj):
     scan_meshes(bpy_obj, meshes)
 
     bbox = None
-    spheres = []
+    coords = array('f')
     for mesh in meshes:
-        bmesh = convert_object_to_space_bmesh(mesh, bpy_obj.matrix_world)
+        bmesh = mesh_cache.bmesh(mesh, bpy_obj.matrix_world)
         bbx = calculate_mesh_bbox(bmesh.verts)
         if bbox is None:
             bbox = bbx
@@ -50,154 +49,272 @@ def calculate_bbox_and_bsphere(bpy_obj):
             for i in range(3):
                 bbox[0][i] = min(bbox[0][i], bbx[0][i])
                 bbox[1][i] = max(bbox[1][i], bbx[1][i])
-        spheres.append(calculate_mesh_bsphere(bbx, bmesh.verts))
-
-    center = mathutils.Vector()
-    radius = 0
-    if not spheres:
-        return center, 0
-    for sphere in spheres:
-        center += sphere[0]
-    center /= len(spheres)
-    for ctr, rad in spheres:
-        radius = max(radius, (ctr - center).length + rad)
-    return bbox, (center, radius)
-
-
-def top_two(dic):
-    def top_one(dic, skip=None):
-        max_key = None
-        max_val = -1
-        for key, val in dic.items():
-            if (key != skip) and (val > max_val):
-                max_val = val
-                max_key = key
-        return max_key, max_val
-
-    key0, val0 = top_one(dic)
-    key1, val1 = top_one(dic, key0)
-    return {key0: val0, key1: val1}
+        for vtx in bmesh.verts:
+            coords.extend(vtx.co)
+
+    if not meshes:
+        return mathutils.Vector(), 0
+    return bbox, calculate_bounding_sphere(coords)
+
+
+_VERTEX_FORMATS = {
+    1: VertexFormat.FVF_1L,
+    2: VertexFormat.FVF_2L,
+    3: VertexFormat.FVF_3L_CS,
+    4: VertexFormat.FVF_4L_CS,
+}
 
 
 def pw_v3f(vec):
     return vec[0], vec[2], vec[1]
 
 
-def _export_child(bpy_obj, cwriter, context, vgm):
-    bmesh = convert_object_to_space_bmesh(bpy_obj, mathutils.Matrix.Identity(4))
-    bbox = calculate_mesh_bbox(bmesh.verts)
-    bsph = calculate_mesh_bsphere(bbox, bmesh.verts)
-    triangulate(bmesh, faces=bmesh.faces)
-    bpy_data = bpy.data.meshes.new('.export-ogf')
-    bmesh.to_mesh(bpy_data)
-
-    cwriter.put(
-        Chunks.HEADER,
-        PackedWriter()
-        .putf('B', 4)  # ogf version
-        .putf('B', ModelType.SKELETON_GEOMDEF_ST)
-        .putf('H', 0)  # shader id
-        .putf('fff', *pw_v3f(bbox[0])).putf('fff', *pw_v3f(bbox[1]))
-        .putf('fff', *pw_v3f(bsph[0])).putf('f', bsph[1])
-    )
+# position, normal, tangent, bitangent, uv
+_LOOP_WIDTH = 3 + 3 + 3 + 3 + 2
+
+
+def _read_loops(bpy_data, uv_layer_name):
+    """
+    Pulls the loop attributes of the triangulated mesh into flat arrays.
+    Returns the vertex index of each loop and the `_LOOP_WIDTH` floats per loop.
+    """
+    loops = bpy_data.loops
+    count = len(loops)
+    loop_vertices = array('i', [0]) * count
+    loops.foreach_get('vertex_index', loop_vertices)
+    coords = array('f', [0.0]) * (len(bpy_data.vertices) * 3)
+    bpy_data.vertices.foreach_get('co', coords)
+    normals = array('f', [0.0]) * (count * 3)
+    loops.foreach_get('normal', normals)
+    tangents = array('f', [0.0]) * (count * 3)
+    loops.foreach_get('tangent', tangents)
+    bitangents = array('f', [0.0]) * (count * 3)
+    loops.foreach_get('bitangent', bitangents)
+    uvs = array('f', [0.0]) * (count * 2)
+    bpy_data.uv_layers[uv_layer_name].data.foreach_get('uv', uvs)
+
+    if numpy is not None:
+        return loop_vertices, _assemble_loops_np(
+            loop_vertices, coords, normals, tangents, bitangents, uvs
+        )
+    attrs = array('f', [0.0]) * (count * _LOOP_WIDTH)
+    for axis in range(3):
+        axis_coords = coords[axis::3]
+        attrs[axis::_LOOP_WIDTH] = array('f', [axis_coords[vidx] for vidx in loop_vertices])
+        attrs[3 + axis::_LOOP_WIDTH] = normals[axis::3]
+        attrs[6 + axis::_LOOP_WIDTH] = tangents[axis::3]
+    for loop in range(count):
+        x, y, z = bitangents[loop * 3:loop * 3 + 3]
+        length = math.sqrt(x * x + y * y + z * z)
+        if length:
+            x, y, z = x / length, y / length, z / length
+        offset = loop * _LOOP_WIDTH + 9
+        attrs[offset:offset + 3] = array('f', (x, y, z))
+    attrs[12::_LOOP_WIDTH] = uvs[0::2]
+    attrs[13::_LOOP_WIDTH] = array('f', (1 - v for v in uvs[1::2]))
+    return loop_vertices, attrs
+
+
+def _assemble_loops_np(loop_vertices, coords, normals, tangents, bitangents, uvs):
+    count = len(loop_vertices)
+    attrs = numpy.empty((count, _LOOP_WIDTH), dtype=numpy.float32)
+    vertex_indices = numpy.frombuffer(loop_vertices, dtype=numpy.int32)
+    attrs[:, 0:3] = numpy.frombuffer(coords, dtype=numpy.float32).reshape(-1, 3)[vertex_indices]
+    attrs[:, 3:6] = numpy.frombuffer(normals, dtype=numpy.float32).reshape(count, 3)
+    attrs[:, 6:9] = numpy.frombuffer(tangents, dtype=numpy.float32).reshape(count, 3)
+    bitangents = numpy.frombuffer(bitangents, dtype=numpy.float32).reshape(count, 3)
+    bitangents = bitangents.astype(numpy.float64)
+    lengths = numpy.sqrt((bitangents * bitangents).sum(axis=1))
+    lengths[lengths == 0] = 1
+    attrs[:, 9:12] = bitangents / lengths[:, None]
+    uvs = numpy.frombuffer(uvs, dtype=numpy.float32).reshape(count, 2)
+    attrs[:, 12] = uvs[:, 0]
+    attrs[:, 13] = 1 - uvs[:, 1].astype(numpy.float64)
+    result = array('f')
+    result.frombytes(attrs.tobytes())
+    return result
+
+
+def _extract_child(bpy_obj, context, vgm):
+    """Pulls the mesh data from bpy, the result is encoded by `_encode_child`"""
+    bmesh = context.mesh_cache.bmesh(bpy_obj, mathutils.Matrix.Identity(4), triangulate=True)
+    bpy_data = context.mesh_cache.mesh(bpy_obj, mathutils.Matrix.Identity(4))
 
     material = bpy_obj.data.materials[0]
-    cwriter.put(
-        Chunks.TEXTURE,
-        PackedWriter()
-        .puts(
-            gen_texture_name(material.active_texture, context.textures_folder)
-            if context.texname_from_path else
-            material.active_texture.name
-        )
-        .puts(material.xray.eshader)
-    )
+    texture = gen_texture_name(material.active_texture, context.textures_folder) \
+        if context.texname_from_path else material.active_texture.name
 
     bml_uv = bmesh.loops.layers.uv.active
     bml_vw = bmesh.verts.layers.deform.verify()
     bpy_data.calc_tangents(bml_uv.name)
-    vertices = []
-    indices = []
-    vmap = {}
-    for face in bmesh.faces:
-        face_indices = []
-        for loop_index, loop in enumerate(face.loops):
-            data_loop = bpy_data.loops[face.index * 3 + loop_index]
-            uv = loop[bml_uv].uv
-            vtx = (
-                loop.vert.index,
-                loop.vert.co.to_tuple(),
-                data_loop.normal.to_tuple(),
-                data_loop.tangent.to_tuple(),
-                data_loop.bitangent.normalized().to_tuple(),
-                (uv[0], 1 - uv[1]),
-            )
-            vertex_index = vmap.get(vtx)
-            if vertex_index is None:
-                vmap[vtx] = vertex_index = len(vertices)
-                vertices.append(vtx)
-            face_indices.append(vertex_index)
-        indices.append(face_indices)
-
-    vwmx = 0
-    for vertex in bmesh.verts:
-        vwc = len(vertex[bml_vw])
-        if vwc > vwmx:
-            vwmx = vwc
-
-    fix_ensure_lookup_table(bmesh.verts)
-    pwriter = PackedWriter()
-    if vwmx == 1:
-        pwriter.putf('II', VertexFormat.FVF_1L, len(vertices))
-        for vertex in vertices:
-            weights = bmesh.verts[vertex[0]][bml_vw]
-            pwriter.putf('fff', *pw_v3f(vertex[1]))
-            pwriter.putf('fff', *pw_v3f(vertex[2]))
-            pwriter.putf('fff', *pw_v3f(vertex[3]))
-            pwriter.putf('fff', *pw_v3f(vertex[4]))
-            pwriter.putf('ff', *vertex[5])
-            pwriter.putf('I', vgm[weights.keys()[0]])
+    loop_vertices, loop_attrs = _read_loops(bpy_data, bml_uv.name)
+    skin = read_deform_weights(bmesh, bml_vw)
+    if not all(skin[0]):
+        raise AppError('mesh "%s" has vertices without bone weights' % bpy_obj.name)
+    return bpy_obj.name, texture, material.xray.eshader, loop_vertices, loop_attrs, skin, vgm
+
+
+def _encode_child(task, options, warnings, infos):
+    """
+    Returns a writer per child; a mesh which does not fit into the 16-bit
+    indices is split into several spatially compact children.
+    Doesn't use bpy, so it can be run by a worker process.
+    """
+    name, texture, shader, loop_vertices, loop_attrs, skin, vgm = task
+    optimize_cache, progressive_lods, max_influences = options
+    texture_writer = PackedWriter().puts(texture).puts(shader)
+    vertices, remap = weld_rows(loop_vertices, loop_attrs, _LOOP_WIDTH)
+
+    if len(vertices) > VERTICES_COUNT_LIMIT:
+        positions = [loop_attrs[row * _LOOP_WIDTH + axis] for row in vertices for axis in range(3)]
+        parts = partition_triangles(remap, positions, VERTICES_COUNT_LIMIT)
+        log.debug(
+            'mesh is split',
+            mesh=name, vertices=len(vertices),
+            parts=[len(order) for order, _ in parts]
+        )
     else:
-        if vwmx != 2:
-            print('warning: vwmx=%i' % vwmx)
-        pwriter.putf('II', VertexFormat.FVF_2L, len(vertices))
-        for vertex in vertices:
-            weights = bmesh.verts[vertex[0]][bml_vw]
-            if len(weights) > 2:
-                weights = top_two(weights)
-            weight = 0
-            if len(weights) == 2:
-                first = True
-                weight0 = 0
-                for vgi in weights.keys():
-                    pwriter.putf('H', vgm[vgi])
-                    if first:
-                        weight0 = weights[vgi]
-                        first = False
-                    else:
-                        weight = 1 - (weight0 / (weight0 + weights[vgi]))
-            elif len(weights) == 1:
-                for vgi in [vgm[_] for _ in weights.keys()]:
-                    pwriter.putf('HH', vgi, vgi)
-            else:
-                raise Exception('oops: %i %s' % (len(weights), weights.keys()))
-            pwriter.putf('fff', *pw_v3f(vertex[1]))
-            pwriter.putf('fff', *pw_v3f(vertex[2]))
-            pwriter.putf('fff', *pw_v3f(vertex[3]))
-            pwriter.putf('fff', *pw_v3f(vertex[4]))
-            pwriter.putf('f', weight)
-            pwriter.putf('ff', *vertex[5])
-    cwriter.put(Chunks.VERTICES, pwriter)
-
-    pwriter = PackedWriter()
-    pwriter.putf('I', 3 * len(indices))
-    for face in indices:
-        pwriter.putf('HHH', face[0], face[2], face[1])
-    cwriter.put(Chunks.INDICES, pwriter)
+        parts = [(range(len(vertices)), remap)]
 
+    skin_counts, skin_groups, skin_weights, clamped = limit_weights(
+        *skin, max_influences=max_influences
+    )
+    if clamped:
+        warnings.append((
+            'too many bone influences, the weakest ones are dropped',
+            dict(mesh=name, vertices=clamped, limit=max_influences)
+        ))
+    influences = max(skin_counts, default=1)
+
+    cwriters = []
+    for order, part_indices in parts:
+        part_vertices = [vertices[vidx] for vidx in order]
+        swis = None
+        triangles_count = len(part_indices) // 3
+        swi_overflow = max(triangles_count, len(part_vertices)) > SWI_COUNT_LIMIT
+        if progressive_lods > 1 and swi_overflow:
+            warnings.append((
+                'progressive mesh is not generated: the mesh is too large',
+                dict(mesh=name, triangles=triangles_count, vertices=len(part_vertices))
+            ))
+        elif progressive_lods > 1:
+            positions = [
+                loop_attrs[row * _LOOP_WIDTH + axis] for row in part_vertices for axis in range(3)
+            ]
+            order, levels = simplify_progressive(
+                part_indices, positions,
+                [max(triangles_count >> level, 1) for level in range(progressive_lods)]
+            )
+            part_vertices = [part_vertices[vidx] for vidx in order]
+            part_indices = []
+            swis = []
+            misses_before = misses_after = 0.0
+            for level_indices, level_vertices_count in levels:
+                if optimize_cache:
+                    level_triangles = len(level_indices) // 3
+                    acmr_before = calculate_acmr(level_indices)
+                    optimized = optimize_vertex_cache(level_indices, level_vertices_count)
+                    acmr_after = calculate_acmr(optimized)
+                    if acmr_after < acmr_before:
+                        level_indices = optimized
+                    else:
+                        acmr_after = acmr_before
+                    misses_before += acmr_before * level_triangles
+                    misses_after += acmr_after * level_triangles
+                swis.append((len(part_indices), len(level_indices) // 3, level_vertices_count))
+                part_indices.extend(level_indices)
+            log.debug('progressive mesh is generated', mesh=name, swis=swis)
+            if optimize_cache:
+                triangles_total = max(len(part_indices) // 3, 1)
+                infos.append((
+                    'vertex cache is optimized',
+                    dict(mesh=name, acmr='%.3f -> %.3f' % (
+                        misses_before / triangles_total, misses_after / triangles_total
+                    ), lods=len(swis))
+                ))
+        elif optimize_cache:
+            part_indices, order, acmr_before, acmr_after = optimize_indices(
+                part_indices, len(part_vertices)
+            )
+            part_vertices = [part_vertices[vidx] for vidx in order]
+            infos.append((
+                'vertex cache is optimized',
+                dict(mesh=name, acmr='%.3f -> %.3f' % (acmr_before, acmr_after))
+            ))
+        indices = [part_indices[i:i + 3] for i in range(0, len(part_indices), 3)]
+
+        coords = [
+            loop_attrs[row * _LOOP_WIDTH + axis] for row in part_vertices for axis in range(3)
+        ] or [0.0, 0.0, 0.0]
+        bbox = (
+            [min(coords[axis::3]) for axis in range(3)],
+            [max(coords[axis::3]) for axis in range(3)],
+        )
+        bsph = calculate_bounding_sphere(coords)
 
-def _export(bpy_obj, cwriter, context):
-    bbox, bsph = calculate_bbox_and_bsphere(bpy_obj)
+        cwriter = ChunkedWriter()
+        cwriter.put(
+            Chunks.HEADER,
+            PackedWriter()
+            .putf('B', 4)  # ogf version
+            .putf('B', ModelType.SKELETON_GEOMDEF_ST if swis is None
+                  else ModelType.SKELETON_GEOMDEF_PM)
+            .putf('H', 0)  # shader id
+            .putf('fff', *pw_v3f(bbox[0])).putf('fff', *pw_v3f(bbox[1]))
+            .putf('fff', *pw_v3f(bsph[0])).putf('f', bsph[1])
+        )
+        cwriter.put(Chunks.TEXTURE, texture_writer)
+
+        pwriter = PackedWriter()
+        pwriter.putf('II', _VERTEX_FORMATS[influences], len(part_vertices))
+        for row in part_vertices:
+            attrs = loop_attrs[row * _LOOP_WIDTH:(row + 1) * _LOOP_WIDTH]
+            skin = loop_vertices[row] * max_influences
+            bones = [vgm[vgi] for vgi in skin_groups[skin:skin + influences]]
+            if influences == 1:
+                pwriter.putf('fff', *pw_v3f(attrs[0:3]))
+                pwriter.putf('fff', *pw_v3f(attrs[3:6]))
+                pwriter.putf('fff', *pw_v3f(attrs[6:9]))
+                pwriter.putf('fff', *pw_v3f(attrs[9:12]))
+                pwriter.putf('ff', *attrs[12:14])
+                pwriter.putf('I', bones[0])
+                continue
+            pwriter.putf('%iH' % influences, *bones)
+            pwriter.putf('fff', *pw_v3f(attrs[0:3]))
+            pwriter.putf('fff', *pw_v3f(attrs[3:6]))
+            pwriter.putf('fff', *pw_v3f(attrs[6:9]))
+            pwriter.putf('fff', *pw_v3f(attrs[9:12]))
+            if influences == 2:
+                pwriter.putf('f', skin_weights[skin + 1])  # the weight of the second bone
+            else:
+                pwriter.putf('%if' % (influences - 1), *skin_weights[skin:skin + influences - 1])
+            pwriter.putf('ff', *attrs[12:14])
+        cwriter.put(Chunks.VERTICES, pwriter)
+
+        pwriter = PackedWriter()
+        pwriter.putf('I', 3 * len(indices))
+        for face in indices:
+            pwriter.putf('HHH', face[0], face[2], face[1])
+        cwriter.put(Chunks.INDICES, pwriter)
+
+        if swis is not None:
+            pwriter = PackedWriter()
+            pwriter.putf('IIII', 0, 0, 0, 0)  # reserved
+            pwriter.putf('I', len(swis))
+            for offset, tris, vtxs in swis:
+                pwriter.putf('IHH', offset, tris, vtxs)
+            cwriter.put(Chunks.SWIDATA, pwriter)
+        cwriters.append(cwriter)
+    return cwriters
+
+
+def _prepare(bpy_obj, context):
+    """
+    Extracts everything needed from bpy: the chunks before and after the
+    children and the tasks of `_encode_child`.
+    """
+    cwriter = ChunkedWriter()
+    bbox, bsph = calculate_bbox_and_bsphere(bpy_obj, context.mesh_cache)
     cwriter.put(
         Chunks.HEADER,
         PackedWriter()
@@ -219,6 +336,7 @@ def _export(bpy_obj, cwriter, context):
     meshes = []
     bones = []
     bones_map = {}
+    tables = {}
 
     def reg_bone(bone, adv):
         idx = bones_map.get(bone, -1)
@@ -245,9 +363,7 @@ def _export(bpy_obj, cwriter, context):
                             )
                         vgm[i] = reg_bone(bone, modifier.object)
                     break  # use only first armature modifier
-            mwriter = ChunkedWriter()
-            _export_child(bpy_obj, mwriter, context, vgm)
-            meshes.append(mwriter)
+            meshes.append(_extract_child(bpy_obj, context, vgm))
         elif bpy_obj.type == 'ARMATURE':
             for bone in bpy_obj.data.bones:
                 if not is_exportable_bone(bone):
@@ -256,21 +372,30 @@ def _export(bpy_obj, cwriter, context):
         for child in bpy_obj.children:
             scan_r(child)
 
-    scan_r(bpy_obj)
+    def bone_pose(bone, bpy_arm_obj):
+        """Returns the exportable parent and the bind pose relative to it"""
+        table = tables.get(bpy_arm_obj.name, None)
+        if table is None:
+            table = tables[bpy_arm_obj.name] = ExportBonesTable(bpy_arm_obj)
+        exportable = table.get(bone.name)
+        if exportable is not None:
+            return exportable.parent, exportable.xmat
+        # the non-exportable bones are exported if they deform the meshes
+        parent = find_bone_exportable_parent(bone)
+        bind = bone.matrix_local * MATRIX_BONE_INVERTED
+        if parent is None:
+            return None, bind
+        return parent, table.get(parent.name).bind.inverted() * bind
 
-    ccw = ChunkedWriter()
-    idx = 0
-    for mwriter in meshes:
-        ccw.put(idx, mwriter)
-        idx += 1
-    cwriter.put(Chunks.CHILDREN, ccw)
+    scan_r(bpy_obj)
+    header, cwriter = cwriter, ChunkedWriter()
+    poses = [bone_pose(bone, obj) for bone, obj in bones]
 
     pwriter = PackedWriter()
     pwriter.putf('I', len(bones))
-    for bone, _ in bones:
-        b_parent = find_bone_exportable_parent(bone)
+    for (bone, _), (parent, _) in zip(bones, poses):
         pwriter.puts(bone.name)
-        pwriter.puts(b_parent.name if b_parent else '')
+        pwriter.puts(parent.name if parent else '')
         xray = bone.xray
         pwriter.putf('fffffffff', *xray.shape.box_rot)
         pwriter.putf('fff', *xray.shape.box_trn)
@@ -278,8 +403,7 @@ def _export(bpy_obj, cwriter, context):
     cwriter.put(Chunks.S_BONE_NAMES, pwriter)
 
     pwriter = PackedWriter()
-    for bone, obj in bones:
-        pbone = obj.pose.bones[bone.name]
+    for (bone, obj), (parent, xmat) in zip(bones, poses):
         xray = bone.xray
         pwriter.putf('I', 0x1)  # version
         pwriter.puts(xray.gamemtl)
@@ -305,11 +429,7 @@ def _export(bpy_obj, cwriter, context):
         pwriter.putf('I', xray.ikflags)
         pwriter.putf('ff', xray.breakf.force, xray.breakf.torque)
         pwriter.putf('f', xray.friction)
-        mwriter = obj.matrix_world
-        mat = mwriter * bone.matrix_local * MATRIX_BONE_INVERTED
-        b_parent = find_bone_exportable_parent(bone)
-        if b_parent:
-            mat = (mwriter * b_parent.matrix_local * MATRIX_BONE_INVERTED).inverted() * mat
+        mat = xmat if parent else obj.matrix_world * xmat
         euler = mat.to_euler('YXZ')
         pwriter.putf('fff', -euler.x, -euler.z, -euler.y)
         pwriter.putf('fff', *pw_v3f(mat.to_translation()))
@@ -319,10 +439,104 @@ def _export(bpy_obj, cwriter, context):
     cwriter.put(Chunks.S_USERDATA, PackedWriter().puts(bpy_obj.xray.userdata))
     if bpy_obj.xray.motionrefs:
         cwriter.put(Chunks.S_MOTION_REFS_0, PackedWriter().puts(bpy_obj.xray.motionrefs))
+    return header, meshes, cwriter
+
+
+def _encode_options(context):
+    return context.optimize_vertex_cache, context.progressive_lods, context.max_bone_influences
+
+
+def _encode(model, options, warnings, infos):
+    header, meshes, footer = model
+    ccw = ChunkedWriter()
+    idx = 0
+    for task in meshes:
+        for mwriter in _encode_child(task, options, warnings, infos):
+            ccw.put(idx, mwriter)
+            idx += 1
+    cwriter = ChunkedWriter()
+    cwriter.data += header.data
+    cwriter.put(Chunks.CHILDREN, ccw)
+    cwriter.data += footer.data
+    return cwriter
+
+
+def _export(bpy_obj, cwriter, context):
+    warnings = []
+    infos = []
+    model = _prepare(bpy_obj, context)
+    cwriter.data += _encode(model, _encode_options(context), warnings, infos).data
+    for message, props in warnings:
+        log.warn(message, **props)
+    for message, props in infos:
+        log.info(message, **props)
 
 
 def export_file(bpy_obj, fpath, context):
-    with io.open(fpath, 'wb') as file:
+    with io.open(fpath, 'wb') as file, using_mesh_cache(context):
         cwriter = ChunkedWriter()
         _export(bpy_obj, cwriter, context)
         file.write(cwriter.data)
+
+
+ModelTimings = mkstruct('ModelTimings', ['name', 'extract', 'encode', 'write', 'size'])
+
+
+def _encode_file(fpath, model, options):
+    """Encodes the model and writes it, returns the messages and the timings"""
+    started = time.perf_counter()
+    warnings = []
+    infos = []
+    data = _encode(model, options, warnings, infos).data
+    encoded = time.perf_counter()
+    with io.open(fpath, 'wb') as file:
+        file.write(data)
+    return warnings, infos, encoded - started, time.perf_counter() - encoded, len(data)
+
+
+def export_files(bpy_objs, directory, context):
+    """
+    Exports each root to '<directory>/<root name>.ogf'. The models are
+    extracted here while a pool of worker processes encodes and writes the
+    previous ones. Returns the timings of each model.
+    """
+    options = _encode_options(context)
+    processes = min(multiprocessing.cpu_count(), len(bpy_objs))
+    pool = create_process_pool(processes)
+    timings = []
+    pending = collections.deque()
+
+    def finish(name, extract, result):
+        warnings, infos, encode, write, size = result
+        for message, props in warnings:
+            log.warn(message, object=name, **props)
+        for message, props in infos:
+            log.info(message, object=name, **props)
+        timings.append(ModelTimings(name, extract, encode, write, size))
+
+    try:
+        for bpy_obj in bpy_objs:
+            name = bpy_obj.name
+            if not name.lower().endswith('.ogf'):
+                name += '.ogf'
+            fpath = os.path.join(directory, name)
+            started = time.perf_counter()
+            with using_mesh_cache(context):
+                model = _prepare(bpy_obj, context)
+            extract = time.perf_counter() - started
+            if pool is None:
+                finish(bpy_obj.name, extract, _encode_file(fpath, model, options))
+                continue
+            result = pool.apply_async(_encode_file, (fpath, model, options))
+            pending.append((bpy_obj.name, extract, result))
+            while pending and (len(pending) > processes or pending[0][2].ready()):
+                done, done_extract, result = pending.popleft()
+                finish(done, done_extract, result.get())
+        while pending:
+            done, done_extract, result = pending.popleft()
+            finish(done, done_extract, result.get())
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+    return timings
@@ -16,6 +16,7 @@ class Chunks:
 
 class ModelType:
     SKELETON_ANIM = 0x3
+    SKELETON_GEOMDEF_PM = 0x4
     SKELETON_GEOMDEF_ST = 0x5
     SKELETON_RIGID = 0xa
 
@@ -27,3 +28,20 @@ class VertexFormat:
     FVF_2L_CS = 0x2
     FVF_3L_CS = 0x3
     FVF_4L_CS = 0x4
+
+
+VERTICES_COUNT_LIMIT = 0x10000
+SWI_COUNT_LIMIT = 0xffff  # the triangles and the vertices of a sliding window
+
+
+class MotionFlags:
+    T_KEY_PRESENT = 0x1
+    R_KEY_ABSENT = 0x2
+    T_KEY_16BIT = 0x4
+
+
+KEY_QUANT = 32767
+KEY_QUANT_8BIT = 127
+SMPARAMS_VERSION_SOC = 3
+SMPARAMS_VERSION = 4  # adds the motion marks
+MOTION_FPS = 30  # the game samples the motion keys at the fixed rate
@@ -35,22 +35,79 @@ class ModelExportHelper:
         return self.export(roots[0], context)
 
 
+class _WithExportOptions:
+    fmt_version = plugin_prefs.PropSDKVersion()
+    texture_name_from_image_path = plugin_prefs.PropObjectTextureNamesFromPath()
+    optimize_vertex_cache = plugin_prefs.PropOptimizeVertexCache()
+    progressive_lods = bpy.props.IntProperty(
+        name='Progressive LODs',
+        description='Number of the sliding window levels of detail, '
+                    'each one halves the triangles (0 disables)',
+        min=0, max=16, default=0
+    )
+    max_bone_influences = bpy.props.IntProperty(
+        name='Max Bone Influences',
+        description='Bones per vertex, the models with 3 or 4 are loaded by Call of Pripyat only',
+        min=1, max=4, default=2
+    )
+
+    def _mk_export_context(self):
+        return mk_export_context(
+            self.texture_name_from_image_path, self.fmt_version,
+            optimize_vertex_cache=self.optimize_vertex_cache,
+            progressive_lods=self.progressive_lods,
+            max_bone_influences=self.max_bone_influences
+        )
+
+    def _init_from_preferences(self):
+        prefs = plugin_prefs.get_preferences()
+        self.fmt_version = prefs.sdk_version
+        self.texture_name_from_image_path = prefs.object_texture_names_from_path
+
+
 @registry.module_thing
-class OpExportOgf(bpy.types.Operator, io_utils.ExportHelper, ModelExportHelper):
+class OpExportOgf(bpy.types.Operator, io_utils.ExportHelper, ModelExportHelper, _WithExportOptions):
     bl_idname = 'xray_export.ogf'
     bl_label = 'Export .ogf'
 
     filename_ext = '.ogf'
     filter_glob = bpy.props.StringProperty(default='*'+filename_ext, options={'HIDDEN'})
 
-    texture_name_from_image_path = plugin_prefs.PropObjectTextureNamesFromPath()
-
     def export(self, bpy_obj, context):
-        export_context = mk_export_context(self.texture_name_from_image_path)
-        exp.export_file(bpy_obj, self.filepath, export_context)
+        exp.export_file(bpy_obj, self.filepath, self._mk_export_context())
         return {'FINISHED'}
 
     def invoke(self, context, event):
-        prefs = plugin_prefs.get_preferences()
-        self.texture_name_from_image_path = prefs.object_texture_names_from_path
+        self._init_from_preferences()
         return super().invoke(context, event)
+
+
+@registry.module_thing
+class OpExportOgfs(bpy.types.Operator, _WithExportOptions):
+    bl_idname = 'xray_export.ogfs'
+    bl_label = 'Export selected .ogf-s'
+    bl_description = 'Exports the selected root objects as X-Ray game objects'
+
+    objects = bpy.props.StringProperty(options={'HIDDEN'})
+
+    directory = bpy.props.StringProperty(subtype='DIR_PATH')
+
+    @execute_with_logger
+    @set_cursor_state
+    def execute(self, context):
+        objs = [context.scene.objects[name] for name in self.objects.split(',')]
+        for timings in exp.export_files(objs, self.directory, self._mk_export_context()):
+            self.report({'INFO'}, '%s: extract %.3fs, encode %.3fs, write %.3fs, %i bytes' % (
+                timings.name, timings.extract, timings.encode, timings.write, timings.size
+            ))
+        return {'FINISHED'}
+
+    def invoke(self, context, _event):
+        roots = [obj for obj in context.selected_objects if obj.xray.isroot]
+        if not roots:
+            self.report({'ERROR'}, 'No root objects selected')
+            return {'CANCELLED'}
+        self.objects = ','.join(obj.name for obj in roots)
+        self._init_from_preferences()
+        context.window_manager.fileselect_add(self)
+        return {'RUNNING_MODAL'}
@@ -0,0 +1,92 @@
+import bpy
+
+from ..xray_io import ChunkedWriter, PackedWriter
+from ..xray_motions import export_omf_motions, motion_export_name, ExportBonesTable
+from ..ogf.fmt import Chunks, SMPARAMS_VERSION, SMPARAMS_VERSION_SOC
+from ..utils import AppError
+
+
+class ExportContext:
+    def __init__(self, armature, fmt_version=None):
+        self.armature = armature
+        self.soc = fmt_version == 'soc'
+
+
+_BI_NONE = 0xffff
+_MOTION_FX = 0x1
+
+
+def _partitions(armature, bones):
+    """
+    Returns (name, bones) of the non-empty bone groups, the game needs every
+    bone in some partition, so the ungrouped ones go to the 'default' one.
+    """
+    groups = [(group.name, []) for group in armature.pose.bone_groups]
+    ungrouped = []
+    for name in bones:
+        group = armature.pose.bones[name].bone_group
+        if group is None:
+            ungrouped.append(name)
+        else:
+            groups[armature.pose.bone_groups.find(group.name)][1].append(name)
+    partitions = [group for group in groups if group[1]]
+    if ungrouped:
+        partitions.append(('default', ungrouped))
+    return partitions
+
+
+def _export_params(pkw, armature, actions, bones, context):
+    bones_indices = {name: idx for idx, name in enumerate(bones)}
+    partitions = _partitions(armature, bones)
+    partitions_indices = {name: idx for idx, (name, _) in enumerate(partitions)}
+
+    pkw.putf('H', SMPARAMS_VERSION_SOC if context.soc else SMPARAMS_VERSION)
+    pkw.putf('H', len(partitions))
+    for name, part_bones in partitions:
+        pkw.puts(name)
+        pkw.putf('H', len(part_bones))
+        for bone in part_bones:
+            pkw.puts(bone)
+            pkw.putf('I', bones_indices[bone])
+
+    pkw.putf('H', len(actions))
+    for idx, action in enumerate(actions):
+        xray = action.xray
+        bone_or_part = _BI_NONE
+        if xray.flags & _MOTION_FX:
+            # the effects are played from a bone, the root one by default
+            bone_or_part = 0
+            if xray.bonepart < len(armature.pose.bones):
+                bone_or_part = bones_indices.get(armature.pose.bones[xray.bonepart].name, 0)
+        elif xray.bonepart < len(armature.pose.bone_groups):
+            bone_group = armature.pose.bone_groups[xray.bonepart]
+            bone_or_part = partitions_indices.get(bone_group.name, _BI_NONE)
+        pkw.puts(motion_export_name(action, armature))
+        pkw.putf('I', xray.flags)
+        pkw.putf('HH', bone_or_part, idx)
+        pkw.putf('ffff', xray.speed, xray.power, xray.accrue, xray.falloff)
+        if not context.soc:
+            pkw.putf('I', 0)  # marks count
+
+
+def export_omf_file(fpath, context):
+    armature = context.armature
+    actions = []
+    for motion in armature.xray.motions_collection:
+        action = bpy.data.actions.get(motion.name)
+        if action is None:
+            raise AppError('action "%s" not found' % motion.name)
+        actions.append(action)
+    if not actions:
+        raise AppError('armature "%s" has no motions' % armature.name)
+    bones = [bone.bone.name for bone in ExportBonesTable(armature).bones]
+
+    cwriter = ChunkedWriter()
+    motions = ChunkedWriter()
+    export_omf_motions(motions, actions, armature, key16bit=not context.soc)
+    cwriter.put(Chunks.S_MOTIONS, motions)
+    pkw = PackedWriter()
+    _export_params(pkw, armature, actions, bones, context)
+    cwriter.put(Chunks.S_SMPARAMS, pkw)
+    with open(fpath, 'wb') as file:
+        file.write(cwriter.data)
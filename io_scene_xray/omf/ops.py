@@ -0,0 +1,35 @@
+import bpy
+
+from .. import registry, plugin_prefs
+from ..utils import invoke_require_armature, FilenameExtHelper
+
+
+@registry.module_thing
+class OpExportOmf(bpy.types.Operator, FilenameExtHelper):
+    bl_idname = 'xray_export.omf'
+    bl_label = 'Export .omf'
+    bl_description = 'Exports the motions of the armature as X-Ray compiled motions'
+
+    filename_ext = '.omf'
+    filter_glob = bpy.props.StringProperty(default='*' + filename_ext, options={'HIDDEN'})
+
+    fmt_version = plugin_prefs.PropSDKVersion()
+
+    def draw(self, _context):
+        layout = self.layout
+        row = layout.split()
+        row.label('Format Version:')
+        row.row().prop(self, 'fmt_version', expand=True)
+
+    def export(self, context):
+        from .exp import export_omf_file, ExportContext
+        export_context = ExportContext(
+            armature=context.active_object,
+            fmt_version=self.fmt_version
+        )
+        export_omf_file(self.filepath, export_context)
+
+    @invoke_require_armature
+    def invoke(self, context, event):
+        self.fmt_version = plugin_prefs.get_preferences().sdk_version
+        return super().invoke(context, event)
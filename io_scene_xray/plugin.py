@@ -14,6 +14,7 @@ from .utils import (
 )
 from . import plugin_prefs
 from . import registry
+from . import xray_motions
 from .details import ops as det_ops
 from .err import ops as err_ops
 from .scene import ops as scene_ops
@@ -22,6 +23,7 @@ from .obj.imp import ops as object_imp_ops
 from .anm import ops as anm_ops
 from .skl import ops as skl_ops
 from .ogf import ops as ogf_ops
+from .omf import ops as omf_ops
 
 
 @registry.module_thing
@@ -94,8 +96,11 @@ class XRayExportMenu(bpy.types.Menu):
             text='Source Object (.object)'
         )
         layout.operator(anm_ops.OpExportAnm.bl_idname, text='Animation (.anm)')
+        layout.operator(anm_ops.OpExportAnms.bl_idname, text='Selected Animations (.anm)')
         layout.operator(skl_ops.OpExportSkls.bl_idname, text='Skeletal Animation (.skls)')
         layout.operator(ogf_ops.OpExportOgf.bl_idname, text='Game Object (.ogf)')
+        layout.operator(ogf_ops.OpExportOgfs.bl_idname, text='Selected Game Objects (.ogf)')
+        layout.operator(omf_ops.OpExportOmf.bl_idname, text='Game Motions (.omf)')
         layout.operator(det_ops.OpExportDMs.bl_idname, text='Detail Model (.dm)')
         layout.operator(
             det_ops.OpExportLevelDetails.bl_idname,
@@ -128,10 +133,15 @@ _INITIALIZER = ObjectsInitializer([
 @bpy.app.handlers.persistent
 def load_post(_):
     _INITIALIZER.sync('LOADED', bpy.data)
+    xray_motions.invalidate_bones_tables()
 
 @bpy.app.handlers.persistent
 def scene_update_post(_):
     _INITIALIZER.sync('CREATED', bpy.data)
+    if bpy.data.armatures.is_updated:
+        xray_motions.invalidate_bones_tables(
+            armature for armature in bpy.data.armatures if armature.is_updated
+        )
 
 
 #noinspection PyUnusedLocal
@@ -160,6 +170,9 @@ def menu_func_export(self, _context):
 def menu_func_export_ogf(self, _context):
     icon = get_stalker_icon()
     self.layout.operator(ogf_ops.OpExportOgf.bl_idname, text='X-Ray game object (.ogf)', icon_value=icon)
+    self.layout.operator(
+        omf_ops.OpExportOmf.bl_idname, text='X-Ray game motions (.omf)', icon_value=icon
+    )
 
 
 def menu_func_xray_import(self, _context):
@@ -226,6 +239,7 @@ def register():
     registry.register_thing(anm_ops, __name__)
     registry.register_thing(skl_ops, __name__)
     registry.register_thing(ogf_ops, __name__)
+    registry.register_thing(omf_ops, __name__)
     registry.register_thing(motion_list, __name__)
     scene_ops.register_operators()
     det_ops.register_operators()
@@ -244,6 +258,7 @@ def unregister():
     det_ops.unregister_operators()
     scene_ops.unregister_operators()
     registry.unregister_thing(motion_list, __name__)
+    registry.unregister_thing(omf_ops, __name__)
     registry.unregister_thing(ogf_ops, __name__)
     registry.unregister_thing(skl_ops, __name__)
     registry.unregister_thing(anm_ops, __name__)
@@ -67,6 +67,14 @@ def PropAnmCameraAnimation():
     )
 
 
+def PropOptimizeVertexCache():
+    return bpy.props.BoolProperty(
+        name='Optimize Vertex Cache',
+        description='Reorder triangles and vertices for the GPU vertex cache',
+        default=False
+    )
+
+
 def PropUseExportPaths():
     return bpy.props.BoolProperty(
         name='Use Export Paths',
@@ -180,6 +188,35 @@ class PluginPreferences(bpy.types.AddonPreferences):
     object_texture_names_from_path = PropObjectTextureNamesFromPath()
     object_bones_custom_shapes = PropObjectBonesCustomShapes()
     anm_create_camera = PropAnmCameraAnimation()
+    skls_browser_cache_size = bpy.props.IntProperty(
+        name='Skls Browser Cache Size',
+        default=16, min=1, soft_max=256,
+        description='Count of the recently viewed .skls animations kept decoded'
+    )
+    skls_browser_prefetch = bpy.props.IntProperty(
+        name='Skls Browser Prefetch',
+        default=2, min=0, max=16,
+        description='Count of the next and previous .skls animations decoded in background'
+    )
+
+    skls_browser_cache_keys = bpy.props.IntProperty(
+        name='Skls Browser Cache Keyframes',
+        default=1000000, min=0, soft_max=10000000,
+        description='Total count of the keyframes (keys of all bones) of the kept .skls animations'
+    )
+    skls_index_next_to_file = bpy.props.BoolProperty(
+        name='Store Skls Index Next to File',
+        default=False,
+        description='Write the motions index of a .skls file next to it '
+                    'instead of the temporary directory'
+    )
+    use_worker_processes = bpy.props.BoolProperty(
+        name='Encode in Worker Processes',
+        default=False,
+        description='Encode the exported motions and the batch-exported game objects in forked '
+                    'worker processes. Works only on Linux and macOS: elsewhere, or while '
+                    'other Python threads run, the encoding stays serial'
+    )
 
     objects_folder = bpy.props.StringProperty(
         name='Objects Folder',
@@ -233,6 +270,11 @@ class PluginPreferences(bpy.types.AddonPreferences):
             _, box_n = collapsible.draw(box, 'plugin_prefs:defaults.anm', 'Animation', style='tree')
             if box_n:
                 prop_bool(box_n, self, 'anm_create_camera')
+                box_n.prop(self, 'skls_browser_cache_size')
+                box_n.prop(self, 'skls_browser_cache_keys')
+                box_n.prop(self, 'skls_browser_prefetch')
+                prop_bool(box_n, self, 'skls_index_next_to_file')
 
         prop_bool(layout, self, 'expert_mode')
         prop_bool(layout, self, 'compact_menus')
+        prop_bool(layout, self, 'use_worker_processes')
@@ -1,7 +1,7 @@
 import bpy
 
 from ..xray_io import ChunkedWriter, PackedWriter
-from ..xray_motions import export_motion, export_motions
+from ..xray_motions import export_motion, write_motions
 
 
 class ExportContext:
@@ -25,10 +25,8 @@ def export_skl_file(fpath, context):
 
 def export_skls_file(fpath, context):
     with open(fpath, 'wb') as file:
-        writer = PackedWriter()
         actions = []
         for motion in bpy.context.object.xray.motions_collection:
             action = bpy.data.actions[motion.name]
             actions.append(action)
-        export_motions(writer, actions, context.armature)
-        file.write(writer.data)
+        write_motions(file, actions, context.armature)
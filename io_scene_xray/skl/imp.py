@@ -1,7 +1,9 @@
+import mmap
 from os.path import splitext, basename
 
 from ..xray_io import ChunkedReader, PackedReader
-from ..xray_motions import import_motion, import_motions
+from ..xray_motions import import_motion, import_motions, MOTIONS_FILTER_ALL
+from .index import load_index
 from .. import log
 
 
@@ -18,8 +20,7 @@ def _import_skl(fpath, context, chunked_reader):
     for cid, cdata in chunked_reader:
         if cid == 0x1200:
             reader = PackedReader(cdata)
-            bonesmap = {b.name.lower(): b for b in context.armature.data.bones}
-            act = import_motion(reader, context.armature, bonesmap, set())
+            act = import_motion(reader, context.armature, set())
             act.name = name
         else:
             log.debug('unknown chunk', cid=cid)
@@ -31,6 +32,24 @@ def import_skl_file(fpath, context):
 
 
 def import_skls_file(fpath, context):
+    if context.motions_filter is MOTIONS_FILTER_ALL:
+        with open(fpath, 'rb') as file:
+            reader = PackedReader(file.read())
+            import_motions(reader, context.armature, context.motions_filter)
+        return
+
+    # seek to the selected motions only, the rest of the file isn't read
+    motions = [info for info in load_index(fpath) if context.motions_filter(info.name)]
+    if not motions:
+        return
     with open(fpath, 'rb') as file:
-        reader = PackedReader(file.read())
-        import_motions(reader, context.armature, context.motions_filter)
+        data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            reader = PackedReader(data)
+            reported = set()
+            for info in motions:
+                reader.set_offset(info.offset)
+                import_motion(reader, context.armature, reported)
+        finally:
+            reader = None
+            data.close()
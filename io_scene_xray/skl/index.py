@@ -0,0 +1,91 @@
+import hashlib
+import os
+import struct
+import tempfile
+
+from ..xray_io import PackedReader, PackedWriter
+from ..xray_motions import MotionInfo, examine_motions_info
+from .. import log, plugin_prefs
+
+
+_INDEX_EXT = '.index'
+_INDEX_MAGIC = b'XRSKLSIDX'
+_INDEX_VERSION = 1
+_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'io_scene_xray-skls-index')
+
+
+def _cached_index_path(fpath, cache_dir):
+    key = hashlib.md5(os.path.abspath(fpath).encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, key + _INDEX_EXT)
+
+
+def _file_key(fpath):
+    stat = os.stat(fpath)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def _read_index(ipath, file_key):
+    with open(ipath, 'rb') as file:
+        data = file.read()
+    if not data.startswith(_INDEX_MAGIC):
+        return None
+    reader = PackedReader(data[len(_INDEX_MAGIC):])
+    version, size, mtime = reader.getf('<HQq')
+    if (version != _INDEX_VERSION) or ((size, mtime) != file_key):
+        return None
+    motions = []
+    for _ in range(reader.getf('<I')[0]):
+        name = reader.gets()
+        motions.append(MotionInfo(name, *reader.getf('<QIIfH')))
+    return motions
+
+
+def _write_index(ipath, file_key, motions):
+    writer = PackedWriter()
+    writer.data += _INDEX_MAGIC
+    writer.putf('<HQq', _INDEX_VERSION, *file_key)
+    writer.putf('<I', len(motions))
+    for info in motions:
+        writer.puts(info.name)
+        writer.putf(
+            '<QIIfH',
+            info.offset, info.frame_start, info.frame_end, info.fps, info.bones_count
+        )
+    tmp_path = ipath + '.tmp'
+    with open(tmp_path, 'wb') as file:
+        file.write(writer.data)
+    os.replace(tmp_path, ipath)
+
+
+def load_index(fpath, next_to_file=None, cache_dir=_CACHE_DIR):
+    """
+    Returns the list of `MotionInfo` of the .skls file.
+    The index is stored in the cache directory, or next to the file when
+    `next_to_file` is set (by default it is taken from the preferences).
+    It is rebuilt when the file size or modification time is changed.
+    """
+    if next_to_file is None:
+        next_to_file = plugin_prefs.get_preferences().skls_index_next_to_file
+    sidecar_path = fpath + _INDEX_EXT
+    cached_path = _cached_index_path(fpath, cache_dir)
+    file_key = _file_key(fpath)
+    for ipath in (sidecar_path, cached_path):
+        try:
+            motions = _read_index(ipath, file_key)
+        except (OSError, ValueError, struct.error):
+            continue
+        if motions is not None:
+            return motions
+
+    with open(fpath, 'rb') as file:
+        motions = list(examine_motions_info(file.read()))
+
+    # the cache directory is the fallback for the read-only file's directory
+    for ipath in ((sidecar_path, cached_path) if next_to_file else (cached_path, )):
+        try:
+            os.makedirs(os.path.dirname(ipath), exist_ok=True)
+            _write_index(ipath, file_key, motions)
+            break
+        except OSError as error:
+            log.debug('cannot write skls index', path=ipath, error=error)
+    return motions
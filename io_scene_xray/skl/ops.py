@@ -94,9 +94,8 @@ class OpImportSkl(TestReadyOperator, io_utils.ImportHelper):
     @staticmethod
     def _examine_file(fpath):
         if fpath.lower().endswith('.skls'):
-            from ..xray_motions import examine_motions
-            with open(fpath, 'rb') as file:
-                return examine_motions(file.read())
+            from .index import load_index
+            return [info.name for info in load_index(fpath)]
         return tuple()
 
     @execute_with_logger
@@ -107,7 +106,7 @@ class OpImportSkl(TestReadyOperator, io_utils.ImportHelper):
             return {'CANCELLED'}
         from .imp import import_skl_file, import_skls_file, ImportContext
         motions_filter = MOTIONS_FILTER_ALL
-        if self.motions:
+        if self.motions and not all(m.flag for m in self.motions):
             selected_names = set(m.name for m in self.motions if m.flag)
             motions_filter = lambda name: name in selected_names
         import_context = ImportContext(
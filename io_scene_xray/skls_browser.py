@@ -1,10 +1,17 @@
+import collections
 import io
+import mmap
+import queue
+import threading
+import time
 from typing import List, Dict, Tuple, Optional
 
 import bpy
 
 from .xray_io import PackedReader
-from .xray_motions import (import_motion, _skip_motion_rest)
+from .xray_motions import import_motion, decode_motion_steps, create_motion_action, bones_table
+from .skl.index import load_index
+from .plugin_prefs import get_preferences
 
 
 class VIEW3D_PT_skls_animations(bpy.types.Panel):
@@ -41,6 +48,105 @@ class XRaySklsAnimationProperties(bpy.types.PropertyGroup):
     frames = bpy.props.IntProperty(name='Frames')
 
 
+def _animation_ranges(animations, size):
+    'Returns the (start, end) byte range of each animation, the next one starts at the end'
+    offsets = sorted(offset for offset, _ in animations.values())
+    ends = dict(zip(offsets, offsets[1:] + [size]))
+    return {name: (offset, ends[offset]) for name, (offset, _) in animations.items()}
+
+
+class _Prefetcher():
+    '''
+    Pages in the requested animations of the memory-mapped file in a
+    background thread, so the decoding doesn't wait for the disk.
+    The animations are decoded on the main thread by step() in small
+    time-bounded portions, as the decoding holds the GIL.
+    '''
+
+    def __init__(self, data, animations):
+        self._data = data
+        self._ranges = _animation_ranges(animations, len(data))
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._wanted = ()
+        self._paged = collections.OrderedDict() # name: bones table, ready to be decoded
+        self._decoding = None # (name, bones table, decode_motion_steps generator)
+        self._decoded = collections.OrderedDict() # name: (bones table, DecodedMotion)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def request(self, names, bones):
+        'Replaces the pending requests by the new animation names'
+        names = tuple(names)
+        with self._lock:
+            self._wanted = names
+            for pending in (self._paged, self._decoded):
+                for name in tuple(pending.keys()):
+                    if name not in names:
+                        del pending[name]
+        if (self._decoding is not None) and (self._decoding[0] not in names):
+            self._decoding = None
+        for name in names:
+            self._queue.put((name, bones))
+
+    def take(self, name, bones):
+        item = self._decoded.pop(name, None)
+        if (item is None) or (item[0] is not bones):
+            return None
+        return item[1]
+
+    def pop(self, bones):
+        'Returns any decoded animation or None'
+        while self._decoded:
+            _, (item_bones, motion) = self._decoded.popitem(last=False)
+            if item_bones is bones:
+                return motion
+        return None
+
+    def step(self, deadline):
+        'Decodes the paged in animations until the `deadline` of time.perf_counter()'
+        while time.perf_counter() < deadline:
+            if self._decoding is None:
+                with self._lock:
+                    if not self._paged:
+                        return
+                    name, bones = self._paged.popitem(last=False)
+                reader = PackedReader(self._data)
+                reader.set_offset(self._ranges[name][0])
+                reader.gets()
+                self._decoding = (name, bones, decode_motion_steps(reader, name, bones))
+            name, bones, steps = self._decoding
+            try:
+                motion = next(steps)
+            except Exception:
+                self._decoding = None # the error will be reported when the animation is selected
+                continue
+            if motion is not None:
+                self._decoding = None
+                self._decoded[name] = (bones, motion)
+
+    def stop(self):
+        with self._lock:
+            self._wanted = ()
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            name, bones = job
+            with self._lock:
+                if (name not in self._wanted) or (name in self._paged):
+                    continue
+            start, end = self._ranges[name]
+            self._data[start:end:mmap.PAGESIZE] # touches each page, so it's read from the disk here
+            with self._lock:
+                if name in self._wanted:
+                    self._paged[name] = bones
+
+
 class OpBrowseSklsFile(bpy.types.Operator):
     'Shows file open dialog, reads .skls file to buffer, clears & populates animations list'
     bl_idname = 'xray.browse_skls_file'
@@ -55,32 +161,118 @@ class OpBrowseSklsFile(bpy.types.Operator):
         Used to read animations from .skls file.
         Because .skls file can has big size and reading may take long time, so the animations
         cached by byte offset in file.
-        Holds entire .skls file in memory as binary blob.
+        The file is memory-mapped, so only the pages of the decoded animations are read,
+        the pages of the prefetched ones are read in a background thread.
+        Recently decoded actions of the armature are kept in LRU order (self.actions), the
+        least recently used ones are removed from bpy.data.actions when the count or the
+        keyframes limit of the cache is exceeded. The viewed animation and its requested
+        neighbours are evicted last.
         '''
-        __slots__ = 'pr', 'file_path', 'animations'
+        __slots__ = 'pr', 'file_path', 'armature_name', 'animations', 'actions', 'keys_count', \
+            '_current', '_neighbours', '_file', '_mmap', '_prefetcher'
 
-        def __init__(self, file_path):
+        def __init__(self, file_path, armature_name):
             self.file_path = file_path
+            self.armature_name = armature_name # the owner of the actions
             self.animations = {} # cached animations info (name: (file_offset, frames_count))
-            with io.open(file_path, mode='rb') as f:
-                # read entire .skls file into memory
-                self.pr = PackedReader(f.read())
+            # decoded animations (name: (action_name, keys))
+            self.actions = collections.OrderedDict()
+            self.keys_count = 0 # keyframes of the decoded animations
+            self._current = None # the viewed animation
+            self._neighbours = frozenset() # the last requested for prefetch animations
+            self._file = io.open(file_path, mode='rb')
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.pr = PackedReader(self._mmap)
             self._index_animations()
+            self._prefetcher = _Prefetcher(self._mmap, self.animations)
 
         def _index_animations(self):
-            'Fills the cache (self.animations) by processing entire binary blob'
-            animations_count = self.pr.getf('I')[0]
-            for _ in range(animations_count):
-                # index animation
-                offset = self.pr.offset() # first byte of the animation name
-                name = self.pr.gets() # animation name
-                offset2 = self.pr.offset()
-                frames_range = self.pr.getf('II')
-                self.animations[name] = (offset, int(frames_range[1] - frames_range[0]))
-                # skip the rest bytes of skl animation to the next animation
-                self.pr.set_offset(offset2)
-                skip = _skip_motion_rest(self.pr.getv(), 0)
-                self.pr.skip(skip)
+            'Fills the cache (self.animations) from the index file, the index is built if needed'
+            for info in load_index(self.file_path):
+                self.animations[info.name] = (info.offset, int(info.frame_end - info.frame_start))
+
+        def _armature(self):
+            return bpy.data.objects.get(self.armature_name)
+
+        def _cache(self, name, act):
+            keys = sum(len(fcurve.keyframe_points) for fcurve in act.fcurves)
+            self.actions[name] = (act.name, keys)
+            self.keys_count += keys
+
+        def _uncache(self, name):
+            act_name, keys = self.actions.pop(name)
+            self.keys_count -= keys
+            return act_name
+
+        def get_action(self, name):
+            'Returns the cached action or imports a new one, evicts the least recently used ones'
+            bpy_armature = self._armature()
+            self._current = name
+            act = None
+            if name in self.actions:
+                act = bpy.data.actions.get(self._uncache(name))
+            if act is None:
+                reported = set() # bones names that has problems while import
+                motion = self._prefetcher.take(name, bones_table(bpy_armature))
+                if motion is not None:
+                    act = create_motion_action(motion, bpy_armature, reported)
+                else:
+                    self.pr.set_offset(self.animations[name][0])
+                    act = import_motion(self.pr, bpy_armature, reported)
+            self._cache(name, act)
+            self.evict()
+            return act
+
+        def prefetch(self, names):
+            'Starts decoding of the animations which are not cached yet'
+            names = list(names)
+            self._neighbours = frozenset(names)
+            names = [name for name in names if name not in self.actions]
+            self._prefetcher.request(names, bones_table(self._armature()))
+
+        def create_prefetched(self, deadline):
+            '''
+            Decodes the prefetched animations until the `deadline` of time.perf_counter()
+            and creates the action of one of the decoded ones, returns False if there are none
+            '''
+            bpy_armature = self._armature()
+            self._prefetcher.step(deadline)
+            motion = self._prefetcher.pop(bones_table(bpy_armature))
+            if motion is None:
+                return False
+            if motion.name not in self.actions:
+                self._cache(motion.name, create_motion_action(motion, bpy_armature, set()))
+                self.evict()
+            return True
+
+        def evict(self, limit=None, keys_limit=None):
+            prefs = get_preferences()
+            if limit is None:
+                limit = prefs.skls_browser_cache_size
+            if keys_limit is None:
+                keys_limit = prefs.skls_browser_cache_keys
+            bpy_armature = self._armature()
+            # the least recently used first, then the neighbours and the viewed animation
+            candidates = sorted(
+                self.actions,
+                key=lambda name: (name == self._current, name in self._neighbours)
+            )
+            for name in candidates:
+                if len(self.actions) <= limit and self.keys_count <= keys_limit:
+                    break
+                if (name == self._current) and limit:
+                    break # keep the viewed animation
+                _remove_action(bpy_armature, self._uncache(name))
+
+        def close(self):
+            self._prefetcher.stop()
+            self.evict(0, 0)
+            self.pr = None
+            try:
+                self._mmap.close()
+            except BufferError:
+                pass # the views are still alive, the mapping is closed by the garbage collector
+            self._file.close()
 
 
     filepath = bpy.props.StringProperty(subtype='FILE_PATH')
@@ -97,7 +289,12 @@ class OpBrowseSklsFile(bpy.types.Operator):
         context.window.cursor_set('WAIT')
         sk = context.object.xray_skls
         sk.skls_animations.clear()
-        OpBrowseSklsFile.skls_file = OpBrowseSklsFile.SklsFile(file_path=self.filepath)
+        sk.skls_animations_prev_name = ''
+        if OpBrowseSklsFile.skls_file:
+            OpBrowseSklsFile.skls_file.close()
+        OpBrowseSklsFile.skls_file = OpBrowseSklsFile.SklsFile(
+            file_path=self.filepath, armature_name=context.object.name
+        )
         self.report({'INFO'}, 'Done: {} animation(s)'.format(len(OpBrowseSklsFile.skls_file.animations)))
         # fill list with animations names
         for name, offset_frames in OpBrowseSklsFile.skls_file.animations.items():
@@ -105,6 +302,7 @@ class OpBrowseSklsFile(bpy.types.Operator):
             newitem.name = name # animation name
             newitem.frames = offset_frames[1] # frames count
         context.window.cursor_set('DEFAULT')
+        bpy.ops.xray.skls_prefetch('INVOKE_DEFAULT')
         return {'FINISHED'}
 
     def invoke(self, context, event):
@@ -113,6 +311,43 @@ class OpBrowseSklsFile(bpy.types.Operator):
         return {'RUNNING_MODAL'}
 
 
+_PREFETCH_STEP_TIME = 0.02 # seconds of decoding per timer event
+
+
+class OpSklsPrefetch(bpy.types.Operator):
+    'Creates the actions of the animations decoded in background while the .skls file is open'
+    bl_idname = 'xray.skls_prefetch'
+    bl_label = 'Prefetch .skls animations'
+    bl_options = {'INTERNAL'}
+
+    _timer = None
+
+    def invoke(self, context, event):
+        self._skls_file = OpBrowseSklsFile.skls_file
+        wm = context.window_manager
+        self._timer = wm.event_timer_add(0.1, context.window)
+        wm.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        skls_file = OpBrowseSklsFile.skls_file
+        armature = None if skls_file is None else bpy.data.objects.get(skls_file.armature_name)
+        if (skls_file is not self._skls_file) or (armature is None):
+            context.window_manager.event_timer_remove(self._timer)
+            return {'CANCELLED'}
+        if event.type == 'TIMER':
+            self._skls_file.create_prefetched(time.perf_counter() + _PREFETCH_STEP_TIME)
+        return {'PASS_THROUGH'}
+
+
+def _neighbours(sk, index, count):
+    animations = sk.skls_animations
+    for offset in range(1, count + 1):
+        for idx in (index + offset, index - offset):
+            if 0 <= idx < len(animations):
+                yield animations[idx].name
+
+
 def skls_animations_index_changed(self, context):
     'Selected animation changed in .skls list'
 
@@ -120,6 +355,9 @@ def skls_animations_index_changed(self, context):
     if not OpBrowseSklsFile.skls_file:
         # .skls file not loaded
         return
+    if context.object.name != OpBrowseSklsFile.skls_file.armature_name:
+        # the list of the file opened for another object
+        return
     sk = context.object.xray_skls
     animation_name = sk.skls_animations[sk.skls_animations_index].name
     if animation_name == sk.skls_animations_prev_name:
@@ -136,48 +374,30 @@ def skls_animations_index_changed(self, context):
     except:
         pass
 
-    # remove previous animation if need
+    # unassign previous animation, it's kept in the cache of decoded animations
     ob = context.active_object
     if ob.animation_data:
-        # need to remove previous animation to free the memory since .skls can contains thousand animations
-        try:
-            act = ob.animation_data.action
-            ob.animation_data_clear()
-            act.user_clear()
-            bpy.data.actions.remove(action=act)
-        except:
-            pass
-
-    # delete from xray property group
+        ob.animation_data.action = None
+
+    # import animation or take it from the cache
+    context.window.cursor_set('WAIT')
+    act = OpBrowseSklsFile.skls_file.get_action(animation_name)
+    sk.skls_animations_prev_name = animation_name
+    context.window.cursor_set('DEFAULT')
+    prefs = get_preferences()
+    count = min(prefs.skls_browser_prefetch, (prefs.skls_browser_cache_size - 1) // 2)
+    OpBrowseSklsFile.skls_file.prefetch(_neighbours(sk, sk.skls_animations_index, count))
+    # try to find DopeSheet editor & set action to play
     try:
-        ob.xray.motions_collection.remove(ob.xray.motions_collection.keys().index(sk.skls_animations_prev_name))
-    except Exception as e:
+        ds = [ i for i in context.screen.areas if i.type=='DOPESHEET_EDITOR']
+        if ds and not ds[0].spaces[0].action:
+            ds[0].spaces[0].action = act
+    except:
         pass
 
-    # import animation
-    if animation_name not in bpy.data.actions:
-        # animation not imported yet # import & create animation to bpy.data.actions
-        context.window.cursor_set('WAIT')
-        # import animation
-        OpBrowseSklsFile.skls_file.pr.set_offset(OpBrowseSklsFile.skls_file.animations[animation_name][0])
-        # bpy_armature = context.armature
-        bonesmap = { b.name.lower(): b for b in ob.data.bones } # used to bone's reference detection
-        reported = set() # bones names that has problems while import
-        import_motion(OpBrowseSklsFile.skls_file.pr, ob, bonesmap, reported)
-        sk.skls_animations_prev_name = animation_name
-        context.window.cursor_set('DEFAULT')
-        # try to find DopeSheet editor & set action to play
-        try:
-            ds = [ i for i in context.screen.areas if i.type=='DOPESHEET_EDITOR']
-            if ds and not ds[0].spaces[0].action:
-                ds.spaces[0].action = bpy.data.actions[animation_name]
-        except:
-            pass
-
     # assign & play a new animation
     # bpy.data.armatures[0].pose_position='POSE'
     try:
-        act = bpy.data.actions[animation_name]
         if not ob.animation_data:
             ob.animation_data_create()
         ob.animation_data.action = act
@@ -195,6 +415,22 @@ def skls_animations_index_changed(self, context):
             pass
 
 
+def _remove_action(bpy_armature, act_name):
+    act = bpy.data.actions.get(act_name)
+    if act is None:
+        return
+    if bpy_armature is not None:
+        if bpy_armature.animation_data and bpy_armature.animation_data.action == act:
+            bpy_armature.animation_data.action = None
+        # delete from xray property group
+        motions = bpy_armature.xray.motions_collection
+        idx = motions.find(act_name)
+        if idx >= 0:
+            motions.remove(idx)
+    act.user_clear()
+    bpy.data.actions.remove(action=act)
+
+
 class XRayObjectProperties(bpy.types.PropertyGroup):
     skls_animations = bpy.props.CollectionProperty(type=XRaySklsAnimationProperties)
     skls_animations_index = bpy.props.IntProperty(update=skls_animations_index_changed)
@@ -206,6 +442,7 @@ classes = (
     VIEW3D_PT_skls_animations,
     XRaySklsAnimationProperties,
     OpBrowseSklsFile,
+    OpSklsPrefetch,
     XRayObjectProperties,
 )
 
@@ -1,5 +1,8 @@
+from array import array
 from contextlib import contextmanager
 import math
+import multiprocessing
+import threading
 
 from bpy_extras import io_utils
 
@@ -71,6 +74,14 @@ class Logger:
         message = message[0].upper() + message[1:]
         self._full.append((message, ctx))
 
+    def info(self, message, ctx=None):
+        message = str(message)
+        message = message.strip()
+        message = message[0].upper() + message[1:]
+        if ctx and ctx.data:
+            message += ': ' + ', '.join('%s=%s' % (key, val) for key, val in ctx.data.items())
+        self._report({'INFO'}, message)
+
     def flush(self, logname='log'):
         uniq = dict()
         for msg, _ in self._full:
@@ -156,10 +167,9 @@ def fix_ensure_lookup_table(bmv):
         bmv.ensure_lookup_table()
 
 
-def convert_object_to_space_bmesh(bpy_obj, space_matrix, local=False):
+def _evaluate_bmesh(bpy_obj):
     import bmesh
     import bpy
-    import mathutils
     mesh = bmesh.new()
     armmods = [mod for mod in bpy_obj.modifiers if mod.type == 'ARMATURE' and mod.show_viewport]
     try:
@@ -169,11 +179,20 @@ def convert_object_to_space_bmesh(bpy_obj, space_matrix, local=False):
     finally:
         for mod in armmods:
             mod.show_viewport = True
+    return mesh
+
+
+def _space_matrix(bpy_obj, space_matrix, local):
+    import mathutils
     if local:
         mat = mathutils.Matrix()
     else:
         mat = bpy_obj.matrix_world
-    mat = space_matrix.inverted() * mat
+    return space_matrix.inverted() * mat
+
+
+def _transform_bmesh(mesh, mat):
+    import bmesh
     mesh.transform(mat)
     need_flip = False
     for k in mat.to_scale():
@@ -185,6 +204,114 @@ def convert_object_to_space_bmesh(bpy_obj, space_matrix, local=False):
     return mesh
 
 
+def convert_object_to_space_bmesh(bpy_obj, space_matrix, local=False):
+    mesh = _evaluate_bmesh(bpy_obj)
+    return _transform_bmesh(mesh, _space_matrix(bpy_obj, space_matrix, local))
+
+
+class MeshCache:
+    """
+    Evaluated meshes of an export session: the modifiers of an object are
+    evaluated once and the transformed and triangulated forms are derived
+    from that. The meshes are shared, the consumers must not change them.
+    """
+
+    def __init__(self):
+        self._evaluated = {}
+        self._bmeshes = {}
+        self._meshes = {}
+
+    def bmesh(self, bpy_obj, space_matrix, local=False, triangulate=False):
+        mat = _space_matrix(bpy_obj, space_matrix, local)
+        key = (bpy_obj.as_pointer(), tuple(tuple(row) for row in mat), triangulate)
+        mesh = self._bmeshes.get(key, None)
+        if mesh is None:
+            if triangulate:
+                import bmesh
+                mesh = self.bmesh(bpy_obj, space_matrix, local).copy()
+                bmesh.ops.triangulate(mesh, faces=mesh.faces)
+                fix_ensure_lookup_table(mesh.verts)
+            else:
+                evaluated = self._evaluated.get(bpy_obj.as_pointer(), None)
+                if evaluated is None:
+                    evaluated = self._evaluated[bpy_obj.as_pointer()] = _evaluate_bmesh(bpy_obj)
+                mesh = _transform_bmesh(evaluated.copy(), mat)
+            self._bmeshes[key] = mesh
+        return mesh
+
+    def mesh(self, bpy_obj, space_matrix, local=False):
+        """Triangulated mesh as a temporary mesh datablock"""
+        import bpy
+        mesh = self.bmesh(bpy_obj, space_matrix, local, triangulate=True)
+        key = id(mesh)
+        bpy_data = self._meshes.get(key, None)
+        if bpy_data is None:
+            bpy_data = self._meshes[key] = bpy.data.meshes.new('.export-mesh')
+            mesh.to_mesh(bpy_data)
+        return bpy_data
+
+    def release(self):
+        import bpy
+        for bpy_data in self._meshes.values():
+            bpy.data.meshes.remove(bpy_data)
+        for mesh in self._bmeshes.values():
+            mesh.free()
+        for mesh in self._evaluated.values():
+            mesh.free()
+        self._meshes.clear()
+        self._bmeshes.clear()
+        self._evaluated.clear()
+
+
+@contextmanager
+def using_mesh_cache(context):
+    """Provides the export context with the mesh cache, releasing it at the end"""
+    if context.mesh_cache is not None:  # nested, the outer session owns the cache
+        yield context.mesh_cache
+        return
+    context.mesh_cache = MeshCache()
+    try:
+        yield context.mesh_cache
+    finally:
+        context.mesh_cache.release()
+        context.mesh_cache = None
+
+
+def create_process_pool(processes):
+    """
+    Returns a pool of forked worker processes or None when the work must be
+    done serially. The pool is used only when enabled in the preferences:
+    forking copies the whole Blender process, and a lock held by another
+    thread at that moment stays locked forever in the child. So the pool is
+    not created while the add-on runs its own threads (e.g. the skls browser
+    prefetcher), nor where fork is not available (Windows).
+    """
+    from . import plugin_prefs
+    if processes < 2 or not plugin_prefs.get_preferences().use_worker_processes:
+        return None
+    main_thread = threading.main_thread()
+    if any(thread is not main_thread for thread in threading.enumerate()):
+        return None
+    try:
+        # workers must share the already imported modules, bpy can't be imported there
+        return multiprocessing.get_context('fork').Pool(processes)
+    except (ValueError, OSError):
+        return None
+
+
+def read_deform_weights(bm, layer):
+    """Pulls the deform weights of the bmesh vertices into the sparse arrays"""
+    counts = array('I')
+    groups = array('I')
+    weights = array('f')
+    for vertex in bm.verts:
+        vertex_weights = vertex[layer]
+        counts.append(len(vertex_weights))
+        groups.extend(vertex_weights.keys())
+        weights.extend(vertex_weights.values())
+    return counts, groups, weights
+
+
 def calculate_mesh_bbox(verts):
     def vfunc(dst, src, func):
         dst.x = func(dst.x, src.x)
@@ -297,6 +424,23 @@ def _smooth_angle(current, previous):
     return current
 
 
+def fill_fcurve(fcurve, times, values, interpolations=None):
+    count = len(times)
+    if not count:
+        return
+    coords = [0.0] * (count * 2)
+    coords[0::2] = times
+    coords[1::2] = values
+    keyframes = fcurve.keyframe_points
+    keyframes.add(count)
+    keyframes.foreach_set('co', coords)
+    if interpolations is not None:
+        # enum properties can't be set by foreach_set
+        for keyframe, interpolation in zip(keyframes, interpolations):
+            keyframe.interpolation = interpolation
+    fcurve.update()
+
+
 def mkstruct(name, fields):
     template = 'class {n}:\n\t__slots__={f}\n\tdef __init__(self, {a}):\n\t\t{sf}={a}'\
     .format(
@@ -458,12 +602,16 @@ def invoke_require_armature(func):
     return wrapper
 
 
-def mk_export_context(texname_from_path, fmt_version=None, export_motions=True):
+def mk_export_context(texname_from_path, fmt_version=None, export_motions=True,
+                      optimize_vertex_cache=False, progressive_lods=0, max_bone_influences=0):
     from .obj.exp import ExportContext
     from . import plugin_prefs
     return ExportContext(
         textures_folder=plugin_prefs.get_preferences().textures_folder_auto,
         export_motions=export_motions,
         soc_sgroups=None if fmt_version is None else (fmt_version == 'soc'),
-        texname_from_path=texname_from_path
+        texname_from_path=texname_from_path,
+        optimize_vertex_cache=optimize_vertex_cache,
+        progressive_lods=progressive_lods,
+        max_bone_influences=max_bone_influences
     )
@@ -1,6 +1,6 @@
 from enum import Enum
-from .xray_io import PackedWriter
-from .utils import mkstruct
+from .utils import fill_fcurve
+from .xray_io import PackedReader
 from .log import warn, with_context
 
 
@@ -22,6 +22,9 @@ class Shape(Enum):
     BEZIER_2D = 5
 
 
+_PREP_KEYFRAME = PackedReader.prep('ffB')
+
+
 @with_context('import-envelope')
 def import_envelope(reader, fcurve, fps, koef):
     bhv0, bhv1 = map(Behavior, reader.getf('BB'))
@@ -49,22 +52,25 @@ def import_envelope(reader, fcurve, fps, koef):
 
     replace_unsupported_to = 'BEZIER'
     unsupported_occured = set()
-    fckf = fcurve.keyframe_points
-    key_frame = None
+    times, values, interpolations = [], [], []
     for _ in range(reader.getf('H')[0]):
-        value, time = reader.getf('ff')
-        shape = Shape(reader.getf('B')[0])
-        if key_frame:
+        value, time, shape = reader.getp(_PREP_KEYFRAME)
+        shape = Shape(shape)
+        if times:
+            # the shape of a key defines the interpolation of the previous one
             if shape == Shape.LINEAR:
-                key_frame.interpolation = 'LINEAR'
+                interpolations[-1] = 'LINEAR'
             elif shape == Shape.STEPPED:
-                key_frame.interpolation = 'CONSTANT'
+                interpolations[-1] = 'CONSTANT'
             else:
                 unsupported_occured.add(shape.name)
-                key_frame.interpolation = replace_unsupported_to
-        key_frame = fckf.insert(time * fps, value * koef)
+                interpolations[-1] = replace_unsupported_to
+        times.append(time * fps)
+        values.append(value * koef)
+        interpolations.append('BEZIER')
         if shape != Shape.STEPPED:
             reader.skip(14)
+    fill_fcurve(fcurve, times, values, interpolations)
 
     if unsupported_occured:
         warn(
@@ -74,7 +80,6 @@ def import_envelope(reader, fcurve, fps, koef):
         )
 
 
-KF = mkstruct('KeyFrame', ['time', 'value', 'shape'])
 EPSILON = 0.0001
 
 @with_context('export-envelope')
@@ -96,27 +101,26 @@ def export_envelope(writer, fcurve, fps, koef, epsilon=EPSILON):
     replace_unsupported_to = Shape.TCB
     unsupported_occured = set()
 
-    def generate_keys(keyframe_points):
-        prev_kf = None
-        for curr_kf in keyframe_points:
-            shape = Shape.STEPPED
-            if prev_kf is not None:
-                if prev_kf.interpolation == 'CONSTANT':
-                    shape = Shape.STEPPED
-                elif prev_kf.interpolation == 'LINEAR':
-                    shape = Shape.LINEAR
-                else:
-                    unsupported_occured.add(prev_kf.interpolation)
-                    shape = replace_unsupported_to
-            prev_kf = curr_kf
-            yield KF(curr_kf.co.x / fps, curr_kf.co.y / koef, shape)
-
-    kf_writer = PackedWriter()
-    keyframes = refine_keys(generate_keys(fcurve.keyframe_points), epsilon)
-    count = export_keyframes(kf_writer, keyframes)
-
-    writer.putf('H', count)
-    writer.putp(kf_writer)
+    times, values, shapes = [], [], []
+    prev_kf = None
+    for curr_kf in fcurve.keyframe_points:
+        shape = Shape.STEPPED
+        if prev_kf is not None:
+            if prev_kf.interpolation == 'CONSTANT':
+                shape = Shape.STEPPED
+            elif prev_kf.interpolation == 'LINEAR':
+                shape = Shape.LINEAR
+            else:
+                unsupported_occured.add(prev_kf.interpolation)
+                shape = replace_unsupported_to
+        prev_kf = curr_kf
+        times.append(curr_kf.co.x / fps)
+        values.append(curr_kf.co.y / koef)
+        shapes.append(shape)
+
+    keys = reduce_keys(times, values, shapes, epsilon, keep_last=(behavior != Behavior.CONSTANT))
+    writer.putf('H', len(keys[0]))
+    export_key_arrays(writer, *keys)
 
     if unsupported_occured:
         warn(
@@ -126,50 +130,100 @@ def export_envelope(writer, fcurve, fps, koef, epsilon=EPSILON):
         )
 
 
-def export_keyframes(writer, keyframes):
-    count = 0
+def export_envelope_samples(writer, times, values, epsilon=EPSILON):
+    """Writes the linearly interpolated samples as an envelope with the constant extrapolation"""
+    writer.putf('BB', Behavior.CONSTANT.value, Behavior.CONSTANT.value)
+    keys = reduce_keys(times, values, epsilon=epsilon)
+    writer.putf('H', len(keys[0]))
+    export_key_arrays(writer, *keys)
 
-    for keyframe in keyframes:
-        count += 1
-        writer.putf('ff', keyframe.value, keyframe.time)
-        writer.putf('B', keyframe.shape.value)
-        if keyframe.shape != Shape.STEPPED:
+
+def export_key_arrays(writer, times, values, shapes):
+    for time, value, shape in zip(times, values, shapes):
+        writer.putf('ff', value, time)
+        writer.putf('B', shape.value)
+        if shape != Shape.STEPPED:
             writer.putf('HHH', 32768, 32768, 32768)
             writer.putf('HHHH', 32768, 32768, 32768, 32768)
 
-    return count
-
-
-def refine_keys(keyframes, epsilon=EPSILON):
-    def significant(prev_kf, curr_kf, next_kf, skipped):
-        def is_oor(keyframe, derivative):
-            expected_value = (keyframe.time - prev_kf.time) * derivative + prev_kf.value
-            return abs(expected_value - keyframe.value) >= epsilon
-
-        if prev_kf is None:
-            return curr_kf is not None
-        if (curr_kf.shape == Shape.LINEAR) and (next_kf.shape == Shape.LINEAR):
-            derivative = (next_kf.value - prev_kf.value) / (next_kf.time - prev_kf.time)
-            if is_oor(curr_kf, derivative):
-                return True
-            for keyframe in skipped:
-                if is_oor(keyframe, derivative):
-                    return True
-            return False
-        if (abs(prev_kf.value - curr_kf.value) + abs(curr_kf.value - next_kf.value)) < epsilon:
-            return False
-        return True
-
-    prev_kf, curr_kf = None, None
-    skipped = []
-    for next_kf in keyframes:
-        if significant(prev_kf, curr_kf, next_kf, skipped):
-            skipped = []
-            prev_kf = curr_kf
-            yield curr_kf
-        elif curr_kf is not None:
-            skipped.append(curr_kf)
-        curr_kf = next_kf
-
-    if curr_kf and ((not prev_kf) or (abs(curr_kf.value - prev_kf.value) >= epsilon)):
-        yield curr_kf
+    return len(times)
+
+
+def reduce_keys(times, values, shapes=None, epsilon=EPSILON, keep_last=False):
+    """
+    Removes the keyframes which are restored by the linear interpolation (or
+    by the step hold) with an error that doesn't exceed the `epsilon`.
+    Runs in a single pass: each next key of a linear run narrows the corridor
+    of the slopes allowed from the last written key, until it becomes empty.
+    `shapes=None` means the linearly interpolated samples.
+    The trailing flat keys are dropped only for the constant extrapolation,
+    `keep_last` keeps the last key for the other ones.
+    Returns the (times, values, shapes) lists of the remaining keys.
+    """
+    count = len(times)
+    res_times, res_values, res_shapes = [], [], []
+    if not count:
+        return res_times, res_values, res_shapes
+
+    linear, stepped = Shape.LINEAR, Shape.STEPPED
+    anchor_time, anchor_value = times[0], values[0]
+    res_times.append(anchor_time)
+    res_values.append(anchor_value)
+    res_shapes.append(stepped if shapes is None else shapes[0])
+
+    pending = -1  # the last key of the current linear run
+    low = high = 0.0
+
+    def flush():
+        time = times[pending]
+        delta = time - anchor_time
+        slope = min(max((values[pending] - anchor_value) / delta, low), high)
+        value = anchor_value + slope * delta
+        res_times.append(time)
+        res_values.append(value)
+        res_shapes.append(linear)
+        return time, value
+
+    for idx in range(1, count):
+        shape = linear if shapes is None else shapes[idx]
+        time, value = times[idx], values[idx]
+        if shape == linear:
+            delta = time - anchor_time
+            if (pending != -1) and (delta > 0):
+                new_low = max(low, (value - epsilon - anchor_value) / delta)
+                new_high = min(high, (value + epsilon - anchor_value) / delta)
+                if new_low <= new_high:
+                    low, high, pending = new_low, new_high, idx
+                    continue
+            if pending != -1:
+                anchor_time, anchor_value = flush()
+                delta = time - anchor_time
+            if delta > 0:
+                low = (value - epsilon - anchor_value) / delta
+                high = (value + epsilon - anchor_value) / delta
+                pending = idx
+                continue
+            pending = -1
+        elif pending != -1:
+            anchor_time, anchor_value = flush()
+            pending = -1
+        if (shape == stepped) and (abs(value - anchor_value) < epsilon):
+            next_shape = stepped
+            if (idx + 1 < count) and (shapes is not None):
+                next_shape = shapes[idx + 1]
+            if next_shape == stepped:
+                continue
+        anchor_time, anchor_value = time, value
+        res_times.append(time)
+        res_values.append(value)
+        res_shapes.append(shape)
+
+    if (pending != -1) and (keep_last or not (low <= 0 <= high)):
+        flush()
+    elif keep_last and (res_times[-1] != times[-1]):
+        res_times.append(times[-1])
+        res_values.append(values[-1])
+        res_shapes.append(linear if shapes is None else shapes[-1])
+
+    return res_times, res_values, res_shapes
+
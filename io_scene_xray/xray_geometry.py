@@ -0,0 +1,600 @@
+from array import array
+import heapq
+import math
+import random
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def weld_rows(vertex_indices, attributes, width):
+    """
+    Merges the rows (vertex index + `width` floats of `attributes`) which
+    are bitwise equal in single precision.
+    Returns the first row of each unique vertex (in the first use order) and
+    the unique vertex index of each row.
+    """
+    if numpy is not None:
+        return _weld_rows_np(vertex_indices, attributes, width)
+    raw = array('f', (value + 0.0 for value in attributes)).tobytes()  # + 0.0 turns -0.0 to 0.0
+    stride = 4 * width
+    vmap = {}
+    first_rows = []
+    remap = []
+    for row, vidx in enumerate(vertex_indices):
+        key = (vidx, raw[row * stride:(row + 1) * stride])
+        unique = vmap.get(key)
+        if unique is None:
+            vmap[key] = unique = len(first_rows)
+            first_rows.append(row)
+        remap.append(unique)
+    return first_rows, remap
+
+
+def _weld_rows_np(vertex_indices, attributes, width):
+    count = len(vertex_indices)
+    if not count:
+        return [], []
+    rows = numpy.empty((count, width + 1), dtype=numpy.int32)
+    rows[:, 0] = numpy.asarray(vertex_indices, dtype=numpy.int32)
+    attrs = numpy.asarray(attributes, dtype=numpy.float32).reshape(count, width) + numpy.float32(0)
+    rows[:, 1:] = attrs.view(numpy.int32)
+    keys = rows.view(numpy.dtype((numpy.void, rows.itemsize * (width + 1)))).ravel()
+    _, first, inverse = numpy.unique(keys, return_index=True, return_inverse=True)
+    order = numpy.argsort(first, kind='mergesort')
+    rank = numpy.empty_like(order)
+    rank[order] = numpy.arange(len(order))
+    return first[order].tolist(), rank[inverse.ravel()].tolist()
+
+
+_CACHE_SIZE = 32
+_CACHE_DECAY_POWER = 1.5
+_LAST_TRIANGLE_SCORE = 0.75
+_VALENCE_BOOST_SCALE = 2.0
+_VALENCE_BOOST_POWER = 0.5
+ACMR_CACHE_SIZE = 16
+
+
+def _vertex_score(cache_position, remaining):
+    if not remaining:
+        return -1.0
+    score = 0.0
+    if cache_position >= 0:
+        if cache_position < 3:
+            score = _LAST_TRIANGLE_SCORE
+        else:
+            scale = 1.0 / (_CACHE_SIZE - 3)
+            score = (1.0 - (cache_position - 3) * scale) ** _CACHE_DECAY_POWER
+    return score + _VALENCE_BOOST_SCALE * remaining ** -_VALENCE_BOOST_POWER
+
+
+def optimize_vertex_cache(indices, vertices_count):
+    """
+    Reorders the triangles (a flat indices list) for the post-transform
+    vertex cache, using Tom Forsyth's linear-speed algorithm.
+    """
+    triangles_count = len(indices) // 3
+    vertex_triangles = [[] for _ in range(vertices_count)]
+    for tri in range(triangles_count):
+        for vidx in indices[tri * 3:tri * 3 + 3]:
+            vertex_triangles[vidx].append(tri)
+    positions = [-1] * vertices_count
+    scores = [_vertex_score(-1, len(tris)) for tris in vertex_triangles]
+    emitted = [False] * triangles_count
+    result = []
+    cache = []
+    best = -1
+    next_unemitted = 0
+    for _ in range(triangles_count):
+        if best < 0:
+            # there are no candidates in the cache, continue from the next unemitted one
+            while emitted[next_unemitted]:
+                next_unemitted += 1
+            best = next_unemitted
+        tri_vertices = list(indices[best * 3:best * 3 + 3])
+        result.extend(tri_vertices)
+        emitted[best] = True
+        for vidx in tri_vertices:
+            vertex_triangles[vidx].remove(best)
+        cache = tri_vertices + [vidx for vidx in cache if vidx not in tri_vertices]
+
+        touched = set()
+        for position, vidx in enumerate(cache):
+            positions[vidx] = position if position < _CACHE_SIZE else -1
+            scores[vidx] = _vertex_score(positions[vidx], len(vertex_triangles[vidx]))
+            touched.update(vertex_triangles[vidx])
+        del cache[_CACHE_SIZE:]
+
+        best = -1
+        best_score = -1.0
+        for tri in touched:
+            score = scores[indices[tri * 3]] + scores[indices[tri * 3 + 1]] \
+                + scores[indices[tri * 3 + 2]]
+            if score > best_score:
+                best_score = score
+                best = tri
+    return result
+
+
+def reorder_vertices(indices, vertices_count):
+    """
+    Renumbers the vertices in the order of the first use by the indices.
+    Returns the new indices and the old index of each new vertex.
+    """
+    remap = [-1] * vertices_count
+    order = []
+    result = []
+    for vidx in indices:
+        new_index = remap[vidx]
+        if new_index < 0:
+            remap[vidx] = new_index = len(order)
+            order.append(vidx)
+        result.append(new_index)
+    for vidx in range(vertices_count):
+        if remap[vidx] < 0:
+            order.append(vidx)
+    return result, order
+
+
+def calculate_acmr(indices, cache_size=ACMR_CACHE_SIZE):
+    """Average cache miss ratio (per triangle) of a FIFO vertex cache"""
+    triangles_count = len(indices) // 3
+    if not triangles_count:
+        return 0.0
+    cache = []
+    cached = set()
+    misses = 0
+    for vidx in indices:
+        if vidx in cached:
+            continue
+        misses += 1
+        cache.append(vidx)
+        cached.add(vidx)
+        if len(cache) > cache_size:
+            cached.discard(cache.pop(0))
+    return misses / triangles_count
+
+
+def optimize_indices(indices, vertices_count):
+    """
+    Optimizes the triangles order for the vertex cache and the vertices
+    order for the vertex fetch.
+    Returns the new indices, the old index of each new vertex and the ACMR
+    before and after the optimization. The original order is kept if the
+    optimization doesn't lower the ACMR.
+    """
+    acmr_before = calculate_acmr(indices)
+    optimized, order = reorder_vertices(
+        optimize_vertex_cache(indices, vertices_count), vertices_count
+    )
+    acmr_after = calculate_acmr(optimized)
+    if acmr_after >= acmr_before:
+        return list(indices), list(range(vertices_count)), acmr_before, acmr_before
+    return optimized, order, acmr_before, acmr_after
+
+
+def partition_triangles(indices, positions, max_vertices):
+    """
+    Splits the triangles (a flat indices list) into the spatially compact
+    parts which use at most `max_vertices` vertices each, bisecting the
+    triangle centers along the longest axis until every part fits.
+    `positions` holds 3 floats per vertex.
+    Returns the old index of each part vertex and the part indices, per part.
+    """
+    parts = []
+    stack = [list(range(len(indices) // 3))]
+    while stack:
+        triangles = stack.pop()
+        used = {indices[tri * 3 + corner] for tri in triangles for corner in range(3)}
+        if len(used) <= max_vertices:
+            parts.append(triangles)
+            continue
+        if len(triangles) < 2:
+            raise ValueError('a triangle does not fit into %i vertices' % max_vertices)
+        centers = {}
+        for tri in triangles:
+            center = [0.0, 0.0, 0.0]
+            for vidx in indices[tri * 3:tri * 3 + 3]:
+                for axis in range(3):
+                    center[axis] += positions[vidx * 3 + axis]
+            centers[tri] = center
+        extents = [
+            max(center[axis] for center in centers.values()) -
+            min(center[axis] for center in centers.values())
+            for axis in range(3)
+        ]
+        axis = extents.index(max(extents))
+        triangles.sort(key=lambda tri: centers[tri][axis])
+        middle = len(triangles) // 2
+        stack.append(triangles[middle:])
+        stack.append(triangles[:middle])
+
+    result = []
+    for triangles in parts:
+        remap = {}
+        order = []
+        part_indices = []
+        for tri in sorted(triangles):  # keep the original order inside the part
+            for vidx in indices[tri * 3:tri * 3 + 3]:
+                new_index = remap.get(vidx)
+                if new_index is None:
+                    remap[vidx] = new_index = len(order)
+                    order.append(vidx)
+                part_indices.append(new_index)
+        result.append((order, part_indices))
+    return result
+
+
+_BOUNDARY_WEIGHT = 100.0
+
+
+def _plane_quadric(normal, point, weight):
+    a, b, c = normal
+    d = -(a * point[0] + b * point[1] + c * point[2])
+    return [
+        weight * a * a, weight * a * b, weight * a * c, weight * a * d,
+        weight * b * b, weight * b * c, weight * b * d,
+        weight * c * c, weight * c * d,
+        weight * d * d,
+    ]
+
+
+def _quadric_error(quadric, point):
+    x, y, z = point
+    q = quadric
+    return (
+        q[0] * x * x + 2 * q[1] * x * y + 2 * q[2] * x * z + 2 * q[3] * x +
+        q[4] * y * y + 2 * q[5] * y * z + 2 * q[6] * y +
+        q[7] * z * z + 2 * q[8] * z +
+        q[9]
+    )
+
+
+def _sub(a, b):
+    return a[0] - b[0], a[1] - b[1], a[2] - b[2]
+
+
+def _cross(a, b):
+    return a[1] * b[2] - a[2] * b[1], a[2] * b[0] - a[0] * b[2], a[0] * b[1] - a[1] * b[0]
+
+
+def _triangle_cross(points, corners):
+    origin = points[corners[0]]
+    return _cross(_sub(points[corners[1]], origin), _sub(points[corners[2]], origin))
+
+
+def _dot(a, b):
+    return a[0] * b[0] + a[1] * b[1] + a[2] * b[2]
+
+
+def _normalized(vec):
+    length = math.sqrt(_dot(vec, vec))
+    if not length:
+        return None
+    return vec[0] / length, vec[1] / length, vec[2] / length
+
+
+def simplify_progressive(indices, positions, targets):
+    """
+    Collapses the edges in the order of the quadric error (Garland-Heckbert
+    half-edge collapses with the boundary preserving planes), taking a
+    snapshot of the mesh at each of the descending `targets` triangle counts.
+    `positions` holds 3 floats per vertex.
+    Returns the old index of each new vertex (the collapsed vertices go last,
+    in the reverse order) and the indices and the used vertices count of
+    each reached level.
+    """
+    vertices_count = len(positions) // 3
+    points = [tuple(positions[i * 3:i * 3 + 3]) for i in range(vertices_count)]
+    triangles = [list(indices[i:i + 3]) for i in range(0, len(indices), 3)]
+    vertex_triangles = [set() for _ in range(vertices_count)]
+    quadrics = [[0.0] * 10 for _ in range(vertices_count)]
+    edge_triangles = {}
+    for tri, corners in enumerate(triangles):
+        cross = _triangle_cross(points, corners)
+        normal = _normalized(cross)
+        for corner, vidx in enumerate(corners):
+            vertex_triangles[vidx].add(tri)
+            edge = tuple(sorted((vidx, corners[corner - 1])))
+            edge_triangles.setdefault(edge, []).append(tri)
+            if normal is not None:
+                quadric = _plane_quadric(normal, points[vidx], math.sqrt(_dot(cross, cross)) / 2)
+                quadrics[vidx] = [a + b for a, b in zip(quadrics[vidx], quadric)]
+    for (va, vb), tris in edge_triangles.items():
+        if len(tris) != 1:
+            continue
+        corners = triangles[tris[0]]
+        face_normal = _normalized(_cross(
+            _sub(points[corners[1]], points[corners[0]]),
+            _sub(points[corners[2]], points[corners[0]]),
+        ))
+        edge = _sub(points[vb], points[va])
+        normal = _normalized(_cross(edge, face_normal)) if face_normal else None
+        if normal is None:
+            continue
+        quadric = _plane_quadric(normal, points[va], _BOUNDARY_WEIGHT * _dot(edge, edge))
+        for vidx in (va, vb):
+            quadrics[vidx] = [a + b for a, b in zip(quadrics[vidx], quadric)]
+
+    stamps = [0] * vertices_count
+    heap = []
+
+    def push_edge(va, vb):
+        quadric = [a + b for a, b in zip(quadrics[va], quadrics[vb])]
+        heapq.heappush(heap, (_quadric_error(quadric, points[vb]), va, vb, stamps[va], stamps[vb]))
+        heapq.heappush(heap, (_quadric_error(quadric, points[va]), vb, va, stamps[vb], stamps[va]))
+
+    def flips(source, target):
+        for tri in vertex_triangles[source]:
+            corners = triangles[tri]
+            if target in corners:
+                continue
+            moved = [points[target] if vidx == source else points[vidx] for vidx in corners]
+            before = _triangle_cross(points, corners)
+            after = _cross(_sub(moved[1], moved[0]), _sub(moved[2], moved[0]))
+            if _dot(before, after) <= 0:
+                return True
+        return False
+
+    for va, vb in edge_triangles:
+        push_edge(va, vb)
+
+    alive = len(triangles)
+    collapsed_triangles = [False] * len(triangles)
+    levels = []
+    removed = []
+    targets = sorted(targets, reverse=True)
+    while targets and alive <= targets[0]:
+        levels.append((alive, len(removed)))
+        targets.pop(0)
+    snapshots = [[vidx for corners in triangles for vidx in corners]] * len(levels)
+    while targets and heap:
+        _, source, target, source_stamp, target_stamp = heapq.heappop(heap)
+        if stamps[source] != source_stamp or stamps[target] != target_stamp:
+            continue
+        if flips(source, target):
+            continue
+        for tri in list(vertex_triangles[source]):
+            corners = triangles[tri]
+            if target in corners:
+                for vidx in corners:
+                    vertex_triangles[vidx].discard(tri)
+                collapsed_triangles[tri] = True
+                alive -= 1
+            else:
+                corners[corners.index(source)] = target
+                vertex_triangles[target].add(tri)
+        vertex_triangles[source] = set()
+        quadrics[target] = [a + b for a, b in zip(quadrics[source], quadrics[target])]
+        stamps[source] += 1
+        stamps[target] += 1
+        removed.append(source)
+        neighbours = set()
+        for tri in vertex_triangles[target]:
+            neighbours.update(triangles[tri])
+        neighbours.discard(target)
+        for vidx in neighbours:
+            push_edge(target, vidx)
+        while targets and alive <= targets[0]:
+            targets.pop(0)
+            levels.append((alive, len(removed)))
+            snapshots.append([
+                vidx
+                for tri, corners in enumerate(triangles)
+                if not collapsed_triangles[tri]
+                for vidx in corners
+            ])
+
+    # the collapses past the last level are dropped
+    removed = removed[:levels[-1][1] if levels else 0]
+    removed_set = set(removed)
+    order = [vidx for vidx in range(vertices_count) if vidx not in removed_set]
+    order.extend(reversed(removed))
+    remap = [0] * vertices_count
+    for new_index, vidx in enumerate(order):
+        remap[vidx] = new_index
+    return order, [
+        ([remap[vidx] for vidx in snapshot], vertices_count - collapsed)
+        for snapshot, (_, collapsed) in zip(snapshots, levels)
+    ]
+
+
+_SPHERE_EPSILON = 1e-6
+
+
+def _sphere_2(pa, pb):
+    center = tuple((a + b) / 2 for a, b in zip(pa, pb))
+    return center, math.sqrt(_dot(_sub(pa, center), _sub(pa, center)))
+
+
+def _sphere_3(pa, pb, pc):
+    ab, ac = _sub(pb, pa), _sub(pc, pa)
+    normal = _cross(ab, ac)
+    denominator = 2 * _dot(normal, normal)
+    if not denominator:  # collinear points
+        return max((_sphere_2(pa, pb), _sphere_2(pa, pc), _sphere_2(pb, pc)), key=lambda s: s[1])
+    ab2, ac2 = _dot(ab, ab), _dot(ac, ac)
+    offset = _cross(normal, ab)
+    offset2 = _cross(ac, normal)
+    relative = tuple((ac2 * o1 + ab2 * o2) / denominator for o1, o2 in zip(offset, offset2))
+    center = tuple(a + r for a, r in zip(pa, relative))
+    return center, math.sqrt(_dot(relative, relative))
+
+
+def _sphere_4(pa, pb, pc, pd):
+    ab, ac, ad = _sub(pb, pa), _sub(pc, pa), _sub(pd, pa)
+    denominator = 2 * _dot(ab, _cross(ac, ad))
+    if abs(denominator) < 1e-12:  # coplanar points
+        candidates = [
+            _sphere_3(pa, pb, pc), _sphere_3(pa, pb, pd),
+            _sphere_3(pa, pc, pd), _sphere_3(pb, pc, pd),
+        ]
+        points = (pa, pb, pc, pd)
+        return min(
+            (sphere for sphere in candidates if all(_contains(sphere, p) for p in points)),
+            key=lambda s: s[1],
+            default=max(candidates, key=lambda s: s[1])
+        )
+    ab2, ac2, ad2 = _dot(ab, ab), _dot(ac, ac), _dot(ad, ad)
+    relative = tuple(
+        (ab2 * cd + ac2 * db + ad2 * bc) / denominator
+        for cd, db, bc in zip(_cross(ac, ad), _cross(ad, ab), _cross(ab, ac))
+    )
+    center = tuple(a + r for a, r in zip(pa, relative))
+    return center, math.sqrt(_dot(relative, relative))
+
+
+def _contains(sphere, point):
+    center, radius = sphere
+    delta = _sub(point, center)
+    return math.sqrt(_dot(delta, delta)) <= radius + _SPHERE_EPSILON * max(radius, 1.0)
+
+
+# the directions of the extreme points, which seed the support set of the bounding sphere
+_SPHERE_DIRECTIONS = (
+    (1, 0, 0), (0, 1, 0), (0, 0, 1),
+    (1, 1, 0), (1, -1, 0), (1, 0, 1), (1, 0, -1), (0, 1, 1), (0, 1, -1),
+    (1, 1, 1), (1, 1, -1), (1, -1, 1), (1, -1, -1),
+)
+
+
+def calculate_bounding_sphere(coords):
+    """
+    Minimal bounding sphere of the points, `coords` holds 3 floats per point.
+    Welzl's algorithm starts from the extreme points along the axes, so the
+    first spheres already contain most of the points. With numpy, it runs on
+    the extreme points along `_SPHERE_DIRECTIONS` only, and the farthest point
+    outside of the sphere is added to them until it contains all the points.
+    Returns the center and the radius.
+    """
+    points = sorted({tuple(coords[i:i + 3]) for i in range(0, len(coords) - 2, 3)})
+    if not points:
+        return (0.0, 0.0, 0.0), 0.0
+    if numpy is not None:
+        return _calculate_bounding_sphere_np(points)
+    support = set()
+    for axis in range(3):  # the projections to the diagonals cost more than they save here
+        projections = [point[axis] for point in points]
+        support.add(projections.index(min(projections)))
+        support.add(projections.index(max(projections)))
+    rest = [point for i, point in enumerate(points) if i not in support]
+    random.Random(len(points)).shuffle(rest)  # the expected linear time, but reproducible
+    # the sphere of the extreme points contains most of the rest ones
+    return _welzl_sphere([points[i] for i in sorted(support)] + rest)
+
+
+def _calculate_bounding_sphere_np(points):
+    array = numpy.array(points, dtype=numpy.float64)
+    projections = array.dot(numpy.array(_SPHERE_DIRECTIONS, dtype=numpy.float64).T)
+    support = sorted(set(projections.argmin(axis=0).tolist() + projections.argmax(axis=0).tolist()))
+    while True:
+        support_points = [points[i] for i in support]
+        random.Random(len(support)).shuffle(support_points)
+        sphere = _welzl_sphere(support_points)
+        deltas = array - numpy.array(sphere[0], dtype=numpy.float64)
+        farthest = int((deltas * deltas).sum(axis=1).argmax())
+        if _contains(sphere, points[farthest]):
+            return sphere
+        support.append(farthest)
+
+
+def _welzl_sphere(points):
+    """Welzl's algorithm in the iterative form, the points go in the given order"""
+    sphere = points[0], 0.0
+    for i in range(1, len(points)):
+        pi = points[i]
+        if _contains(sphere, pi):
+            continue
+        sphere = pi, 0.0
+        for j in range(i):
+            pj = points[j]
+            if _contains(sphere, pj):
+                continue
+            sphere = _sphere_2(pi, pj)
+            for k in range(j):
+                pk = points[k]
+                if _contains(sphere, pk):
+                    continue
+                sphere = _sphere_3(pi, pj, pk)
+                for l in range(k):
+                    pl = points[l]
+                    if not _contains(sphere, pl):
+                        sphere = _sphere_4(pi, pj, pk, pl)
+    return sphere
+
+
+def limit_weights(counts, groups, weights, max_influences):
+    """
+    Keeps the `max_influences` heaviest influences of each vertex and
+    renormalizes them. The sparse input holds `counts[i]` group/weight pairs
+    of the i-th vertex.
+    Returns the influences count of each vertex, `max_influences` groups and
+    weights per vertex (padded by the first group with zero weights) and the
+    count of the vertices which lost influences.
+    """
+    if numpy is not None:
+        return _limit_weights_np(counts, groups, weights, max_influences)
+    result_counts = []
+    result_groups = []
+    result_weights = []
+    clamped = 0
+    offset = 0
+    for count in counts:
+        pairs = sorted(
+            zip(groups[offset:offset + count], weights[offset:offset + count]),
+            key=lambda pair: -pair[1]
+        )
+        offset += count
+        if count > max_influences and pairs[max_influences][1] > 0:
+            clamped += 1
+        pairs = pairs[:max_influences]
+        total = sum(weight for _, weight in pairs)
+        if total > 0:
+            values = [weight / total for _, weight in pairs]
+        else:
+            values = [1.0 if i == 0 else 0.0 for i in range(len(pairs))]
+        padding = max_influences - len(pairs)
+        result_counts.append(len(pairs))
+        result_groups.extend(group for group, _ in pairs)
+        result_groups.extend([pairs[0][0] if pairs else 0] * padding)
+        result_weights.extend(values)
+        result_weights.extend([0.0] * padding)
+    return result_counts, result_groups, result_weights, clamped
+
+
+def _limit_weights_np(counts, groups, weights, max_influences):
+    counts = numpy.asarray(counts, dtype=numpy.int64)
+    vertices_count = len(counts)
+    width = max(int(counts.max()) if vertices_count else 0, max_influences)
+    rows = numpy.repeat(numpy.arange(vertices_count), counts)
+    columns = numpy.arange(len(rows)) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+    dense_groups = numpy.zeros((vertices_count, width), dtype=numpy.int64)
+    dense_weights = numpy.full((vertices_count, width), -1.0)
+    dense_groups[rows, columns] = numpy.asarray(groups, dtype=numpy.int64)
+    dense_weights[rows, columns] = numpy.asarray(weights, dtype=numpy.float64)
+
+    order = numpy.argsort(-dense_weights, axis=1, kind='mergesort')
+    dense_rows = numpy.arange(vertices_count)[:, None]
+    dense_groups = dense_groups[dense_rows, order]
+    dense_weights = dense_weights[dense_rows, order]
+    clamped = int(numpy.count_nonzero((dense_weights[:, max_influences:] > 0).any(axis=1)))
+    dense_groups = dense_groups[:, :max_influences]
+    dense_weights = dense_weights[:, :max_influences]
+
+    result_counts = numpy.minimum(counts, max_influences)
+    present = numpy.arange(max_influences)[None, :] < result_counts[:, None]
+    dense_weights = numpy.where(present, dense_weights, 0.0)
+    dense_groups = numpy.where(present, dense_groups, dense_groups[:, :1])
+    total = dense_weights.sum(axis=1)
+    degenerate = total <= 0
+    dense_weights[degenerate] = 0.0
+    dense_weights[degenerate, 0] = 1.0
+    total[degenerate] = 1.0
+    dense_weights /= total[:, None]
+    dense_weights[result_counts == 0, 0] = 0.0
+    return (
+        result_counts.tolist(), dense_groups.ravel().tolist(),
+        dense_weights.ravel().tolist(), clamped
+    )
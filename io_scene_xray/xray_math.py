@@ -0,0 +1,285 @@
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# (i, j, k) axes and parity, the same table as blender uses for euler orders
+_ROTATION_ORDERS = {
+    'XYZ': ((0, 1, 2), False),
+    'XZY': ((0, 2, 1), True),
+    'YXZ': ((1, 0, 2), True),
+    'YZX': ((1, 2, 0), False),
+    'ZXY': ((2, 0, 1), False),
+    'ZYX': ((2, 1, 0), True),
+}
+
+_EULER_EPSILON = 16 * 1.192092896e-07
+
+
+def euler_to_matrix(euler, order):
+    (i, j, k), parity = _ROTATION_ORDERS[order]
+    if parity:
+        ti, tj, th = -euler[i], -euler[j], -euler[k]
+    else:
+        ti, tj, th = euler[i], euler[j], euler[k]
+    ci, cj, ch = math.cos(ti), math.cos(tj), math.cos(th)
+    si, sj, sh = math.sin(ti), math.sin(tj), math.sin(th)
+    cc, cs, sc, ss = ci * ch, ci * sh, si * ch, si * sh
+    mat = [[0.0, 0.0, 0.0], [0.0, 0.0, 0.0], [0.0, 0.0, 0.0]]
+    mat[i][i] = cj * ch
+    mat[i][j] = sj * sc - cs
+    mat[i][k] = sj * cc + ss
+    mat[j][i] = cj * sh
+    mat[j][j] = sj * ss + cc
+    mat[j][k] = sj * cs - sc
+    mat[k][i] = -sj
+    mat[k][j] = cj * si
+    mat[k][k] = cj * ci
+    return mat
+
+
+def matrix_to_euler(mat, order):
+    (i, j, k), parity = _ROTATION_ORDERS[order]
+    mat = _normalized_axes(mat)
+    cy = math.hypot(mat[i][i], mat[j][i])
+    eul1 = [0.0, 0.0, 0.0]
+    if cy > _EULER_EPSILON:
+        eul2 = [0.0, 0.0, 0.0]
+        eul1[i] = math.atan2(mat[k][j], mat[k][k])
+        eul1[j] = math.atan2(-mat[k][i], cy)
+        eul1[k] = math.atan2(mat[j][i], mat[i][i])
+        eul2[i] = math.atan2(-mat[k][j], -mat[k][k])
+        eul2[j] = math.atan2(-mat[k][i], -cy)
+        eul2[k] = math.atan2(-mat[j][i], -mat[i][i])
+        if sum(map(abs, eul1)) > sum(map(abs, eul2)):
+            eul1 = eul2
+    else:
+        eul1[i] = math.atan2(-mat[j][k], mat[j][j])
+        eul1[j] = math.atan2(-mat[k][i], cy)
+    if parity:
+        eul1 = [-eul1[0], -eul1[1], -eul1[2]]
+    return eul1
+
+
+def _normalized_axes(mat):
+    result = [[0.0, 0.0, 0.0], [0.0, 0.0, 0.0], [0.0, 0.0, 0.0]]
+    for col in range(3):
+        length = math.sqrt(sum(mat[row][col] ** 2 for row in range(3)))
+        if length:
+            for row in range(3):
+                result[row][col] = mat[row][col] / length
+    return result
+
+
+def matrix_to_rows(mat):
+    return [[float(value) for value in row] for row in mat]
+
+
+def interpolate_keys(times, values, stepped, at_times):
+    """
+    Evaluates the envelope keys at the sorted `at_times`.
+    `stepped[n]` tells whether the segment which ends at the n-th key is held.
+    """
+    count = len(times)
+    if not count:
+        return [0.0] * len(at_times)
+    result = []
+    idx = 0
+    for time in at_times:
+        while (idx < count) and (times[idx] <= time):
+            idx += 1
+        if idx == 0:
+            result.append(values[0])
+        elif idx == count:
+            result.append(values[-1])
+        elif stepped[idx]:
+            result.append(values[idx - 1])
+        else:
+            time0, time1 = times[idx - 1], times[idx]
+            koef = (time - time0) / (time1 - time0)
+            result.append(values[idx - 1] + (values[idx] - values[idx - 1]) * koef)
+    return result
+
+
+def merge_times(*sequences):
+    return sorted(set().union(*sequences))
+
+
+def transform_locrot(xmat, locations, rotations, order):
+    """
+    Calculates `xmat * Translation(location) * Euler(rotation, order)` for each
+    sample and decomposes the result back to the location and euler columns.
+    """
+    if numpy is not None:
+        return _transform_locrot_np(xmat, locations, rotations, order)
+    xrot = [row[:3] for row in xmat[:3]]
+    xtrn = [row[3] for row in xmat[:3]]
+    locs = ([], [], [])
+    rots = ([], [], [])
+    for loc, rot in zip(zip(*locations), zip(*rotations)):
+        rmat = euler_to_matrix(rot, order)
+        mat = [
+            [sum(xrot[r][n] * rmat[n][c] for n in range(3)) for c in range(3)]
+            for r in range(3)
+        ]
+        for r in range(3):
+            locs[r].append(xtrn[r] + sum(xrot[r][n] * loc[n] for n in range(3)))
+        for r, value in enumerate(matrix_to_euler(mat, order)):
+            rots[r].append(value)
+    return locs, rots
+
+
+def _transform_locrot_np(xmat, locations, rotations, order):
+    xmat = numpy.array(xmat, dtype=numpy.float64)
+    locs = numpy.array(locations, dtype=numpy.float64).T
+    rots = numpy.array(rotations, dtype=numpy.float64).T
+    mats = numpy.einsum('ij,njk->nik', xmat[:3, :3], euler_to_matrix_np(rots, order))
+    locs = locs.dot(xmat[:3, :3].T) + xmat[:3, 3]
+    return locs.T, matrix_to_euler_np(mats, order).T
+
+
+def euler_to_matrix_np(eulers, order):
+    (i, j, k), parity = _ROTATION_ORDERS[order]
+    angles = -eulers if parity else eulers
+    ci, cj, ch = (numpy.cos(angles[:, n]) for n in (i, j, k))
+    si, sj, sh = (numpy.sin(angles[:, n]) for n in (i, j, k))
+    cc, cs, sc, ss = ci * ch, ci * sh, si * ch, si * sh
+    mats = numpy.empty((len(eulers), 3, 3))
+    mats[:, i, i] = cj * ch
+    mats[:, i, j] = sj * sc - cs
+    mats[:, i, k] = sj * cc + ss
+    mats[:, j, i] = cj * sh
+    mats[:, j, j] = sj * ss + cc
+    mats[:, j, k] = sj * cs - sc
+    mats[:, k, i] = -sj
+    mats[:, k, j] = cj * si
+    mats[:, k, k] = cj * ci
+    return mats
+
+
+def matrix_to_euler_np(mats, order):
+    (i, j, k), parity = _ROTATION_ORDERS[order]
+    lengths = numpy.sqrt((mats ** 2).sum(axis=1))
+    lengths[lengths == 0] = 1
+    mats = mats / lengths[:, numpy.newaxis, :]
+    cy = numpy.hypot(mats[:, i, i], mats[:, j, i])
+    eul1 = numpy.empty((len(mats), 3))
+    eul2 = numpy.empty((len(mats), 3))
+    eul1[:, i] = numpy.arctan2(mats[:, k, j], mats[:, k, k])
+    eul1[:, j] = numpy.arctan2(-mats[:, k, i], cy)
+    eul1[:, k] = numpy.arctan2(mats[:, j, i], mats[:, i, i])
+    eul2[:, i] = numpy.arctan2(-mats[:, k, j], -mats[:, k, k])
+    eul2[:, j] = numpy.arctan2(-mats[:, k, i], -cy)
+    eul2[:, k] = numpy.arctan2(-mats[:, j, i], -mats[:, i, i])
+    use2 = numpy.abs(eul1).sum(axis=1) > numpy.abs(eul2).sum(axis=1)
+    eul1[use2] = eul2[use2]
+    gimbal = cy <= _EULER_EPSILON
+    if gimbal.any():
+        eul1[gimbal, i] = numpy.arctan2(-mats[gimbal, j, k], mats[gimbal, j, j])
+        eul1[gimbal, j] = numpy.arctan2(-mats[gimbal, k, i], cy[gimbal])
+        eul1[gimbal, k] = 0
+    return -eul1 if parity else eul1
+
+
+def unwrap_angles(angles):
+    """Shifts the angles by 2*pi multiples to make the sequence continuous"""
+    result = []
+    correction = 0.0
+    prev = None
+    for angle in angles:
+        if prev is not None:
+            delta = angle - prev
+            if abs(delta) > math.pi:
+                correction += (delta + math.pi) % (2 * math.pi) - math.pi - delta
+        result.append(angle + correction)
+        prev = angle
+    return result
+
+
+def decompose_matrices(matrices, order):
+    """
+    Splits a flat (frames x 16, row-major) sequence of matrices into the
+    location columns and the continuous euler columns.
+    """
+    if numpy is not None:
+        mats = numpy.array(matrices, dtype=numpy.float64).reshape(-1, 4, 4)
+        eulers = numpy.unwrap(matrix_to_euler_np(mats[:, :3, :3], order), axis=0)
+        return mats[:, :3, 3].T.tolist(), eulers.T.tolist()
+    locations = (matrices[3::16], matrices[7::16], matrices[11::16])
+    rotations = ([], [], [])
+    for offset in range(0, len(matrices), 16):
+        mat = (
+            matrices[offset + 0:offset + 3],
+            matrices[offset + 4:offset + 7],
+            matrices[offset + 8:offset + 11],
+        )
+        for idx, angle in enumerate(matrix_to_euler(mat, order)):
+            rotations[idx].append(angle)
+    return [list(column) for column in locations], [unwrap_angles(column) for column in rotations]
+
+
+def matrix_to_quaternion(mat):
+    """Returns the (w, x, y, z) quaternion of the rotation part of the 3x3 rows"""
+    mat = _normalized_axes(mat)
+    xx, yy, zz = mat[0][0], mat[1][1], mat[2][2]
+    quat = (
+        math.sqrt(max(0.0, 1 + xx + yy + zz)) / 2,
+        math.copysign(math.sqrt(max(0.0, 1 + xx - yy - zz)) / 2, mat[2][1] - mat[1][2]),
+        math.copysign(math.sqrt(max(0.0, 1 - xx + yy - zz)) / 2, mat[0][2] - mat[2][0]),
+        math.copysign(math.sqrt(max(0.0, 1 - xx - yy + zz)) / 2, mat[1][0] - mat[0][1]),
+    )
+    length = math.sqrt(sum(value * value for value in quat))
+    return tuple(value / length for value in quat)
+
+
+def decompose_matrices_quaternions(matrices):
+    """
+    Splits a flat (frames x 16, row-major) sequence of matrices into the
+    location columns and the (w, x, y, z) quaternion columns. The neighbour
+    quaternions are kept in the same hemisphere.
+    """
+    if numpy is not None:
+        mats = numpy.array(matrices, dtype=numpy.float64).reshape(-1, 4, 4)
+        return mats[:, :3, 3].T.tolist(), _matrices_to_quaternions_np(mats[:, :3, :3]).T.tolist()
+    locations = (matrices[3::16], matrices[7::16], matrices[11::16])
+    quaternions = ([], [], [], [])
+    prev = (1.0, 0.0, 0.0, 0.0)
+    for offset in range(0, len(matrices), 16):
+        quat = matrix_to_quaternion((
+            matrices[offset + 0:offset + 3],
+            matrices[offset + 4:offset + 7],
+            matrices[offset + 8:offset + 11],
+        ))
+        if sum(a * b for a, b in zip(quat, prev)) < 0:
+            quat = tuple(-value for value in quat)
+        for idx, value in enumerate(quat):
+            quaternions[idx].append(value)
+        prev = quat
+    return [list(column) for column in locations], [list(column) for column in quaternions]
+
+
+def _matrices_to_quaternions_np(mats):
+    lengths = numpy.sqrt((mats ** 2).sum(axis=1))
+    lengths[lengths == 0] = 1
+    mats = mats / lengths[:, numpy.newaxis, :]
+    m00, m11, m22 = mats[:, 0, 0], mats[:, 1, 1], mats[:, 2, 2]
+    quats = numpy.empty((len(mats), 4))
+    quats[:, 0] = numpy.sqrt(numpy.maximum(0, 1 + m00 + m11 + m22)) / 2
+    quats[:, 1] = numpy.copysign(
+        numpy.sqrt(numpy.maximum(0, 1 + m00 - m11 - m22)) / 2, mats[:, 2, 1] - mats[:, 1, 2]
+    )
+    quats[:, 2] = numpy.copysign(
+        numpy.sqrt(numpy.maximum(0, 1 - m00 + m11 - m22)) / 2, mats[:, 0, 2] - mats[:, 2, 0]
+    )
+    quats[:, 3] = numpy.copysign(
+        numpy.sqrt(numpy.maximum(0, 1 - m00 - m11 + m22)) / 2, mats[:, 1, 0] - mats[:, 0, 1]
+    )
+    quats /= numpy.sqrt((quats ** 2).sum(axis=1))[:, numpy.newaxis]
+    if len(quats) > 1:
+        flips = (quats[1:] * quats[:-1]).sum(axis=1) < 0
+        signs = numpy.cumprod(numpy.where(flips, -1.0, 1.0))
+        quats[1:] *= signs[:, numpy.newaxis]
+    return quats
@@ -1,9 +1,19 @@
+import collections
+import multiprocessing
+import struct
+import zlib
+
 import bpy
 from mathutils import Matrix, Euler, Quaternion
 
-from .utils import is_exportable_bone, find_bone_exportable_parent, AppError
-from .xray_envelope import Behavior, Shape, KF, EPSILON, refine_keys, export_keyframes
-from .xray_io import PackedWriter, FastBytes as fb
+from .utils import is_exportable_bone, find_bone_exportable_parent, AppError, fill_fcurve, \
+    mkstruct, create_process_pool
+from .xray_envelope import Behavior, Shape, EPSILON, reduce_keys, export_key_arrays
+from .xray_io import PackedReader, PackedWriter, FastBytes as fb
+from .bake import PoseEvaluator
+from .xray_math import interpolate_keys, merge_times, transform_locrot, matrix_to_rows, \
+    decompose_matrices, decompose_matrices_quaternions
+from .ogf.fmt import MotionFlags, KEY_QUANT, KEY_QUANT_8BIT, MOTION_FPS
 from .log import warn, with_context, props as log_props
 
 
@@ -17,127 +27,299 @@ MATRIX_BONE_INVERTED = MATRIX_BONE.inverted().freeze()
 
 MOTIONS_FILTER_ALL = lambda name: True
 
+# signs of the x-ray bone curves: location (x, y, z), rotation (y, x, z)
+_MOTION_CURVES_KOEFS = (1, 1, -1, -1, -1, 1)
+_PREP_KEYFRAME = PackedReader.prep('ffB')
 
-@with_context('import-motion')
-def import_motion(reader, bpy_armature, bonesmap, reported, motions_filter=MOTIONS_FILTER_ALL):
-    name = reader.gets()
-    if not motions_filter(name):
-        skip = _skip_motion_rest(reader.getv(), 0)
-        reader.skip(skip)
-        return
-    act = bpy.data.actions.new(name=name)
-    act.use_fake_user = True
-    xray = act.xray
-    reader.getf('II')  # range
-    fps, ver = reader.getf('fH')
-    xray.fps = fps
-    if ver < 6:
-        raise AppError('unsupported motions version', log_props(version=ver))
-
-    motion = bpy_armature.xray.motions_collection.add()
-    motion.name = act.name
 
-    if name != act.name:
-        bpy_armature.xray.use_custom_motion_names = True
-        motion.export_name = name
-
-    xray.flags, xray.bonepart = reader.getf('<BH')
-    xray.speed, xray.accrue, xray.falloff, xray.power = reader.getf('<ffff')
-    for _bone_idx in range(reader.getf('H')[0]):
-        tmpfc = [act.fcurves.new('temp', i) for i in range(6)]
-        try:
-            times = {}
-            bname = reader.gets()
-            flags = reader.getf('B')[0]
-            if flags != 0:
-                warn('bone has non-zero flags', bone=bname, flags=flags)
-            for fcurve in tmpfc:
-                behaviors = reader.getf('BB')
-                if (behaviors[0] != 1) or (behaviors[1] != 1):
-                    warn('bone has different behaviors', bode=bname, behaviors=behaviors)
-                for _keyframe_idx in range(reader.getf('H')[0]):
-                    val = reader.getf('f')[0]
-                    time = reader.getf('f')[0] * fps
-                    times[time] = True
-                    key_frame = fcurve.keyframe_points.insert(time, val)
-                    shape = Shape(reader.getf('B')[0])
-                    if shape != Shape.STEPPED:
-                        reader.getf('HHH')
-                        reader.getf('HHHH')
-                    else:
-                        key_frame.interpolation = 'CONSTANT'
-            bpy_bone = bpy_armature.data.bones.get(bname, None)
-            if bpy_bone is None:
-                bpy_bone = bonesmap.get(bname.lower(), None)
-                if bpy_bone is None:
-                    if bname not in reported:
-                        warn('bone is not found', bone=bname)
-                        reported.add(bname)
-                    continue
-                if bname not in reported:
-                    warn(
-                        'bone\'s reference will be replaced',
-                        bone=bname,
-                        replacement=bpy_bone.name
-                    )
-                    reported.add(bname)
-                bname = bpy_bone.name
-            data_path = 'pose.bones["' + bname + '"]'
-            fcs = [
-                act.fcurves.new(data_path + '.location', 0, bname),
-                act.fcurves.new(data_path + '.location', 1, bname),
-                act.fcurves.new(data_path + '.location', 2, bname),
-                act.fcurves.new(data_path + '.rotation_euler', 0, bname),
-                act.fcurves.new(data_path + '.rotation_euler', 1, bname),
-                act.fcurves.new(data_path + '.rotation_euler', 2, bname)
-            ]
+def _read_motion_curve(reader, fps, koef):
+    times, values, stepped = [], [], []
+    for _keyframe_idx in range(reader.getf('H')[0]):
+        val, time, shape = reader.getp(_PREP_KEYFRAME)
+        times.append(time * fps)
+        values.append(val * koef)
+        if shape != Shape.STEPPED.value:
+            stepped.append(False)
+            reader.skip(14)
+        else:
+            stepped.append(True)
+    return times, values, stepped
+
+
+ResolvedBone = mkstruct('ResolvedBone', ['name', 'data_path', 'xmat'])
+
+
+def _bones_signature(bpy_armature):
+    """Changes with the names, the parents, the rest poses and the exportable flags of the bones"""
+    return tuple(
+        (
+            bone.name,
+            bone.parent.name if bone.parent else '',
+            bone.xray.exportable,
+            tuple(value for row in bone.matrix_local for value in row),
+        )
+        for bone in bpy_armature.data.bones
+    )
+
+
+class BonesTable:
+    def __init__(self, bpy_armature, signature=None):
+        bones = bpy_armature.data.bones
+        self.name = bpy_armature.data.name
+        self.signature = _bones_signature(bpy_armature) if signature is None else signature
+        self._exact = {}
+        self._lowered = {}
+        for bpy_bone in bones:
             xmat = bpy_bone.matrix_local.inverted()
             real_parent = find_bone_exportable_parent(bpy_bone)
             if real_parent:
                 xmat = xmat * real_parent.matrix_local
             else:
                 xmat = xmat * MATRIX_BONE
-            for time in times:
-                mat = xmat * Matrix.Translation((
-                    +tmpfc[0].evaluate(time),
-                    +tmpfc[1].evaluate(time),
-                    -tmpfc[2].evaluate(time),
-                )) * Euler((
-                    -tmpfc[4].evaluate(time),
-                    -tmpfc[3].evaluate(time),
-                    +tmpfc[5].evaluate(time),
-                ), 'ZXY').to_matrix().to_4x4()
-                trn = mat.to_translation()
-                rot = mat.to_euler('ZXY')
-                for i in range(3):
-                    fcs[i + 0].keyframe_points.insert(time, trn[i])
-                for i in range(3):
-                    fcs[i + 3].keyframe_points.insert(time, rot[i])
-        finally:
-            for fcurve in tmpfc:
-                act.fcurves.remove(fcurve)
+            bone = ResolvedBone(
+                bpy_bone.name,
+                'pose.bones["' + bpy_bone.name + '"]',
+                matrix_to_rows(xmat)
+            )
+            self._exact[bpy_bone.name] = bone
+            self._lowered[bpy_bone.name.lower()] = bone
+
+    def is_valid_for(self, bpy_armature, signature=None):
+        if signature is None:
+            signature = _bones_signature(bpy_armature)
+        return (self.name == bpy_armature.data.name) and (self.signature == signature)
+
+    def resolve(self, name):
+        bone = self._exact.get(name, None)
+        if bone is not None:
+            return bone, False
+        bone = self._lowered.get(name.lower(), None)
+        return bone, bone is not None
+
+
+_BONES_TABLES = {}
+
+
+def bones_table(bpy_armature):
+    key = bpy_armature.data.as_pointer()
+    table = _BONES_TABLES.get(key, None)
+    signature = _bones_signature(bpy_armature)
+    if (table is None) or not table.is_valid_for(bpy_armature, signature):
+        _BONES_TABLES[key] = table = BonesTable(bpy_armature, signature)
+    return table
+
+
+def invalidate_bones_tables(bpy_armatures=None):
+    if bpy_armatures is None:
+        _BONES_TABLES.clear()
+        return
+    for armature in bpy_armatures:
+        _BONES_TABLES.pop(armature.as_pointer(), None)
+
+
+ExportableBone = mkstruct('ExportableBone', [
+    'index', 'bone', 'parent', 'parent_index', 'bind', 'xmat'
+])
+
+
+class ExportBonesTable:
+    """
+    The exportable bones of the armature, the parents go before the children.
+    `parent` is the nearest exportable ancestor (-1 `parent_index` for the roots),
+    `bind` is the armature space bind pose in the x-ray bone axes and `xmat` is
+    the same pose relative to the parent.
+    """
+
+    def __init__(self, bpy_armature):
+        self.bones = []
+        self._by_name = {}
+        self._parents = {}
+        for bpy_bone in bpy_armature.data.bones:
+            if is_exportable_bone(bpy_bone):
+                self._add(bpy_bone)
+
+    def get(self, name):
+        return self._by_name.get(name, None)
+
+    def _exportable_parent(self, bpy_bone):
+        name = bpy_bone.name
+        if name in self._parents:
+            return self._parents[name]
+        parent = bpy_bone.parent
+        if (parent is not None) and not is_exportable_bone(parent):
+            parent = self._exportable_parent(parent)
+        self._parents[name] = parent
+        return parent
+
+    def _add(self, bpy_bone):
+        bone = self._by_name.get(bpy_bone.name, None)
+        if bone is not None:
+            return bone
+        bind = bpy_bone.matrix_local * MATRIX_BONE_INVERTED
+        parent = self._exportable_parent(bpy_bone)
+        if parent is None:
+            parent_index, xmat = -1, bind
+        else:
+            parent_bone = self._add(parent)
+            parent_index, xmat = parent_bone.index, parent_bone.bind.inverted() * bind
+        bone = ExportableBone(len(self.bones), bpy_bone, parent, parent_index, bind, xmat)
+        self.bones.append(bone)
+        self._by_name[bpy_bone.name] = bone
+        return bone
+
+
+DecodedMotion = mkstruct('DecodedMotion', [
+    'name', 'fps', 'flags', 'bonepart', 'params', 'bones', 'warnings'
+])
+DecodedBone = mkstruct('DecodedBone', [
+    'name', 'bone', 'replaced', 'times', 'locations', 'rotations'
+])
+
+
+def decode_motion(reader, name, bones):
+    """
+    Decodes the motion (which name is already read) to plain arrays.
+    Doesn't use bpy, so it can be called from a background thread.
+    `bones` is a `BonesTable` of the target armature.
+    """
+    for motion in decode_motion_steps(reader, name, bones):
+        pass
+    return motion
+
+
+def decode_motion_steps(reader, name, bones):
+    """
+    Decodes the motion as `decode_motion` does, yielding None after each bone
+    and the `DecodedMotion` at the end, so the decoding can be spread over
+    several timer events.
+    """
+    reader.getf('II')  # range
+    fps, ver = reader.getf('fH')
+    if ver < 6:
+        raise AppError('unsupported motions version', log_props(version=ver))
+    warnings = []
+    flags, bonepart = reader.getf('<BH')
+    params = reader.getf('<ffff')
+    decoded_bones = []
+    for _bone_idx in range(reader.getf('H')[0]):
+        bname = reader.gets()
+        bflags = reader.getf('B')[0]
+        if bflags != 0:
+            warnings.append(('bone has non-zero flags', dict(bone=bname, flags=bflags)))
+        curves = []
+        for koef in _MOTION_CURVES_KOEFS:
+            behaviors = reader.getf('BB')
+            if (behaviors[0] != 1) or (behaviors[1] != 1):
+                warnings.append((
+                    'bone has different behaviors', dict(bode=bname, behaviors=behaviors)
+                ))
+            curves.append(_read_motion_curve(reader, fps, koef))
+        bone, replaced = bones.resolve(bname)
+        if bone is None:
+            decoded_bones.append(DecodedBone(bname, None, False, None, None, None))
+            continue
+        times = merge_times(*(curve[0] for curve in curves))
+        values = [interpolate_keys(*curve, at_times=times) for curve in curves]
+        locations, rotations = transform_locrot(
+            bone.xmat,
+            (values[0], values[1], values[2]),
+            (values[4], values[3], values[5]),
+            'ZXY'
+        )
+        decoded_bones.append(DecodedBone(bname, bone, replaced, times, locations, rotations))
+        yield None
     if ver >= 7:
         for _bone_idx in range(reader.getf('I')[0]):
-            name = reader.gets_a()
+            mname = reader.gets_a()
             reader.skip((4 + 4) * reader.getf('I')[0])
-            warn('markers are not supported yet', name=name)
+            warnings.append(('markers are not supported yet', dict(name=mname)))
+    yield DecodedMotion(name, fps, flags, bonepart, params, decoded_bones, warnings)
+
+
+@with_context('import-motion')
+def create_motion_action(motion, bpy_armature, reported):
+    """Creates the action from the `DecodedMotion`, must be called from the main thread"""
+    return _create_motion_action(motion, bpy_armature, reported)
+
+
+def _create_motion_action(motion, bpy_armature, reported):
+    act = bpy.data.actions.new(name=motion.name)
+    act.use_fake_user = True
+    xray = act.xray
+    xray.fps = motion.fps
+
+    bpy_motion = bpy_armature.xray.motions_collection.add()
+    bpy_motion.name = act.name
+
+    if motion.name != act.name:
+        bpy_armature.xray.use_custom_motion_names = True
+        bpy_motion.export_name = motion.name
+
+    xray.flags, xray.bonepart = motion.flags, motion.bonepart
+    xray.speed, xray.accrue, xray.falloff, xray.power = motion.params
+    for message, props in motion.warnings:
+        warn(message, **props)
+    for decoded in motion.bones:
+        bname, bone = decoded.name, decoded.bone
+        if bone is None:
+            if bname not in reported:
+                warn('bone is not found', bone=bname)
+                reported.add(bname)
+            continue
+        if decoded.replaced and (bname not in reported):
+            warn(
+                'bone\'s reference will be replaced',
+                bone=bname,
+                replacement=bone.name
+            )
+            reported.add(bname)
+        bname = bone.name
+        data_path = bone.data_path
+        fcs = [
+            act.fcurves.new(data_path + '.location', 0, bname),
+            act.fcurves.new(data_path + '.location', 1, bname),
+            act.fcurves.new(data_path + '.location', 2, bname),
+            act.fcurves.new(data_path + '.rotation_euler', 0, bname),
+            act.fcurves.new(data_path + '.rotation_euler', 1, bname),
+            act.fcurves.new(data_path + '.rotation_euler', 2, bname)
+        ]
+        for fcurve, curve in zip(fcs, tuple(decoded.locations) + tuple(decoded.rotations)):
+            fill_fcurve(fcurve, decoded.times, curve)
     return act
 
 
+@with_context('import-motion')
+def import_motion(reader, bpy_armature, reported, motions_filter=MOTIONS_FILTER_ALL):
+    name = reader.gets()
+    if not motions_filter(name):
+        skip = _skip_motion_rest(reader.getv(), 0)
+        reader.skip(skip)
+        return
+    motion = decode_motion(reader, name, bones_table(bpy_armature))
+    return _create_motion_action(motion, bpy_armature, reported)
+
+
 def import_motions(reader, bpy_armature, motions_filter=MOTIONS_FILTER_ALL):
     motions_count = reader.getf('I')[0]
     if motions_count:
-        bonesmap = {b.name.lower(): b for b in bpy_armature.data.bones}
         reported = set()
         for _ in range(motions_count):
-            import_motion(reader, bpy_armature, bonesmap, reported, motions_filter)
+            import_motion(reader, bpy_armature, reported, motions_filter)
+
+
+MotionInfo = mkstruct('MotionInfo', [
+    'name', 'offset', 'frame_start', 'frame_end', 'fps', 'bones_count'
+])
 
 
 @with_context('examine-motion')
 def _examine_motion(data, offs):
     name, ptr = fb.str_at(data, offs)
+    frame_start, frame_end, fps = struct.unpack_from('<IIf', data, ptr)
+    bones_count = fb.short_at(data, ptr + 4 + 4 + 4 + 2 + (1 + 2 + 4 * 4))
+    info = MotionInfo(name, offs, frame_start, frame_end, fps, bones_count)
     ptr = _skip_motion_rest(data, ptr)
-    return name, ptr
+    return info, ptr
 
 
 def _skip_motion_rest(data, offs):
@@ -165,15 +347,19 @@ def _skip_motion_rest(data, offs):
     return ptr
 
 
-def examine_motions(data):
+def examine_motions_info(data):
     offs = 4
     for _ in range(fb.int_at(data, offs - 4)):
-        name, offs = _examine_motion(data, offs)
-        yield name
+        info, offs = _examine_motion(data, offs)
+        yield info
 
 
-@with_context('export-motion')
-def export_motion(pkw, action, armature):
+def examine_motions(data):
+    for info in examine_motions_info(data):
+        yield info.name
+
+
+def _bake_motion(action, armature, bones=None):
     dependency_object = None
     if armature.xray.dependency_object:
         dependency_object = bpy.data.objects.get(armature.xray.dependency_object)
@@ -181,15 +367,33 @@ def export_motion(pkw, action, armature):
             old_action = dependency_object.animation_data.action
             dependency_object.animation_data.action = action
 
-    prepared_bones = _prepare_bones(armature)
+    prepared_bones = _prepare_bones(armature, bones)
     _ake_motion_data = _take_motion_data
     if action.xray.autobake_effective(armature):
         _ake_motion_data = _bake_motion_data
     bones_animations = _ake_motion_data(action, armature, prepared_bones)
-    _export_motion_data(pkw, action, bones_animations, armature)
 
     if dependency_object:
         dependency_object.animation_data.action = old_action
+    return bones_animations
+
+
+@with_context('export-motion')
+def _prepare_motion(action, armature, bones=None):
+    """
+    Bakes the action and writes the motion header.
+    Returns the header writer and the arguments of `_encode_motion_bones`.
+    """
+    bones_animations = _bake_motion(action, armature, bones)
+    header = PackedWriter()
+    _export_motion_header(header, action, armature, len(bones_animations))
+    return header, (bones_animations, action.xray.fps, _motion_epsilons(action.xray))
+
+
+def export_motion(pkw, action, armature):
+    header, task = _prepare_motion(action, armature)
+    pkw.putp(header)
+    pkw.putp(_encode_motion_bones(task))
 
 
 def _take_motion_data(bpy_act, bpy_armature, prepared_bones):
@@ -214,14 +418,16 @@ def _take_motion_data(bpy_act, bpy_armature, prepared_bones):
             )
 
     frange = bpy_act.frame_range
+    frames = range(int(frange[0]), int(frange[1]) + 1)
     result = []
+    evaluated_bones = []
     for bone, xmat, is_root in prepared_bones:
         data = []
         result.append((bone.name, data))
 
         group = bpy_act.groups.get(bone.name, None)
         if group is None:
-            data.append(xmat)
+            _put_matrix(data, xmat)
             continue
 
         rotmode = bpy_armature.pose.bones[group.name].rotation_mode
@@ -254,25 +460,59 @@ def _take_motion_data(bpy_act, bpy_armature, prepared_bones):
                 continue
             chs[channel.array_index] = channel
 
+        if is_root and bone.parent:
+            evaluated_bones.append((bone, data))
+            continue
+
         def evaluate_channels(channels, time):
             return (channel.evaluate(time) if channel else 0 for channel in channels)
 
-        scene = bpy.context.scene
-        old_current_frame = scene.frame_current
-        for time in range(int(frange[0]), int(frange[1]) + 1):
-            if is_root and bone.parent:
-                scene.frame_set(time)
-                mat = MATRIX_BONE_INVERTED * bone.matrix
-            else:
-                mat = xmat * Matrix.Translation(evaluate_channels(chs_tr, time)) \
-                    * frotmatrix(evaluate_channels(chs_rt, time)).to_4x4()
-            data.append(mat)
-        scene.frame_set(old_current_frame)
+        for time in frames:
+            mat = xmat * Matrix.Translation(evaluate_channels(chs_tr, time)) \
+                * frotmatrix(evaluate_channels(chs_rt, time)).to_4x4()
+            _put_matrix(data, mat)
+
+    if evaluated_bones:
+        _sample_pose_matrices(frames, evaluated_bones)
 
     return result
 
 
+def _put_matrix(data, mat):
+    for row in mat:
+        data.extend(row)
+
+
+def _sample_pose_matrices(frames, bones_data):
+    scene = bpy.context.scene
+    old_current_frame = scene.frame_current
+    try:
+        for time in frames:
+            scene.frame_set(time)
+            for bone, data in bones_data:
+                _put_matrix(data, MATRIX_BONE_INVERTED * bone.matrix)
+    finally:
+        scene.frame_set(old_current_frame)
+
+
 def _bake_motion_data(action, armature, prepared_bones):
+    evaluator = PoseEvaluator.create(armature, action)
+    if evaluator is None:
+        return _bake_motion_data_scene(action, armature, prepared_bones)
+
+    exportable_bones = [(bone, matrix, is_root, []) for bone, matrix, is_root in prepared_bones]
+    for frm in range(int(action.frame_range[0]), int(action.frame_range[1]) + 1):
+        pose = evaluator.evaluate(frm)
+        for pbone, mat, is_root, data in exportable_bones:
+            if not is_root:
+                _put_matrix(data, mat * evaluator.local_matrix(pbone, pose))
+            else:
+                _put_matrix(data, MATRIX_BONE_INVERTED * pose[pbone.name])
+
+    return [(pbone.name, animation) for pbone, _, _, animation in exportable_bones]
+
+
+def _bake_motion_data_scene(action, armature, prepared_bones):
     exportable_bones = [(bone, matrix, is_root, []) for bone, matrix, is_root in prepared_bones]
 
     old_act = armature.animation_data.action
@@ -284,9 +524,10 @@ def _bake_motion_data(action, armature, prepared_bones):
             bpy.context.scene.update()
             for pbone, mat, is_root, data in exportable_bones:
                 if not is_root:
-                    data.append(mat * armature.convert_space(pbone, pbone.matrix, 'POSE', 'LOCAL'))
+                    local = armature.convert_space(pbone, pbone.matrix, 'POSE', 'LOCAL')
+                    _put_matrix(data, mat * local)
                 else:
-                    data.append(MATRIX_BONE_INVERTED * pbone.matrix)
+                    _put_matrix(data, MATRIX_BONE_INVERTED * pbone.matrix)
     finally:
         armature.animation_data.action = old_act
         bpy.context.scene.frame_set(old_frame)
@@ -294,77 +535,215 @@ def _bake_motion_data(action, armature, prepared_bones):
     return [(pbone.name, animation) for pbone, _, _, animation in exportable_bones]
 
 
-def _prepare_bones(armature):
-    def prepare_bone(bone):
-        mat = bone.matrix_local
-        real_parent = find_bone_exportable_parent(bone)
-        if real_parent:
-            root_bone = False
-            mat = real_parent.matrix_local.inverted() * mat
-        else:
-            root_bone = True
-            mat = MATRIX_BONE_INVERTED * mat
-        return armature.pose.bones[bone.name], mat, root_bone
-
+def _prepare_bones(armature, bones=None):
+    if bones is None:
+        bones = ExportBonesTable(armature)
+    # the bind poses in the blender bone axes
     return [
-        prepare_bone(bone)
-        for bone in armature.data.bones if is_exportable_bone(bone)
+        (
+            armature.pose.bones[bone.bone.name],
+            MATRIX_BONE_INVERTED * bone.xmat * MATRIX_BONE,
+            bone.parent is None
+        )
+        for bone in bones.bones
     ]
 
 
-def _export_motion_data(pkw, action, bones_animations, armature):
-    xray = action.xray
-
+def motion_export_name(action, armature):
     if armature.xray.use_custom_motion_names:
         motion = armature.xray.motions_collection.get(action.name)
         if motion.export_name:
-            motion_name = motion.export_name
-        else:
-            motion_name = action.name
-    else:
-        motion_name = action.name
+            return motion.export_name
+    return action.name
+
 
-    pkw.puts(motion_name)
-    motion_name
+def _export_motion_header(pkw, action, armature, bones_count):
+    xray = action.xray
+    pkw.puts(motion_export_name(action, armature))
     frange = action.frame_range
     pkw.putf('II', int(frange[0]), int(frange[1]))
     pkw.putf('f', xray.fps)
     pkw.putf('H', 6)  # version
     pkw.putf('<BH', xray.flags, xray.bonepart)
     pkw.putf('<ffff', xray.speed, xray.accrue, xray.falloff, xray.power)
-    pkw.putf('H', len(bones_animations))
+    pkw.putf('H', bones_count)
+
+
+def _motion_epsilons(xray):
+    if xray.autobake_custom_refine:
+        return xray.autobake_refine_location, xray.autobake_refine_rotation
+    return EPSILON, EPSILON
+
+
+def _encode_motion_bones(task):
+    """Reduces and encodes the baked bones curves, doesn't use bpy"""
+    bones_animations, fps, (eps_location, eps_rotation) = task
+    pkw = PackedWriter()
     for name, animation in bones_animations:
         pkw.puts(name)
         pkw.putf('B', 0)  # flags
-        curves = ([], [], [], [], [], [])
-
-        for mat in animation:
-            trn = mat.to_translation()
-            rot = mat.to_euler('ZXY')
-            curves[0].append(+trn[0])
-            curves[1].append(+trn[1])
-            curves[2].append(-trn[2])
-            curves[3].append(-rot[1])
-            curves[4].append(-rot[0])
-            curves[5].append(+rot[2])
-
-        def curve2keys(curve):
-            for frm, val in enumerate(curve):
-                yield KF(frm / xray.fps, val, Shape.STEPPED)
-
+        locations, rotations = decompose_matrices(animation, 'ZXY')
+        curves = (
+            locations[0],
+            locations[1],
+            [-value for value in locations[2]],
+            [-value for value in rotations[1]],
+            [-value for value in rotations[0]],
+            rotations[2],
+        )
+
+        times = [frm / fps for frm in range(len(animation) // 16)]
         for i, curve in enumerate(curves):
-            epsilon = EPSILON
-            if xray.autobake_custom_refine:
-                epsilon = xray.autobake_refine_location if i < 3 else xray.autobake_refine_rotation
-
+            epsilon = eps_location if i < 3 else eps_rotation
             pkw.putf('BB', Behavior.CONSTANT.value, Behavior.CONSTANT.value)
-            cpkw = PackedWriter()
-            ccnt = export_keyframes(cpkw, refine_keys(curve2keys(curve), epsilon))
-            pkw.putf('H', ccnt)
-            pkw.putp(cpkw)
+            keys = reduce_keys(times, curve, epsilon=epsilon)
+            pkw.putf('H', len(keys[0]))
+            export_key_arrays(pkw, *keys)
+    return pkw
+
+
+def _encode_motions(actions, bpy_armature, prepare=_prepare_motion, encode=_encode_motion_bones):
+    """
+    Yields the encoded motions in the actions order. The actions are baked
+    here, the reduction and encoding are done by a pool of worker processes.
+    """
+    bones = ExportBonesTable(bpy_armature)
+    processes = min(multiprocessing.cpu_count(), len(actions))
+    pool = create_process_pool(processes)
+    if pool is None:
+        for action in actions:
+            header, task = prepare(action, bpy_armature, bones)
+            yield header.putp(encode(task))
+        return
+
+    max_pending = 2 * processes
+    pending = collections.deque()
+    try:
+        for action in actions:
+            header, task = prepare(action, bpy_armature, bones)
+            pending.append((header, pool.apply_async(encode, (task, ))))
+            while pending and (len(pending) > max_pending or pending[0][1].ready()):
+                header, result = pending.popleft()
+                yield header.putp(result.get())
+        while pending:
+            header, result = pending.popleft()
+            yield header.putp(result.get())
+    finally:
+        pool.terminate()
+        pool.join()
 
 
 def export_motions(writer, actions, bpy_armature):
     writer.putf('I', len(actions))
-    for action in actions:
-        export_motion(writer, action, bpy_armature)
+    for motion in _encode_motions(actions, bpy_armature):
+        writer.putp(motion)
+
+
+def write_motions(file, actions, bpy_armature):
+    """Writes each motion to the file as soon as it is encoded"""
+    file.write(PackedWriter().putf('I', len(actions)).data)
+    for motion in _encode_motions(actions, bpy_armature):
+        file.write(motion.data)
+
+
+@with_context('export-motion')
+def _prepare_omf_motion(action, armature, bones, key16bit):
+    """
+    Bakes the action and writes the name and the length of the compiled motion.
+    Returns the header writer and the arguments of `_encode_omf_bones`.
+    """
+    if abs(action.xray.fps - MOTION_FPS) > 1e-3:
+        warn('the game plays the compiled motions at the fixed rate', action=action.name,
+             fps=action.xray.fps, game_fps=MOTION_FPS)
+    bones_animations = _bake_motion(action, armature, bones)
+    header = PackedWriter()
+    header.puts(motion_export_name(action, armature))
+    frange = action.frame_range
+    header.putf('I', int(frange[1]) - int(frange[0]) + 1)
+    return header, (bones_animations, _motion_epsilons(action.xray), key16bit)
+
+
+def _quantize(value, quant):
+    return max(-quant, min(quant, int(round(value * quant))))
+
+
+def _encode_omf_bones(task):
+    """
+    Quantizes the baked bones transforms to the compiled motion keys:
+    16-bit quaternions and range-compressed translations. The constant
+    tracks are written as a single key. Doesn't use bpy.
+    """
+    bones_animations, (eps_location, eps_rotation), key16bit = task
+    tquant, tformat = (KEY_QUANT, 'h') if key16bit else (KEY_QUANT_8BIT, 'b')
+    # a quaternion component changes by a half of the angle
+    rtolerance = eps_rotation / 2 * KEY_QUANT
+    pkw = PackedWriter()
+    for _name, animation in bones_animations:
+        locations, (q_w, q_x, q_y, q_z) = decompose_matrices_quaternions(animation)
+        frames = len(q_w)
+        # x-ray flips the z axis of the bone space and uses the row-major matrices,
+        # so the quaternion (x, y, z, w) becomes (-x, -y, z, w) and then is conjugated
+        rkeys = [
+            (
+                _quantize(x, KEY_QUANT), _quantize(y, KEY_QUANT),
+                _quantize(-z, KEY_QUANT), _quantize(w, KEY_QUANT)
+            )
+            for w, x, y, z in zip(q_w, q_x, q_y, q_z)
+        ]
+        locations = (locations[0], locations[1], [-value for value in locations[2]])
+        tmin = [min(column) for column in locations]
+        tmax = [max(column) for column in locations]
+        tinit = [(lo + hi) / 2 for lo, hi in zip(tmin, tmax)]
+
+        flags = 0
+        rconstant = all(
+            max(abs(a - b) for a, b in zip(key, rkeys[0])) <= rtolerance
+            for key in rkeys
+        )
+        if rconstant:
+            flags |= MotionFlags.R_KEY_ABSENT
+        tpresent = max(hi - lo for lo, hi in zip(tmin, tmax)) > eps_location
+        if tpresent:
+            flags |= MotionFlags.T_KEY_PRESENT
+            if key16bit:
+                flags |= MotionFlags.T_KEY_16BIT
+        pkw.putf('B', flags)
+
+        if rconstant:
+            pkw.putf('<4h', *rkeys[0])
+        else:
+            data = struct.pack('<%ih' % (frames * 4), *(value for key in rkeys for value in key))
+            pkw.putf('<I', zlib.crc32(data) & 0xffffffff)
+            pkw.data += data
+
+        if tpresent:
+            tsize = [(hi - lo) / 2 / tquant for lo, hi in zip(tmin, tmax)]
+            tkeys = []
+            for values in zip(*locations):
+                for value, init, size in zip(values, tinit, tsize):
+                    key = int(round((value - init) / size)) if size else 0
+                    tkeys.append(max(-tquant, min(tquant, key)))
+            data = struct.pack('<%i%s' % (frames * 3, tformat), *tkeys)
+            pkw.putf('<I', zlib.crc32(data) & 0xffffffff)
+            pkw.data += data
+            pkw.putf('<3f', *tsize)
+        pkw.putf('<3f', *tinit)
+    return pkw
+
+
+def export_omf_motions(cwriter, actions, bpy_armature, key16bit=True):
+    """
+    Writes the compiled motions as the chunks: the motions count first, then
+    a chunk per motion. The game supports the 16-bit translation keys since
+    Clear Sky, the older versions need the 8-bit ones.
+    """
+    cwriter.put(0, PackedWriter().putf('I', len(actions)))
+    motions = _encode_motions(
+        actions, bpy_armature,
+        prepare=lambda action, armature, bones: _prepare_omf_motion(
+            action, armature, bones, key16bit
+        ),
+        encode=_encode_omf_bones
+    )
+    for idx, motion in enumerate(motions):
+        cwriter.put(idx + 1, motion)
@@ -49,6 +49,61 @@ class TestAnmExport(utils.XRayTestCase):
             'test.anm'
         })
 
+    def test_baked(self):
+        # Arrange
+        obj = self._create_active_object()
+        obj.rotation_mode = 'XYZ'
+        obj.keyframe_insert('location', frame=1)
+        obj.keyframe_insert('rotation_euler', frame=1)
+        obj.location = (1, 2, 3)
+        obj.rotation_euler = (0.5, 2.5, -3)
+        obj.keyframe_insert('location', frame=5)
+        obj.keyframe_insert('rotation_euler', frame=5)
+        obj.animation_data.action.xray.autobake = 'on'
+
+        # Act
+        bpy.ops.xray_export.anm(
+            filepath=self.outpath('test.anm'),
+        )
+
+        # Assert
+        bpy.ops.xray_import.anm(
+            directory=self.outpath(),
+            files=[{'name': 'test.anm'}],
+        )
+        imp = bpy.data.objects['test.anm']
+        for frame in (1, 3, 5):
+            bpy.context.scene.frame_set(frame)
+            for row_a, row_e in zip(imp.matrix_world, obj.matrix_world):
+                for val_a, val_e in zip(row_a, row_e):
+                    self.assertAlmostEqual(val_a, val_e, places=3)
+
+    def test_batch(self):
+        # Arrange
+        objs = []
+        for name in ('tobj1', 'tobj2'):
+            obj = bpy.data.objects.new(name, None)
+            bpy.context.scene.objects.link(obj)
+            obj.rotation_mode = 'YXZ'
+            obj.keyframe_insert('location', frame=1)
+            obj.keyframe_insert('rotation_euler', frame=1)
+            obj.location = (1, 2, 3)
+            obj.keyframe_insert('location', frame=5)
+            objs.append(obj)
+        objs[1].animation_data.action.xray.autobake = 'on'
+
+        # Act
+        bpy.ops.xray_export.anms(
+            objects=','.join(obj.name for obj in objs),
+            directory=self.outpath(),
+        )
+
+        # Assert
+        self.assertOutputFiles({
+            'tobj1.anm',
+            'tobj2.anm',
+        })
+
     def _create_active_object(self):
         obj = bpy.data.objects.new('tobj', None)
         bpy.context.scene.objects.link(obj)
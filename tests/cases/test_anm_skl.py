@@ -123,13 +123,4 @@ class TestSklImport(utils.XRayTestCase):
         self.assertEqual(deselected(), ['10'], msg='only 10 is deselected')
 
     def _create_armature(self, bone_name):
-        arm = bpy.data.armatures.new('tarm')
-        obj = bpy.data.objects.new('tobj', arm)
-        bpy.context.scene.objects.link(obj)
-        bpy.context.scene.objects.active = obj
-        bpy.ops.object.mode_set(mode='EDIT')
-        try:
-            bone = arm.edit_bones.new(bone_name)
-            bone.tail.y = 1
-        finally:
-            bpy.ops.object.mode_set(mode='OBJECT')
+        utils.create_armature('tarm', (bone_name, ), 'tobj')
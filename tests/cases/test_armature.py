@@ -2,22 +2,20 @@ from tests import utils
 
 import bpy
 
+from io_scene_xray.utils import using_mode
+from io_scene_xray.xray_motions import ExportBonesTable, bones_table
+
 
 class TestArmature(utils.XRayTestCase):
     def test_import_sg_maya(self):
         # Arrange
-        arm = bpy.data.armatures.new('test')
-        obj = bpy.data.objects.new('test', arm)
-        bpy.context.scene.objects.link(obj)
-        bpy.context.scene.objects.active = obj
-        bpy.ops.object.mode_set(mode='EDIT')
-        try:
+        obj = utils.create_armature('test')
+        arm = obj.data
+        with using_mode(mode='EDIT'):
             bone = arm.edit_bones.new('non-exp')
             bone.head.z = 0.5
             bone = arm.edit_bones.new('exp')
             bone.head.z = 0.5
-        finally:
-            bpy.ops.object.mode_set(mode='OBJECT')
         arm.bones['non-exp'].xray.exportable = False
 
         # Act
@@ -39,3 +37,45 @@ class TestArmature(utils.XRayTestCase):
 
         imp_arm = bpy.data.armatures[1]
         self.assertEqual(len(imp_arm.bones), 1)
+
+    def test_export_bones_table(self):
+        # Arrange
+        obj = utils.create_armature('test')
+        arm = obj.data
+        with using_mode(mode='EDIT'):
+            root = arm.edit_bones.new('root')
+            root.tail.z = 1
+            fake = arm.edit_bones.new('fake')
+            fake.parent = root
+            fake.head.z, fake.tail.z = 1, 2
+            child = arm.edit_bones.new('child')
+            child.parent = fake
+            child.head.z, child.tail.z = 2, 3
+        arm.bones['fake'].xray.exportable = False
+
+        # Act
+        table = ExportBonesTable(obj)
+
+        # Assert
+        self.assertEqual([bone.bone.name for bone in table.bones], ['root', 'child'])
+        self.assertIsNone(table.get('fake'))
+        child = table.get('child')
+        self.assertEqual(child.parent.name, 'root')
+        self.assertEqual(child.parent_index, 0)
+        self.assertEqual(table.bones[0].parent_index, -1)
+        self.assertAlmostEqual(child.xmat.to_translation().length, 2)
+
+    def test_bones_table_outdated(self):
+        # Arrange
+        obj = utils.create_armature('test')
+        arm = obj.data
+        with using_mode(mode='EDIT'):
+            arm.edit_bones.new('bone').tail.z = 1
+        self.assertIsNotNone(bones_table(obj).resolve('bone')[0])
+
+        # Act
+        arm.bones['bone'].name = 'renamed'
+
+        # Assert
+        self.assertIsNone(bones_table(obj).resolve('bone')[0])
+        self.assertEqual(bones_table(obj).resolve('renamed')[0].name, 'renamed')
@@ -0,0 +1,94 @@
+from tests import utils
+
+import bpy
+
+from io_scene_xray.bake import PoseEvaluator, ObjectEvaluator
+from io_scene_xray.utils import using_mode
+
+
+class TestBake(utils.XRayTestCase):
+    def test_pose_evaluator(self):
+        # Arrange
+        obj, _ = _prepare_armature()
+        act = obj.animation_data.action
+
+        # Act
+        evaluator = PoseEvaluator.create(obj, act)
+
+        # Assert
+        self.assertIsNotNone(evaluator)
+        scene = bpy.context.scene
+        for frame in range(1, 6):
+            pose = evaluator.evaluate(frame)
+            scene.frame_set(frame)
+            for pbone in obj.pose.bones:
+                self._assertMatrixEqual(pose[pbone.name], pbone.matrix)
+                self._assertMatrixEqual(
+                    evaluator.local_matrix(pbone, pose),
+                    obj.convert_space(pbone, pbone.matrix, 'POSE', 'LOCAL'),
+                )
+
+    def test_pose_evaluator_unsupported(self):
+        # Arrange
+        obj, target = _prepare_armature()
+        con = obj.pose.bones['cbone'].constraints.new('DAMPED_TRACK')
+        con.target = target
+
+        # Act
+        evaluator = PoseEvaluator.create(obj, obj.animation_data.action)
+
+        # Assert
+        self.assertIsNone(evaluator)
+
+    def test_object_evaluator(self):
+        # Arrange
+        obj = bpy.data.objects.new('tobj', None)
+        bpy.context.scene.objects.link(obj)
+        obj.rotation_mode = 'YXZ'
+        obj.keyframe_insert('location', frame=1)
+        obj.keyframe_insert('rotation_euler', frame=1)
+        obj.location = (1, 2, 3)
+        obj.rotation_euler = (0.1, 0.2, 0.3)
+        obj.keyframe_insert('location', frame=5)
+        obj.keyframe_insert('rotation_euler', frame=5)
+
+        # Act
+        evaluator = ObjectEvaluator.create(obj, obj.animation_data.action)
+
+        # Assert
+        self.assertIsNotNone(evaluator)
+        for frame in range(1, 6):
+            bpy.context.scene.frame_set(frame)
+            self._assertMatrixEqual(evaluator.evaluate(frame), obj.matrix_world)
+
+    def _assertMatrixEqual(self, actual, expected):
+        for row_a, row_e in zip(actual, expected):
+            for val_a, val_e in zip(row_a, row_e):
+                self.assertAlmostEqual(val_a, val_e, places=4)
+
+
+def _prepare_armature():
+    target = bpy.data.objects.new('target', None)
+    target.location = (1, 0, 2)
+    target.rotation_euler = (0.5, 0, 0)
+    bpy.context.scene.objects.link(target)
+
+    obj = utils.create_armature('test', ('bone', ))
+    with using_mode(mode='EDIT'):
+        cbone = obj.data.edit_bones.new('cbone')
+        cbone.parent = obj.data.edit_bones['bone']
+        cbone.head.y = 1
+        cbone.tail.y = 2
+
+    pbone = obj.pose.bones['bone']
+    pbone.keyframe_insert('location', frame=1, group='bone')
+    pbone.keyframe_insert('rotation_quaternion', frame=1, group='bone')
+    pbone.location = (1, 2, 3)
+    pbone.rotation_quaternion = (0.9, 0.1, 0.2, 0.3)
+    pbone.keyframe_insert('location', frame=5, group='bone')
+    pbone.keyframe_insert('rotation_quaternion', frame=5, group='bone')
+
+    con = obj.pose.bones['cbone'].constraints.new('COPY_ROTATION')
+    con.target = target
+
+    return obj, target
@@ -1,6 +1,7 @@
 from tests import utils
 
 import bpy
+import re
 
 
 class TestDmExport(utils.XRayTestCase):
@@ -19,6 +20,26 @@ class TestDmExport(utils.XRayTestCase):
             'test.dm'
         })
 
+    def test_export_optimize_vertex_cache(self):
+        # Arrange
+        self._create_dm_objects()
+
+        # Act
+        bpy.ops.xray_export.dm(
+            detail_model='tdm1', filepath=self.outpath('test.dm'),
+            texture_name_from_image_path=False,
+            optimize_vertex_cache=True,
+        )
+
+        # Assert
+        self.assertOutputFiles({
+            'test.dm'
+        })
+        self.assertReportsContains(
+            'INFO',
+            re.compile('Vertex cache is optimized: .*acmr=\\d+\\.\\d+ -> \\d+\\.\\d+')
+        )
+
     def _create_dm_objects(self, create_uv=True, create_material=True):
         bmesh = utils.create_bmesh((
             (0, 0, 0),
@@ -0,0 +1,98 @@
+import math
+
+from tests import utils
+
+from io_scene_xray.xray_envelope import reduce_keys, Shape
+from io_scene_xray.xray_math import interpolate_keys
+
+
+class TestEnvelope(utils.XRayTestCase):
+    def test_reduce_keys_error(self):
+        # Arrange
+        times = [frm / 30 for frm in range(300)]
+        values = [math.sin(frm * 0.05) + 0.2 * math.sin(frm * 0.4) for frm in range(300)]
+
+        # Act
+        rtimes, rvalues, rshapes = reduce_keys(times, values, None, 0.001)
+
+        # Assert
+        self.assertLess(len(rtimes), len(times))
+        self.assertEqual(rshapes[0], Shape.STEPPED)
+        restored = interpolate_keys(rtimes, rvalues, [False] * len(rtimes), times)
+        for expected, actual in zip(values, restored):
+            self.assertLessEqual(abs(expected - actual), 0.001 + 1e-9)
+
+    def test_reduce_keys_constant(self):
+        # Act
+        rtimes, rvalues, _ = reduce_keys([0, 1, 2, 3], [1, 1, 1, 1])
+
+        # Assert
+        self.assertEqual(rtimes, [0])
+        self.assertEqual(rvalues, [1])
+
+    def test_reduce_keys_stepped(self):
+        # Arrange
+        shapes = [Shape.STEPPED] * 4
+
+        # Act
+        rtimes, rvalues, _ = reduce_keys([0, 1, 2, 3], [1, 1, 2, 2], shapes)
+
+        # Assert
+        self.assertEqual(rtimes, [0, 2])
+        self.assertEqual(rvalues, [1, 2])
+
+    def test_reduce_keys_keep_last(self):
+        # Arrange
+        shapes = [Shape.STEPPED] + [Shape.LINEAR] * 3
+
+        # Act
+        rtimes, rvalues, _ = reduce_keys([0, 1, 2, 3], [0, 1, 1, 1], shapes, keep_last=True)
+
+        # Assert
+        self.assertEqual(rtimes, [0, 1, 3])
+        self.assertEqual(rvalues, [0, 1, 1])
+
+    def test_reduce_keys_drop_last(self):
+        # Arrange
+        shapes = [Shape.STEPPED] + [Shape.LINEAR] * 3
+
+        # Act
+        rtimes, rvalues, _ = reduce_keys([0, 1, 2, 3], [0, 1, 1, 1], shapes)
+
+        # Assert
+        self.assertEqual(rtimes, [0, 1])
+        self.assertEqual(rvalues, [0, 1])
+
+    def test_reduce_keys_collinear(self):
+        # Arrange
+        values = [0, 0.15625, 0.5, 0.84375, 1]  # the symmetric ease samples
+
+        # Act
+        rtimes, rvalues, _ = reduce_keys([0, 1, 2, 3, 4], values)
+
+        # Assert
+        self.assertEqual(rtimes, [0, 1, 3, 4])
+        self.assertEqual(rvalues, [0, 0.15625, 0.84375, 1])
+
+    def test_reduce_keys_mixed_shapes(self):
+        # Arrange
+        times = [0, 1, 2, 3, 4, 5]
+        values = [0, 1, 2, 2, 3, 4]
+        shapes = [Shape.STEPPED, Shape.LINEAR, Shape.LINEAR] * 2
+
+        # Act
+        rtimes, rvalues, rshapes = reduce_keys(times, values, shapes, keep_last=True)
+
+        # Assert
+        self.assertEqual(rtimes, [0, 2, 3, 5])
+        self.assertEqual(rvalues, [0, 2, 2, 4])
+        self.assertEqual(rshapes, [Shape.STEPPED, Shape.LINEAR, Shape.STEPPED, Shape.LINEAR])
+        at_times = [frm / 4 for frm in range(21)]
+        expected = interpolate_keys(
+            times, values, [shape == Shape.STEPPED for shape in shapes], at_times
+        )
+        restored = interpolate_keys(
+            rtimes, rvalues, [shape == Shape.STEPPED for shape in rshapes], at_times
+        )
+        for exp, act in zip(expected, restored):
+            self.assertAlmostEqual(exp, act)
@@ -77,10 +77,8 @@ def _fake_hides(bones):
     return [bone.hide for bone in bones if is_fake_bone_name(bone.name)]
 
 def _create_armature(name, connected=False, rigid=False):
-    arm = bpy.data.armatures.new(name)
-    obj = bpy.data.objects.new(name, arm)
-    bpy.context.scene.objects.link(obj)
-    bpy.context.scene.objects.active = obj
+    obj = utils.create_armature(name)
+    arm = obj.data
 
     children = []
     with using_mode(mode='EDIT'):
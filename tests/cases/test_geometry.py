@@ -0,0 +1,193 @@
+from tests import utils
+
+from io_scene_xray import xray_geometry
+
+
+class TestGeometry(utils.XRayTestCase):
+    def test_weld_rows(self):
+        # Arrange
+        vertices = [0, 1, 0, 0, 2]
+        attributes = [
+            0.0, 1.0,
+            0.0, 1.0,
+            -0.0, 1.0,  # the same as the first row
+            0.5, 1.0,
+            0.0, 1.0,
+        ]
+
+        # Act
+        first_rows, remap = xray_geometry.weld_rows(vertices, attributes, 2)
+
+        # Assert
+        self.assertEqual(first_rows, [0, 1, 3, 4])
+        self.assertEqual(remap, [0, 1, 0, 2, 3])
+
+    def test_optimize_indices(self):
+        # Arrange
+        size = 8
+        indices = []
+        for row in range(size):
+            for col in range(size):
+                vidx = row * (size + 1) + col
+                indices.extend((vidx, vidx + 1, vidx + size + 1))
+                indices.extend((vidx + 1, vidx + size + 2, vidx + size + 1))
+        triangles = [indices[i:i + 3] for i in range(0, len(indices), 3)]
+        shuffled = [vidx for tri in triangles[1::2] + triangles[::2] for vidx in tri]
+        vertices_count = (size + 1) ** 2
+
+        # Act
+        result, order, acmr_before, acmr_after = xray_geometry.optimize_indices(
+            shuffled, vertices_count
+        )
+
+        # Assert
+        self.assertLess(acmr_after, acmr_before)
+        self.assertEqual(sorted(order), list(range(vertices_count)))
+        self.assertEqual(
+            sorted(
+                tuple(sorted(order[vidx] for vidx in result[i:i + 3]))
+                for i in range(0, len(result), 3)
+            ),
+            sorted(tuple(sorted(tri)) for tri in triangles),
+        )
+
+    def test_partition_triangles(self):
+        # Arrange
+        size = 8
+        positions = []
+        for row in range(size + 1):
+            for col in range(size + 1):
+                positions.extend((col, row, 0))
+        indices = []
+        for row in range(size):
+            for col in range(size):
+                vidx = row * (size + 1) + col
+                indices.extend((vidx, vidx + 1, vidx + size + 1))
+                indices.extend((vidx + 1, vidx + size + 2, vidx + size + 1))
+
+        # Act
+        parts = xray_geometry.partition_triangles(indices, positions, 30)
+
+        # Assert
+        self.assertGreater(len(parts), 1)
+        triangles = []
+        for order, part_indices in parts:
+            self.assertLessEqual(len(order), 30)
+            self.assertEqual(max(part_indices) + 1, len(order))
+            for i in range(0, len(part_indices), 3):
+                triangles.append(tuple(order[vidx] for vidx in part_indices[i:i + 3]))
+        self.assertEqual(
+            sorted(triangles),
+            sorted(tuple(indices[i:i + 3]) for i in range(0, len(indices), 3))
+        )
+        duplicated = sum(len(order) for order, _ in parts) - (size + 1) ** 2
+        self.assertLess(duplicated, (size + 1) * len(parts))
+
+    def test_simplify_progressive(self):
+        # Arrange
+        size = 8
+        positions = []
+        for row in range(size + 1):
+            for col in range(size + 1):
+                positions.extend((col, row, 0))
+        indices = []
+        for row in range(size):
+            for col in range(size):
+                vidx = row * (size + 1) + col
+                indices.extend((vidx, vidx + 1, vidx + size + 1))
+                indices.extend((vidx + 1, vidx + size + 2, vidx + size + 1))
+        triangles_count = len(indices) // 3
+
+        # Act
+        order, levels = xray_geometry.simplify_progressive(
+            indices, positions, [triangles_count, triangles_count // 2, triangles_count // 4]
+        )
+
+        # Assert
+        self.assertEqual(sorted(order), list(range((size + 1) ** 2)))
+        self.assertEqual(len(levels), 3)
+        self.assertEqual(len(levels[0][0]), len(indices))
+        self.assertEqual(levels[0][1], (size + 1) ** 2)
+        for (level_indices, vertices_count), target in zip(levels, (128, 64, 32)):
+            self.assertLessEqual(len(level_indices) // 3, target)
+            self.assertLess(max(level_indices), vertices_count)
+            for tri in range(0, len(level_indices), 3):
+                vert_a, vert_b, vert_c = (
+                    positions[order[vidx] * 3:order[vidx] * 3 + 2]
+                    for vidx in level_indices[tri:tri + 3]
+                )
+                cross = (vert_b[0] - vert_a[0]) * (vert_c[1] - vert_a[1]) \
+                    - (vert_b[1] - vert_a[1]) * (vert_c[0] - vert_a[0])
+                self.assertGreater(cross, 0, msg='the triangle is degenerate or flipped')
+        for (level_indices, _), (next_indices, _) in zip(levels, levels[1:]):
+            self.assertLessEqual(len(next_indices), len(level_indices))
+        corners = {order[vidx] for vidx in levels[-1][0]}
+        self.assertTrue({0, size, size * (size + 1), (size + 1) ** 2 - 1} <= corners)
+
+    def test_bounding_sphere(self):
+        # Arrange
+        coords = []
+        for x in (-1, 1):
+            for y in (-1, 1):
+                for z in (-1, 1):
+                    coords.extend((x + 2, y, z))
+        coords.extend((2.5, 0.5, -0.5))  # an inner point
+        coords.extend((2, 0, 1))  # a point on the sphere of the cube
+
+        # Act
+        center, radius = xray_geometry.calculate_bounding_sphere(coords)
+
+        # Assert
+        for value, expected in zip(center, (2, 0, 0)):
+            self.assertAlmostEqual(value, expected)
+        self.assertAlmostEqual(radius, 3 ** 0.5)
+
+    def test_bounding_sphere_contains(self):
+        # Arrange
+        coords = []
+        for i in range(200):
+            coords.extend(((i * 37 % 101) / 10, (i * 53 % 97) / 20, (i * 71 % 89) / 30))
+        coords.extend((5, 5, 0, 5, 5, 0))  # a duplicate
+
+        # Act
+        center, radius = xray_geometry.calculate_bounding_sphere(coords)
+
+        # Assert
+        touching = 0
+        for i in range(0, len(coords), 3):
+            distance = sum((coords[i + axis] - center[axis]) ** 2 for axis in range(3)) ** 0.5
+            self.assertLessEqual(distance, radius * (1 + 1e-5))
+            if distance > radius * (1 - 1e-5):
+                touching += 1
+        self.assertGreaterEqual(touching, 2)
+
+    def test_bounding_sphere_order(self):
+        # Arrange
+        points = [((i * 37 % 101) / 10, (i * 53 % 97) / 20, (i * 71 % 89) / 30) for i in range(500)]
+        coords = [value for point in points for value in point]
+        reversed_coords = [value for point in reversed(points) for value in point]
+
+        # Act
+        sphere = xray_geometry.calculate_bounding_sphere(coords)
+        reversed_sphere = xray_geometry.calculate_bounding_sphere(reversed_coords)
+
+        # Assert
+        self.assertEqual(sphere, reversed_sphere)
+
+    def test_limit_weights(self):
+        # Arrange
+        counts = [1, 3, 0, 2]
+        groups = [5, 1, 2, 3, 4, 6]
+        weights = [0.5, 0.2, 0.6, 0.2, 0, 0]
+
+        # Act
+        counts, groups, weights, clamped = xray_geometry.limit_weights(
+            counts, groups, weights, 2
+        )
+
+        # Assert
+        self.assertEqual(counts, [1, 2, 0, 2])
+        self.assertEqual(groups, [5, 5, 2, 1, 0, 0, 4, 6])
+        for actual, expected in zip(weights, [1, 0, 0.75, 0.25, 0, 0, 1, 0]):
+            self.assertAlmostEqual(actual, expected)
+        self.assertEqual(clamped, 1)
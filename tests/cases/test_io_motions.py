@@ -2,6 +2,12 @@ from tests import utils
 
 import bpy
 
+from io_scene_xray import xray_motions, plugin_prefs
+from io_scene_xray.xray_io import PackedWriter, PackedReader, ChunkedReader, ChunkedWriter
+from io_scene_xray.xray_envelope import Shape, export_key_arrays
+from io_scene_xray.utils import using_mode
+from io_scene_xray.ogf.fmt import Chunks, MotionFlags
+
 
 class TestIOMotions(utils.XRayTestCase):
     def test_io_taked(self):
@@ -21,7 +27,7 @@ class TestIOMotions(utils.XRayTestCase):
             files=[{'name': 'test.object'}],
         )
         imp_act = bpy.data.actions[1]
-        self.assertEqual(len(imp_act.fcurves[0].keyframe_points), 5)  # for now
+        self.assertEqual(len(imp_act.fcurves[0].keyframe_points), 4)  # the middle key is collinear
         self.assertEqual(imp_act.frame_range[1], 4)
 
     def test_io_baked(self):
@@ -42,24 +48,132 @@ class TestIOMotions(utils.XRayTestCase):
             files=[{'name': 'test.object'}],
         )
         imp_act = bpy.data.actions[1]
-        self.assertEqual(len(imp_act.fcurves[0].keyframe_points), 5)
+        self.assertEqual(len(imp_act.fcurves[0].keyframe_points), 4)
         self.assertEqual(imp_act.frame_range[1], 4)
 
+    def test_export_motions_order(self):
+        # Arrange
+        obj = _prepare_animation()
+        act = bpy.data.actions[0]
+        acts = [act, act.copy(), act.copy()]
+        acts[1].fcurves[0].keyframe_points[1].co.y = 5
+        expected = PackedWriter().putf('I', len(acts))
+        for act in acts:
+            xray_motions.export_motion(expected, act, obj)
+
+        # Act
+        writer = PackedWriter()
+        xray_motions.export_motions(writer, acts, obj)
+
+        # Assert
+        self.assertEqual(writer.data, expected.data)
+
+    def test_export_motions_processes(self):
+        # Arrange
+        obj = _prepare_animation()
+        act = bpy.data.actions[0]
+        acts = [act, act.copy(), act.copy(), act.copy()]
+        acts[1].fcurves[0].keyframe_points[1].co.y = 5
+        acts[2].xray.autobake = 'on'
+        expected = PackedWriter()
+        xray_motions.export_motions(expected, acts, obj)
+        prefs = plugin_prefs.get_preferences()
+
+        # Act
+        prefs.use_worker_processes = True
+        try:
+            writer = PackedWriter()
+            xray_motions.export_motions(writer, acts, obj)
+        finally:
+            prefs.use_worker_processes = False
+
+        # Assert
+        self.assertEqual(writer.data, expected.data)
+
+    def test_export_omf(self):
+        # Arrange
+        _prepare_animation()
+
+        # Act
+        bpy.ops.xray_export.omf(
+            filepath=self.outpath('test.omf'),
+            fmt_version='cscop',
+        )
+
+        # Assert
+        with open(self.outpath('test.omf'), 'rb') as file:
+            chunks = dict(ChunkedReader(file.read()))
+        motions = ChunkedReader(chunks[Chunks.S_MOTIONS])
+        self.assertEqual(motions.nextf(0, 'I'), (1, ))
+        reader = PackedReader(motions.next(1))
+        self.assertEqual(reader.gets(), bpy.data.actions[0].name)
+        frames = reader.getf('I')[0]
+        self.assertEqual(frames, 5)
+
+        flags = reader.getf('B')[0]
+        self.assertEqual(
+            flags, MotionFlags.R_KEY_ABSENT | MotionFlags.T_KEY_PRESENT | MotionFlags.T_KEY_16BIT
+        )
+        reader.skip(2 * 4 + 4)  # the rotation, the crc
+        keys = reader.getf('<%ih' % (frames * 3))
+        size, init = reader.getf('<3f'), reader.getf('<3f')
+        first, last = (
+            [key * scale + base for key, scale, base in zip(keys[frm * 3:frm * 3 + 3], size, init)]
+            for frm in (0, frames - 1)
+        )
+        self.assertAlmostEqual(sum((a - b) ** 2 for a, b in zip(first, last)), 1 + 4 + 9, places=3)
+
+        self.assertEqual(reader.getf('B')[0], MotionFlags.R_KEY_ABSENT)  # the static bone
+        reader.skip(2 * 4 + 4 * 3)
+        self.assertEqual(reader.getv().tobytes(), b'')
+
+        params = PackedReader(chunks[Chunks.S_SMPARAMS])
+        self.assertEqual(params.getf('HH'), (4, 1))
+        self.assertEqual(params.gets(), 'default')
+        self.assertEqual(params.getf('H'), (2, ))
+
+    def test_import_mixed_shapes(self):
+        # Arrange
+        utils.create_armature('tarm', ('bone', ), 'tobj')
+
+        fps = 30
+        writer = PackedWriter().puts('test').putf('II', 0, 8).putf('fH', fps, 6)
+        writer.putf('<BH', 0, 0).putf('<ffff', 1, 0, 2, 1)
+        writer.putf('H', 1).puts('bone').putf('B', 0)
+        curves = (
+            ([0, 4, 8], [0, 4, 8], [Shape.STEPPED, Shape.STEPPED, Shape.LINEAR]),
+            ([0, 2, 4, 6, 8], [0] * 5, [Shape.LINEAR] * 5),  # adds the in-between frames
+        ) + (([0], [0], [Shape.STEPPED]), ) * 4
+        for frames, values, shapes in curves:
+            writer.putf('BB', 1, 1).putf('H', len(frames))
+            export_key_arrays(writer, [frm / fps for frm in frames], values, shapes)
+        with open(self.outpath('test.skl'), 'wb') as file:
+            file.write(ChunkedWriter().put(0x1200, writer).data)
+
+        # Act
+        bpy.ops.xray_import.skl(
+            directory=self.outpath(),
+            files=[{'name': 'test.skl'}],
+        )
+
+        # Assert
+        self.assertReportsNotContains('WARNING')
+        fcurve = [
+            fcurve for fcurve in bpy.data.actions['test'].fcurves
+            if fcurve.data_path.endswith('.location') and (fcurve.array_index == 0)
+        ][0]
+        for frame, expected in zip((0, 2, 4, 6, 8), (0, 0, 4, 6, 8)):
+            self.assertAlmostEqual(fcurve.evaluate(frame), expected, places=4)
+
 
 def _prepare_animation():
-    arm = bpy.data.armatures.new('test')
-    obj = bpy.data.objects.new('test', arm)
-    bpy.context.scene.objects.link(obj)
-    bpy.context.scene.objects.active = obj
-    bpy.ops.object.mode_set(mode='EDIT')
-    try:
-        bone = arm.edit_bones.new('bone')
+    obj = utils.create_armature('test')
+    with using_mode(mode='EDIT'):
+        bone = obj.data.edit_bones.new('bone')
         bone.head.z = 0.5
-        cbone = arm.edit_bones.new('cbone')
+        cbone = obj.data.edit_bones.new('cbone')
         cbone.parent = bone
         cbone.head.z = 0.5
-    finally:
-        bpy.ops.object.mode_set(mode='OBJECT')
 
     pbone = obj.pose.bones['bone']
     pbone.keyframe_insert('location', frame=1, group='bone')
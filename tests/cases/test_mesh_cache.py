@@ -0,0 +1,36 @@
+from tests import utils
+
+import bpy
+import mathutils
+
+from io_scene_xray.utils import MeshCache
+
+
+class TestMeshCache(utils.XRayTestCase):
+    def test_shared(self):
+        # Arrange
+        bmesh = utils.create_bmesh((
+            (-1, -1, 0), (+1, -1, 0), (+1, +1, 0), (-1, +1, 0),
+        ), ((0, 1, 2, 3),))
+        obj = utils.create_object(bmesh)
+        obj.location = (1, 2, 3)
+        bpy.context.scene.update()
+        meshes_count = len(bpy.data.meshes)
+        cache = MeshCache()
+        space = mathutils.Matrix.Identity(4)
+
+        # Act
+        world = cache.bmesh(obj, space)
+        local = cache.bmesh(obj, space, local=True)
+        triangulated = cache.bmesh(obj, space, triangulate=True)
+        data = cache.mesh(obj, space)
+
+        # Assert
+        self.assertIs(cache.bmesh(obj, space), world)
+        self.assertIs(cache.mesh(obj, space), data)
+        self.assertEqual(len(world.faces), 1)
+        self.assertEqual(len(triangulated.faces), 2)
+        self.assertEqual(len(data.polygons), 2)
+        self.assertAlmostEqual(world.verts[0].co.z - local.verts[0].co.z, 3)
+        cache.release()
+        self.assertEqual(len(bpy.data.meshes), meshes_count)
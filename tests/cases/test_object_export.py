@@ -76,16 +76,8 @@ class TestObjectExport(utils.XRayTestCase):
         # Arrange
         objs = self._create_objects()
 
-        arm = bpy.data.armatures.new('tarm')
-        obj = bpy.data.objects.new('tobj', arm)
-        bpy.context.scene.objects.link(obj)
-        bpy.context.scene.objects.active = obj
-        bpy.ops.object.mode_set(mode='EDIT')
-        try:
-            bone = arm.edit_bones.new('tbone')
-            bone.tail.y = 1
-        finally:
-            bpy.ops.object.mode_set(mode='OBJECT')
+        obj = utils.create_armature('tarm', ('tbone', ), 'tobj')
+        arm = obj.data
         arm.bones['tbone'].xray.shape.type = '2'
         arm.bones['tbone'].xray.shape.sph_rad = 1
 
@@ -114,20 +106,12 @@ class TestObjectExport(utils.XRayTestCase):
 
     def test_empty_bone_groups(self):
         # Arrange
-        arm = bpy.data.armatures.new('tarm')
-        obj = bpy.data.objects.new('tobj', arm)
-        bpy.context.scene.objects.link(obj)
-        bpy.context.scene.objects.active = obj
         b_exp0, b_non0, b_exp1, b_non1 = (
             'b-exportable0', 'b-non-exportable0', 'b-exportable1', 'b-non-exportable1'
         )
-        bpy.ops.object.mode_set(mode='EDIT')
-        try:
-            for n in (b_exp0, b_non0, b_exp1, b_non1):
-                bone = arm.edit_bones.new(n)
-                bone.tail.y = 1
-        finally:
-            bpy.ops.object.mode_set(mode='POSE')
+        obj = utils.create_armature('tarm', (b_exp0, b_non0, b_exp1, b_non1), 'tobj')
+        arm = obj.data
+        bpy.ops.object.mode_set(mode='POSE')
         bg_exp = obj.pose.bone_groups.new(name='bg-only-exportable')
         bg_mix = obj.pose.bone_groups.new(name='bg-mixed')
         bg_non = obj.pose.bone_groups.new(name='bg-only-non-exportable')
@@ -161,6 +145,107 @@ class TestObjectExport(utils.XRayTestCase):
         self.assertNotRegex(content, re.compile(bytes(bg_non.name, 'cp1251')))
         self.assertNotRegex(content, re.compile(bytes(bg_emp.name, 'cp1251')))
 
+    def test_limit_bone_influences(self):
+        # Arrange
+        objs = self._create_objects()
+        obj = utils.create_armature('tarm', ('tbone1', 'tbone2', 'tbone3'))
+        objs[0].modifiers.new(name='Armature', type='ARMATURE').object = obj
+        objs[0].parent = obj
+        for name, weight in (('tbone1', 0.5), ('tbone2', 0.3), ('tbone3', 0.2)):
+            objs[0].vertex_groups.new(name).add(range(5), weight, 'REPLACE')
+
+        # Act
+        bpy.ops.export_object.xray_objects(
+            objects='tarm', directory=self.outpath(),
+            fmt_version='soc',
+            texture_name_from_image_path=False,
+            export_motions=False,
+            max_bone_influences=2,
+        )
+
+        # Assert
+        self.assertOutputFiles({
+            'tarm.object',
+        })
+        self.assertReportsContains(
+            'WARNING',
+            re.compile('Too many bone influences, the weakest ones are dropped')
+        )
+
+    def test_bone_influences_not_limited_by_default(self):
+        # Arrange
+        objs = self._create_objects()
+        obj = utils.create_armature('tarm', ('tbone1', 'tbone2', 'tbone3'))
+        objs[0].modifiers.new(name='Armature', type='ARMATURE').object = obj
+        objs[0].parent = obj
+        for name, weight in (('tbone1', 0.5), ('tbone2', 0.3), ('tbone3', 0.2)):
+            objs[0].vertex_groups.new(name).add(range(5), weight, 'REPLACE')
+
+        # Act
+        bpy.ops.export_object.xray_objects(
+            objects='tarm', directory=self.outpath(),
+            fmt_version='soc',
+            texture_name_from_image_path=False,
+            export_motions=False,
+        )
+
+        # Assert
+        self.assertOutputFiles({
+            'tarm.object',
+        })
+        self.assertReportsNotContains(
+            'WARNING',
+            re.compile('Too many bone influences')
+        )
+
+    def test_limit_bone_influences_ignores_other_groups(self):
+        # Arrange
+        objs = self._create_objects()
+        obj = utils.create_armature('tarm', ('tbone1', 'tbone2'))
+        objs[0].modifiers.new(name='Armature', type='ARMATURE').object = obj
+        objs[0].parent = obj
+        for name, weight in (('tbone1', 0.5), ('tbone2', 0.3), ('tmask', 0.2)):
+            objs[0].vertex_groups.new(name).add(range(5), weight, 'REPLACE')
+
+        # Act
+        bpy.ops.export_object.xray_objects(
+            objects='tarm', directory=self.outpath(),
+            fmt_version='soc',
+            texture_name_from_image_path=False,
+            export_motions=False,
+            max_bone_influences=2,
+        )
+
+        # Assert
+        self.assertOutputFiles({
+            'tarm.object',
+        })
+        self.assertReportsNotContains(
+            'WARNING',
+            re.compile('Too many bone influences')
+        )
+        self.assertRegex(self.getFileSafeContent('tarm.object'), re.compile(b'tmask'))
+
+    def test_export_optimize_vertex_cache(self):
+        # Arrange
+        self._create_objects()
+
+        # Act
+        bpy.ops.xray_export.object(
+            object='tobj1', filepath=self.outpath('test.object'),
+            texture_name_from_image_path=False,
+            optimize_vertex_cache=True,
+        )
+
+        # Assert
+        self.assertOutputFiles({
+            'test.object'
+        })
+        self.assertReportsContains(
+            'INFO',
+            re.compile('Vertex cache is optimized: .*acmr=\\d+\\.\\d+ -> \\d+\\.\\d+')
+        )
+
     def test_export_no_uvmap(self):
         # Arrange
         self._create_objects(create_uv=False)
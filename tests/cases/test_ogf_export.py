@@ -0,0 +1,240 @@
+from tests import utils
+
+import bpy
+import re
+
+from io_scene_xray.xray_io import ChunkedReader, PackedReader
+from io_scene_xray.ogf.fmt import Chunks, ModelType, VertexFormat
+
+
+class TestOgfExport(utils.XRayTestCase):
+    def test_export_one_influence(self):
+        # Arrange
+        _create_skinned_root(('tbone1', ))
+
+        # Act
+        bpy.ops.xray_export.ogf(
+            filepath=self.outpath('test.ogf'), selection_only=True,
+            texture_name_from_image_path=False,
+        )
+
+        # Assert
+        self.assertOutputFiles({
+            'test.ogf',
+        })
+        child = self._read_child('test.ogf')
+        self.assertEqual(self._vertex_format(child), VertexFormat.FVF_1L)
+
+    def test_export_two_influences(self):
+        # Arrange
+        _create_skinned_root(('tbone1', 'tbone2'))
+
+        # Act
+        bpy.ops.xray_export.ogf(
+            filepath=self.outpath('test.ogf'), selection_only=True,
+            texture_name_from_image_path=False,
+        )
+
+        # Assert
+        self.assertOutputFiles({
+            'test.ogf',
+        })
+        child = self._read_child('test.ogf')
+        self.assertEqual(self._vertex_format(child), VertexFormat.FVF_2L)
+
+    def test_export_many_influences(self):
+        # Arrange
+        _create_skinned_root(('tbone1', 'tbone2', 'tbone3'))
+
+        # Act
+        bpy.ops.xray_export.ogf(
+            filepath=self.outpath('test.ogf'), selection_only=True,
+            texture_name_from_image_path=False, max_bone_influences=4,
+        )
+
+        # Assert
+        self.assertOutputFiles({
+            'test.ogf',
+        })
+        child = self._read_child('test.ogf')
+        self.assertEqual(self._vertex_format(child), VertexFormat.FVF_3L_CS)
+        self.assertReportsNotContains('WARNING', re.compile('Too many bone influences'))
+
+    def test_export_many_influences_default(self):
+        # Arrange
+        _create_skinned_root(('tbone1', 'tbone2', 'tbone3'))
+
+        # Act
+        bpy.ops.xray_export.ogf(
+            filepath=self.outpath('test.ogf'), selection_only=True,
+            texture_name_from_image_path=False,
+        )
+
+        # Assert
+        self.assertOutputFiles({
+            'test.ogf',
+        })
+        child = self._read_child('test.ogf')
+        self.assertEqual(self._vertex_format(child), VertexFormat.FVF_2L)
+        self.assertReportsContains(
+            'WARNING',
+            re.compile('Too many bone influences, the weakest ones are dropped')
+        )
+
+    def test_export_progressive_lods(self):
+        # Arrange
+        _create_skinned_root(('tbone1', 'tbone2'))
+
+        # Act
+        bpy.ops.xray_export.ogf(
+            filepath=self.outpath('test.ogf'), selection_only=True,
+            texture_name_from_image_path=False, progressive_lods=3,
+        )
+
+        # Assert
+        self.assertOutputFiles({
+            'test.ogf',
+        })
+        child = self._read_child('test.ogf', ModelType.SKELETON_GEOMDEF_PM, Chunks.SWIDATA)
+        reader = PackedReader(child[Chunks.SWIDATA])
+        reader.skip(4 * 4)  # reserved
+        swis = [reader.getf('IHH') for _ in range(reader.getf('I')[0])]
+        self.assertGreater(len(swis), 1)
+        self.assertLessEqual(len(swis), 3)
+        reader = PackedReader(child[Chunks.INDICES])
+        indices_count = reader.getf('I')[0]
+        indices = reader.getf('%dH' % indices_count)
+        self.assertEqual(swis[0][0], 0)
+        self.assertEqual(swis[-1][0] + swis[-1][1] * 3, indices_count)
+        for (offset, tris, _), (next_offset, next_tris, _) in zip(swis, swis[1:]):
+            self.assertEqual(next_offset, offset + tris * 3)
+            self.assertLess(next_tris, tris)
+        for offset, tris, verts in swis:
+            for tri in range(offset, offset + tris * 3, 3):
+                self.assertEqual(len(set(indices[tri:tri + 3])), 3, msg='degenerate triangle')
+                self.assertLess(max(indices[tri:tri + 3]), verts)
+
+    def test_export_optimize_vertex_cache(self):
+        # Arrange
+        _create_skinned_root(('tbone1', 'tbone2'))
+
+        # Act
+        bpy.ops.xray_export.ogf(
+            filepath=self.outpath('test.ogf'), selection_only=True,
+            texture_name_from_image_path=False, optimize_vertex_cache=True,
+        )
+
+        # Assert
+        self.assertOutputFiles({
+            'test.ogf',
+        })
+        child = self._read_child('test.ogf')
+        self.assertEqual(self._vertex_format(child), VertexFormat.FVF_2L)
+        self.assertReportsContains(
+            'INFO',
+            re.compile('Vertex cache is optimized: .*acmr=\\d+\\.\\d+ -> \\d+\\.\\d+')
+        )
+
+    def test_export_optimize_vertex_cache_progressive(self):
+        # Arrange
+        _create_skinned_root(('tbone1', 'tbone2'))
+
+        # Act
+        bpy.ops.xray_export.ogf(
+            filepath=self.outpath('test.ogf'), selection_only=True,
+            texture_name_from_image_path=False, optimize_vertex_cache=True, progressive_lods=3,
+        )
+
+        # Assert
+        self.assertOutputFiles({
+            'test.ogf',
+        })
+        self._read_child('test.ogf', ModelType.SKELETON_GEOMDEF_PM, Chunks.SWIDATA)
+        self.assertReportsContains(
+            'INFO',
+            re.compile('Vertex cache is optimized: .*acmr=\\d+\\.\\d+ -> \\d+\\.\\d+.*lods=')
+        )
+
+    def test_export_batch(self):
+        # Arrange
+        _create_skinned_root(('tbone1', 'tbone2'), name='tarm1')
+        _create_skinned_root(('tbone1', ), name='tarm2')
+
+        # Act
+        bpy.ops.xray_export.ogfs(
+            objects='tarm1,tarm2', directory=self.outpath(),
+            texture_name_from_image_path=False,
+        )
+
+        # Assert
+        self.assertOutputFiles({
+            'tarm1.ogf',
+            'tarm2.ogf',
+        })
+        self.assertEqual(self._vertex_format(self._read_child('tarm1.ogf')), VertexFormat.FVF_2L)
+        self.assertEqual(self._vertex_format(self._read_child('tarm2.ogf')), VertexFormat.FVF_1L)
+        for name in ('tarm1', 'tarm2'):
+            self.assertReportsContains('INFO', re.compile(
+                name + ': extract \\d+\\.\\d+s, encode \\d+\\.\\d+s, write \\d+\\.\\d+s, \\d+ bytes'
+            ))
+
+    def _read_child(self, file_name, model_type=ModelType.SKELETON_GEOMDEF_ST, *extra):
+        with open(self.outpath(file_name), 'rb') as file:
+            chunks = list(ChunkedReader(file.read()))
+        expected = [Chunks.HEADER, Chunks.S_DESC, Chunks.CHILDREN, Chunks.S_BONE_NAMES,
+                    Chunks.S_IKDATA, Chunks.S_USERDATA]
+        self.assertEqual([cid for cid, _ in chunks], expected)
+        chunks = dict(chunks)
+        header = PackedReader(chunks[Chunks.HEADER])
+        self.assertEqual(header.getf('BB'), (4, ModelType.SKELETON_RIGID))
+        self.assertGreater(PackedReader(chunks[Chunks.S_BONE_NAMES]).getf('I')[0], 0)
+
+        children = list(ChunkedReader(chunks[Chunks.CHILDREN]))
+        self.assertEqual([cid for cid, _ in children], [0])
+        child = list(ChunkedReader(children[0][1]))
+        expected = [Chunks.HEADER, Chunks.TEXTURE, Chunks.VERTICES, Chunks.INDICES] + list(extra)
+        self.assertEqual([cid for cid, _ in child], expected)
+        child = dict(child)
+        self.assertEqual(PackedReader(child[Chunks.HEADER]).getf('BB'), (4, model_type))
+        return child
+
+    def _vertex_format(self, child):
+        data = child[Chunks.VERTICES]
+        vertex_format, count = PackedReader(data).getf('II')
+        self.assertGreater(count, 0)
+        if vertex_format not in _VERTEX_SIZES:
+            self.fail('unexpected vertex format: 0x%x' % vertex_format)
+        self.assertEqual(len(data), 8 + count * _VERTEX_SIZES[vertex_format])
+        return vertex_format
+
+
+_VERTEX_SIZES = {
+    VertexFormat.FVF_1L: 4 * 3 * 4 + 4 * 2 + 4,
+    VertexFormat.FVF_2L: 2 * 2 + 4 * 3 * 4 + 4 + 4 * 2,
+    VertexFormat.FVF_3L_CS: 2 * 3 + 4 * 3 * 4 + 4 * 2 + 4 * 2,
+    VertexFormat.FVF_4L_CS: 2 * 4 + 4 * 3 * 4 + 4 * 3 + 4 * 2,
+}
+
+
+def _create_skinned_root(bones, name='tarm', size=4):
+    obj = utils.create_armature(name, bones)
+
+    vertices = [(x, y, 0) for y in range(size + 1) for x in range(size + 1)]
+    faces = []
+    for y in range(size):
+        for x in range(size):
+            vidx = y * (size + 1) + x
+            faces.append((vidx, vidx + 1, vidx + size + 2, vidx + size + 1))
+    mesh = utils.create_object(utils.create_bmesh(vertices, faces))
+    mesh.name = name + '_mesh'
+    bpy_texture = bpy.data.textures.new('test_texture', 'IMAGE')
+    mesh.data.materials[0].texture_slots.add().texture = bpy_texture
+    mesh.modifiers.new(name='Armature', type='ARMATURE').object = obj
+    mesh.parent = obj
+    for index, bone_name in enumerate(bones):
+        mesh.vertex_groups.new(bone_name).add(range(len(vertices)), 1 / (index + 1), 'REPLACE')
+
+    for bpy_obj in bpy.context.scene.objects:
+        bpy_obj.select = False
+    obj.select = True
+    return obj
@@ -0,0 +1,59 @@
+from tests import utils
+
+import os
+import shutil
+
+from io_scene_xray.skl.index import load_index
+
+
+class TestSklsIndex(utils.XRayTestCase):
+    def test_index(self):
+        # Arrange
+        fpath = self.outpath('test.skls')
+        shutil.copyfile(self.relpath('test_fmt.skls'), fpath)
+        cache_dir = self.outpath('cache')
+
+        # Act
+        motions = load_index(fpath, next_to_file=False, cache_dir=cache_dir)
+
+        # Assert
+        self.assertFalse(os.path.exists(fpath + '.index'))
+        self.assertEqual(len(os.listdir(cache_dir)), 1)
+        self.assertEqual([m.name for m in motions], ['xact'])
+        self.assertEqual(motions[0].offset, 4)
+        self.assertEqual((motions[0].frame_start, motions[0].frame_end), (0, 10))
+        self.assertEqual(motions[0].bones_count, 1)
+        cached = load_index(fpath, next_to_file=False, cache_dir=cache_dir)
+        self.assertEqual([(m.name, m.offset) for m in cached], [('xact', 4)])
+
+    def test_index_next_to_file(self):
+        # Arrange
+        fpath = self.outpath('test.skls')
+        shutil.copyfile(self.relpath('test_fmt.skls'), fpath)
+        cache_dir = self.outpath('cache')
+
+        # Act
+        motions = load_index(fpath, next_to_file=True, cache_dir=cache_dir)
+
+        # Assert
+        self.assertFileExists(fpath + '.index')
+        self.assertFalse(os.path.exists(cache_dir))
+        self.assertEqual([m.name for m in motions], ['xact'])
+
+    def test_index_outdated(self):
+        # Arrange
+        fpath = self.outpath('test.skls')
+        shutil.copyfile(self.relpath('test_fmt.skls'), fpath)
+        load_index(fpath, next_to_file=True, cache_dir=self.outpath('cache'))
+        with open(fpath + '.index', 'r+b') as file:
+            file.seek(-8, os.SEEK_END)
+            file.write(b'\xff' * 8)  # corrupt the cached data
+        stat = os.stat(fpath)
+        os.utime(fpath, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+
+        # Act
+        motions = load_index(fpath, next_to_file=True, cache_dir=self.outpath('cache'))
+
+        # Assert
+        self.assertEqual([m.name for m in motions], ['xact'])
+        self.assertEqual(motions[0].bones_count, 1)
@@ -9,6 +9,7 @@ import tempfile
 import bmesh
 import bpy
 from io_scene_xray.plugin import TestReadyOperator
+from io_scene_xray.utils import using_mode
 
 
 class XRayTestCase(unittest.TestCase):
@@ -141,3 +142,19 @@ def create_object(bm, create_material=True):
     obj = bpy.data.objects.new('test', mesh)
     bpy.context.scene.objects.link(obj)
     return obj
+
+
+def create_armature(name, bones=(), obj_name=None):
+    """
+    Creates the active armature object with the unit `bones` along the Y axis,
+    the other bones can be added in the `using_mode('EDIT')` block.
+    """
+    arm = bpy.data.armatures.new(name)
+    obj = bpy.data.objects.new(obj_name or name, arm)
+    bpy.context.scene.objects.link(obj)
+    bpy.context.scene.objects.active = obj
+    if bones:
+        with using_mode(mode='EDIT'):
+            for bone_name in bones:
+                arm.edit_bones.new(bone_name).tail.y = 1
+    return obj
@@ -0,0 +1,128 @@
+import io
+import math
+import os.path
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from io_scene_xray.xray_io import PackedReader
+from io_scene_xray.utils import mkstruct
+from io_scene_xray.xray_envelope import Shape, reduce_keys
+from io_scene_xray.xray_math import interpolate_keys
+
+
+KF = mkstruct('KeyFrame', ['time', 'value', 'shape'])
+
+
+def refine_keys(keyframes, epsilon):
+    """The previous keys reducer, kept here as the baseline for the comparison"""
+    def significant(prev_kf, curr_kf, next_kf, skipped):
+        def is_oor(keyframe, derivative):
+            expected_value = (keyframe.time - prev_kf.time) * derivative + prev_kf.value
+            return abs(expected_value - keyframe.value) >= epsilon
+
+        if prev_kf is None:
+            return curr_kf is not None
+        if (curr_kf.shape == Shape.LINEAR) and (next_kf.shape == Shape.LINEAR):
+            derivative = (next_kf.value - prev_kf.value) / (next_kf.time - prev_kf.time)
+            if is_oor(curr_kf, derivative):
+                return True
+            for keyframe in skipped:
+                if is_oor(keyframe, derivative):
+                    return True
+            return False
+        if (abs(prev_kf.value - curr_kf.value) + abs(curr_kf.value - next_kf.value)) < epsilon:
+            return False
+        return True
+
+    prev_kf, curr_kf = None, None
+    skipped = []
+    for next_kf in keyframes:
+        if significant(prev_kf, curr_kf, next_kf, skipped):
+            skipped = []
+            prev_kf = curr_kf
+            yield curr_kf
+        elif curr_kf is not None:
+            skipped.append(curr_kf)
+        curr_kf = next_kf
+
+    if curr_kf and ((not prev_kf) or (abs(curr_kf.value - prev_kf.value) >= epsilon)):
+        yield curr_kf
+
+
+def read_skls_curves(pr):
+    for _ in range(pr.getf('I')[0]):
+        pr.gets()
+        pr.getf('II')
+        fps, ver = pr.getf('fH')
+        pr.getf('<BH')
+        pr.getf('<ffff')
+        for _ in range(pr.getf('H')[0]):
+            pr.gets()
+            pr.getf('B')
+            for _ in range(6):
+                pr.getf('BB')
+                times, values, stepped = [], [], []
+                for _ in range(pr.getf('H')[0]):
+                    value, tme, shape = pr.getf('ffB')
+                    times.append(tme * fps)
+                    values.append(value)
+                    stepped.append(shape == Shape.STEPPED.value)
+                    if shape != Shape.STEPPED.value:
+                        pr.skip(14)
+                if times:
+                    frames = [float(frm) for frm in range(int(times[0]), int(times[-1]) + 1)]
+                    keys = interpolate_keys(times, values, stepped, frames)
+                    yield [frm / fps for frm in frames], keys
+        if ver >= 7:
+            for _ in range(pr.getf('I')[0]):
+                pr.gets_a()
+                pr.skip((4 + 4) * pr.getf('I')[0])
+
+
+def synthetic_curves():
+    for idx in range(100):
+        frames = range(300)
+        yield [frm / 30 for frm in frames], [
+            math.sin(frm * 0.01 * (1 + idx % 7)) + 0.1 * math.sin(frm * 0.3) * (idx % 2)
+            for frm in frames
+        ]
+
+
+def bench(curves, epsilon):
+    total = old_keys = new_keys = 0
+    old_time = new_time = 0
+    for times, values in curves:
+        total += len(times)
+        start = time.perf_counter()
+        old_keys += len(list(refine_keys(
+            (KF(tme, val, Shape.LINEAR) for tme, val in zip(times, values)), epsilon
+        )))
+        old_time += time.perf_counter() - start
+        start = time.perf_counter()
+        new_keys += len(reduce_keys(times, values, None, epsilon)[0])
+        new_time += time.perf_counter() - start
+    print('samples:     ', total)
+    print('refine_keys: ', old_keys, 'keys, %.3fs' % old_time)
+    print('reduce_keys: ', new_keys, 'keys, %.3fs' % new_time)
+
+
+def main():
+    from optparse import OptionParser
+    parser = OptionParser(
+        usage='Usage: blender -b --python bench-keys.py -- [.skls-file] [options]'
+    )
+    parser.add_option('-e', '--epsilon', type='float', default=0.001, help='keys refine threshold')
+    argv = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else sys.argv[1:]
+    (options, args) = parser.parse_args(argv)
+    if args:
+        with io.open(args[0], mode='rb') as f:
+            curves = list(read_skls_curves(PackedReader(f.read())))
+    else:
+        curves = list(synthetic_curves())
+    bench(curves, options.epsilon)
+
+
+if __name__ == "__main__":
+    main()